@@ -1,43 +1,48 @@
 import { spawn } from 'child_process';
-import { supabase } from '@/lib/supabase';
+import { getUserSettings } from '@/lib/userSettingsCache';
+import { traceIdFor } from '@/lib/traceId';
+import { PYTHON_BIN } from '@/lib/python';
+import { sessionUser } from '@/lib/sessionUser';
+import { schedulerArgs, rejectedResponse, SCHEDULER_REJECTED_EXIT_CODE } from '@/lib/agentScheduler';
 
 export async function POST(req) {
-  const { request, userId } = await req.json();
+  // 사용자별 제한과 설정은 요청 본문이 아니라 로그인 세션의 사용자 기준입니다.
+  const user = await sessionUser();
+  if (!user) {
+    return new Response(JSON.stringify({ error: 'Authentication required' }), { status: 401 });
+  }
+  const userId = user.id;
+
+  const { request } = await req.json();
   if (!request || typeof request !== 'string') {
     return new Response(JSON.stringify({ error: 'Invalid analysis request' }), { status: 400 });
   }
 
-  // 사용자 설정 가져오기
-  let userSettings = {};
-  if (userId) {
-    try {
-      const { data, error } = await supabase
-        .from('user_settings')
-        .select('*')
-        .eq('user_id', userId)
-        .single();
+  const traceId = traceIdFor(req);
+  const traceHeaders = { 'x-trace-id': traceId };
 
-      if (data && !error) {
-        userSettings = data;
-      }
-    } catch (error) {
-      console.error('Failed to fetch user settings:', error);
-    }
-  }
+  // 사용자 설정 가져오기 (TTL 캐시, 설정 저장 시 무효화)
+  const userSettings = await getUserSettings(userId);
 
   // 환경 변수와 사용자 설정을 병합
   const env = {
     ...process.env,
+    TRACE_ID: traceId,
+    AGENT_USER_ID: userId,
     ...(userSettings.openai_api_key && { OPENAI_API_KEY: userSettings.openai_api_key }),
     ...(userSettings.gemini_api_key && { GEMINI_API_KEY: userSettings.gemini_api_key }),
     ...(userSettings.serper_api_key && { SERPER_API_KEY: userSettings.serper_api_key })
   };
 
-  const pythonProcess = spawn('python', [
-    '-W', 'ignore',
-    'python/data_analysis_agent.py',
-    request,
-  ], { env });
+  // 스케줄러가 빈 슬롯을 기다린 뒤 에이전트를 실행합니다 (과부하 시 429).
+  const sharedQuota = !userSettings.openai_api_key && !userSettings.gemini_api_key;
+  const pythonProcess = spawn(PYTHON_BIN, schedulerArgs({
+    userId,
+    agentType: 'data',
+    sharedQuota,
+    script: 'data_analysis_agent.py',
+    args: [request],
+  }), { env });
 
   let stdout = '';
   let stderr = '';
@@ -49,19 +54,23 @@ export async function POST(req) {
     pythonProcess.on('close', resolve);
   });
 
+  if (exitCode === SCHEDULER_REJECTED_EXIT_CODE) {
+    return rejectedResponse(stdout, traceHeaders);
+  }
+
   if (exitCode !== 0) {
     try {
       const errObj = JSON.parse(stdout || '{}');
-      return new Response(JSON.stringify({ error: errObj.error || 'Python error' }), { status: 500 });
+      return new Response(JSON.stringify({ error: errObj.error || 'Python error' }), { status: 500, headers: traceHeaders });
     } catch {
-      return new Response(JSON.stringify({ error: stderr || 'Python script failed' }), { status: 500 });
+      return new Response(JSON.stringify({ error: stderr || 'Python script failed' }), { status: 500, headers: traceHeaders });
     }
   }
 
   try {
     const json = JSON.parse(stdout);
-    return new Response(JSON.stringify(json), { status: 200 });
+    return new Response(JSON.stringify(json), { status: 200, headers: traceHeaders });
   } catch {
-    return new Response(JSON.stringify({ error: 'Invalid JSON from Python' }), { status: 500 });
+    return new Response(JSON.stringify({ error: 'Invalid JSON from Python' }), { status: 500, headers: traceHeaders });
   }
 } 
\ No newline at end of file
@@ -0,0 +1,58 @@
+import { readFile } from 'fs/promises';
+import { spawn } from 'child_process';
+import path from 'path';
+import { PYTHON_BIN, pythonScript } from '@/lib/python';
+
+// 아티팩트 다운로드 (python/artifact_store.py)
+// 매 다운로드마다 touch 로 마지막 접근 시각을 갱신해 GC 가 최근에 쓰인 블롭을 남기도록 합니다.
+const CONTENT_TYPES = {
+  '.zip': 'application/zip',
+  '.csv': 'text/csv',
+  '.json': 'application/json',
+  '.txt': 'text/plain',
+  '.png': 'image/png',
+  '.jpg': 'image/jpeg',
+  '.jpeg': 'image/jpeg',
+};
+
+function touchArtifact(sha256) {
+  return new Promise((resolve) => {
+    const python = spawn(PYTHON_BIN, ['-W', 'ignore', pythonScript('artifact_store.py'), 'touch', sha256]);
+    let stdout = '';
+    python.stdout.on('data', (data) => { stdout += data.toString(); });
+    python.on('close', (code) => {
+      try {
+        resolve(code === 0 ? JSON.parse(stdout) : null);
+      } catch {
+        resolve(null);
+      }
+    });
+  });
+}
+
+export async function GET(request, { params }) {
+  const { path: parts } = await params;
+  const match = parts?.length === 2 && /^([a-f0-9]{64})(\.[a-z0-9]{1,15})?$/.exec(parts[1]);
+  if (!match || parts[0] !== match[1].slice(0, 2)) {
+    return new Response(JSON.stringify({ error: 'Invalid artifact path' }), { status: 400 });
+  }
+
+  const artifact = await touchArtifact(match[1]);
+  if (!artifact) {
+    return new Response(JSON.stringify({ error: 'Artifact not found' }), { status: 404 });
+  }
+
+  const ext = path.extname(artifact.path).toLowerCase();
+  const { searchParams } = new URL(request.url);
+  const downloadName = (searchParams.get('name') || parts[1]).replace(/[^\x20-\x7e]|["\\]/g, '_');
+  const body = await readFile(artifact.path);
+  return new Response(body, {
+    headers: {
+      'Content-Type': CONTENT_TYPES[ext] || 'application/octet-stream',
+      'Content-Length': String(body.length),
+      // 업로드된 HTML/JS 가 같은 출처에서 실행되지 않도록 항상 첨부 파일로 내려줍니다.
+      'Content-Disposition': `attachment; filename="${downloadName}"`,
+      'X-Content-Type-Options': 'nosniff',
+    },
+  });
+}
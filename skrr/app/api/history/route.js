@@ -0,0 +1,93 @@
+import { NextResponse } from 'next/server';
+import { cookies } from 'next/headers';
+import { spawn } from 'child_process';
+import { createRouteHandlerClient } from '@supabase/auth-helpers-nextjs';
+import { PYTHON_BIN, pythonScript } from '@/lib/python';
+
+// 생성 기록의 ZIP 링크(/api/artifacts/<xx>/<sha256>.zip)에서 블롭 해시를 꺼냅니다.
+const ARTIFACT_URL = /\/artifacts\/[a-f0-9]{2}\/([a-f0-9]{64})/;
+
+function releaseArtifact(owner, sha256) {
+  return new Promise((resolve, reject) => {
+    const python = spawn(PYTHON_BIN, [
+      '-W', 'ignore',
+      pythonScript('artifact_store.py'),
+      'release', '--owner', owner, '--sha256', sha256,
+    ]);
+    let stderr = '';
+    python.stderr.on('data', (data) => { stderr += data.toString(); });
+    python.on('close', (code) => {
+      if (code === 0) {
+        resolve();
+      } else {
+        reject(new Error(stderr || `artifact_store exited with ${code}`));
+      }
+    });
+  });
+}
+
+// 생성 기록 삭제. 웹사이트 기록이면 ZIP 아티팩트의 참조도 해제해 GC 가 회수할 수 있게 합니다.
+// 사용자는 요청 본문이 아니라 Supabase 세션에서 가져옵니다.
+export async function DELETE(request) {
+  try {
+    const supabaseServer = createRouteHandlerClient({ cookies });
+    const { data: { user }, error: authError } = await supabaseServer.auth.getUser();
+
+    if (authError || !user) {
+      return NextResponse.json(
+        { error: 'Authentication required' },
+        { status: 401 }
+      );
+    }
+
+    const { searchParams } = new URL(request.url);
+    const historyId = searchParams.get('id');
+    if (!historyId) {
+      return NextResponse.json(
+        { error: 'History ID is required' },
+        { status: 400 }
+      );
+    }
+
+    const { data: entry, error } = await supabaseServer
+      .from('histories')
+      .select('id, project_dir')
+      .eq('id', historyId)
+      .eq('user_id', user.id)
+      .maybeSingle();
+
+    if (error) {
+      throw error;
+    }
+    if (!entry) {
+      return NextResponse.json(
+        { error: 'History not found' },
+        { status: 404 }
+      );
+    }
+
+    const { error: deleteError } = await supabaseServer
+      .from('histories')
+      .delete()
+      .eq('id', entry.id)
+      .eq('user_id', user.id);
+
+    if (deleteError) {
+      throw deleteError;
+    }
+
+    const match = ARTIFACT_URL.exec(entry.project_dir || '');
+    if (match) {
+      await releaseArtifact(user.id, match[1]);
+    }
+
+    return NextResponse.json({ success: true });
+
+  } catch (error) {
+    console.error('History delete error:', error);
+    return NextResponse.json(
+      { error: 'Failed to delete history' },
+      { status: 500 }
+    );
+  }
+}
@@ -0,0 +1,31 @@
+import { spawn } from 'child_process';
+import { PYTHON_BIN, pythonScript } from '@/lib/python';
+
+// 블로그 노션 게시 상태 조회 (python/notion_outbox.py 의 outbox)
+export async function GET(request) {
+  const { searchParams } = new URL(request.url);
+  const postId = searchParams.get('postId');
+  if (!postId || !/^[a-f0-9]{32}$/.test(postId)) {
+    return new Response(JSON.stringify({ error: 'Invalid post id' }), { status: 400 });
+  }
+
+  const scriptPath = pythonScript('notion_outbox.py');
+  const pythonProcess = spawn(PYTHON_BIN, ['-W', 'ignore', scriptPath, 'status', postId]);
+
+  let stdout = '';
+  let stderr = '';
+
+  pythonProcess.stdout.on('data', (data) => { stdout += data.toString(); });
+  pythonProcess.stderr.on('data', (data) => { stderr += data.toString(); });
+
+  const exitCode = await new Promise((resolve) => {
+    pythonProcess.on('close', resolve);
+  });
+
+  try {
+    const json = JSON.parse(stdout || '{}');
+    return new Response(JSON.stringify(json), { status: exitCode === 0 ? 200 : 404 });
+  } catch {
+    return new Response(JSON.stringify({ error: stderr || 'Python script failed' }), { status: 500 });
+  }
+}
@@ -1,9 +1,55 @@
-import { writeFile, mkdir } from 'fs/promises';
+import { writeFile, mkdtemp, rm } from 'fs/promises';
 import { NextRequest, NextResponse } from 'next/server';
+import { spawn } from 'child_process';
+import os from 'os';
 import path from 'path';
+import { PYTHON_BIN, pythonScript } from '@/lib/python';
+import { sessionUser } from '@/lib/sessionUser';
+
+// 콘텐츠 주소 저장소(python/artifact_store.py)에 파일을 저장하고 메타데이터를 반환
+// 업로드 참조는 AGENT_ARTIFACT_UPLOAD_TTL 이 지나면 해제됩니다.
+function storeArtifact(filePath, originalName, userId) {
+  return new Promise((resolve, reject) => {
+    const args = [
+      '-W', 'ignore',
+      pythonScript('artifact_store.py'),
+      'put', filePath,
+      '--kind', 'upload',
+      '--name', originalName,
+      '--owner', userId,
+    ];
+    const python = spawn(PYTHON_BIN, args);
+
+    let stdout = '';
+    let stderr = '';
+    python.stdout.on('data', (data) => { stdout += data.toString(); });
+    python.stderr.on('data', (data) => { stderr += data.toString(); });
+
+    python.on('close', (code) => {
+      if (code !== 0) {
+        reject(new Error(stderr || `artifact_store exited with ${code}`));
+        return;
+      }
+      try {
+        resolve(JSON.parse(stdout));
+      } catch (err) {
+        reject(err);
+      }
+    });
+  });
+}
 
 export async function POST(request) {
   try {
+    // 업로드 소유자는 폼 데이터가 아니라 로그인 세션의 사용자입니다.
+    const user = await sessionUser();
+    if (!user) {
+      return NextResponse.json(
+        { error: 'Authentication required' },
+        { status: 401 }
+      );
+    }
+
     const formData = await request.formData();
     const files = formData.getAll('files');
 
@@ -52,25 +98,23 @@ export async function POST(request) {
         );
       }
 
-      // 파일 저장 경로 생성
-      const uploadDir = path.join(process.cwd(), 'public', 'uploads');
-      await mkdir(uploadDir, { recursive: true });
-
-      // 고유한 파일명 생성
-      const timestamp = Date.now();
-      const fileExtension = path.extname(file.name);
-      const fileName = `${timestamp}_${file.name}`;
-      const filePath = path.join(uploadDir, fileName);
-
-      // 파일 저장
-      const bytes = await file.arrayBuffer();
-      const buffer = Buffer.from(bytes);
-      await writeFile(filePath, buffer);
+      // 임시 파일에 쓴 뒤 SHA-256 기준으로 저장 (동일한 파일은 한 번만 저장됨)
+      const tmpDir = await mkdtemp(path.join(os.tmpdir(), 'upload-'));
+      const tmpPath = path.join(tmpDir, path.basename(file.name));
+      let artifact;
+      try {
+        const bytes = await file.arrayBuffer();
+        await writeFile(tmpPath, Buffer.from(bytes));
+        artifact = await storeArtifact(tmpPath, file.name, user.id);
+      } finally {
+        await rm(tmpDir, { recursive: true, force: true });
+      }
 
       uploadedFiles.push({
         originalName: file.name,
-        fileName: fileName,
-        filePath: `/uploads/${fileName}`,
+        fileName: path.basename(artifact.url),
+        filePath: artifact.url,
+        sha256: artifact.sha256,
         size: file.size,
         type: file.type
       });
@@ -1,5 +1,8 @@
 import { NextRequest, NextResponse } from 'next/server';
+import { cookies } from 'next/headers';
+import { createRouteHandlerClient } from '@supabase/auth-helpers-nextjs';
 import { supabase } from '@/lib/supabase';
+import { invalidateUserSettings } from '@/lib/userSettingsCache';
 
 export async function GET(request) {
   try {
@@ -35,4 +38,30 @@ export async function GET(request) {
       { status: 500 }
     );
   }
-} 
\ No newline at end of file
+} 
+// 설정이 변경되었음을 알립니다. 로그인한 사용자의 캐시된 설정과 에이전트 클라이언트를 무효화합니다.
+// 사용자는 요청 본문이 아니라 Supabase 세션에서 가져옵니다.
+export async function POST() {
+  try {
+    const supabaseServer = createRouteHandlerClient({ cookies });
+    const { data: { user }, error } = await supabaseServer.auth.getUser();
+
+    if (error || !user) {
+      return NextResponse.json(
+        { error: 'Authentication required' },
+        { status: 401 }
+      );
+    }
+
+    await invalidateUserSettings(user.id);
+
+    return NextResponse.json({ success: true });
+
+  } catch (error) {
+    console.error('User settings invalidation error:', error);
+    return NextResponse.json(
+      { error: 'Failed to invalidate user settings' },
+      { status: 500 }
+    );
+  }
+}
@@ -1,15 +1,33 @@
 // app/api/web/route.js
 import { NextResponse } from 'next/server';
 import { spawn } from 'child_process';
-import path from 'path';
+import { traceIdFor } from '@/lib/traceId';
+import { PYTHON_BIN } from '@/lib/python';
+import { sessionUser } from '@/lib/sessionUser';
+import { schedulerArgs, rejectedResponse, SCHEDULER_REJECTED_EXIT_CODE } from '@/lib/agentScheduler';
 
 export async function POST(request) {
+  // 사용자별 제한과 ZIP 소유자는 요청 본문이 아니라 로그인 세션의 사용자 기준입니다.
+  const user = await sessionUser();
+  if (!user) {
+    return new Response(JSON.stringify({ error: 'Authentication required' }), { status: 401 });
+  }
+  const userId = user.id;
+
   const { prompt } = await request.json();
+  const traceId = traceIdFor(request);
+  const traceHeaders = { 'x-trace-id': traceId };
 
   return new Promise((resolve) => {
-    const scriptPath = path.join(process.cwd(), 'python', 'web_builder_agent.py');
-    const python = spawn('python3', [scriptPath, prompt], {
-      env: process.env,
+    // 스케줄러가 빈 슬롯을 기다린 뒤 실행합니다. 이 라우트는 서버 키만 사용하므로 공용 할당량입니다.
+    const python = spawn(PYTHON_BIN, schedulerArgs({
+      userId,
+      agentType: 'web',
+      sharedQuota: true,
+      script: 'web_builder_agent.py',
+      args: [prompt],
+    }), {
+      env: { ...process.env, TRACE_ID: traceId, AGENT_USER_ID: userId },
       stdio: ['ignore', 'pipe', 'pipe'],
     });
 
@@ -22,12 +40,16 @@ export async function POST(request) {
       console.error('PYTHON ERROR:', data.toString());
     });
 
-    python.on('close', () => {
+    python.on('close', (code) => {
+      if (code === SCHEDULER_REJECTED_EXIT_CODE) {
+        resolve(rejectedResponse(stdout, traceHeaders));
+        return;
+      }
       try {
         const json = JSON.parse(stdout.trim());
-        resolve(NextResponse.json(json));
+        resolve(NextResponse.json(json, { headers: traceHeaders }));
       } catch (err) {
-        resolve(new Response('Invalid script output', { status: 500 }));
+        resolve(new Response('Invalid script output', { status: 500, headers: traceHeaders }));
       }
     });
   });
@@ -9,7 +9,7 @@
 import React, { useState, useEffect } from 'react';
 import Image from 'next/image';
 import NavBar from '@/components/NavBar';
-import { SendHorizonal, BookOpen, Globe, Sparkles, Bot, BarChart3, Paperclip, Settings } from 'lucide-react';
+import { SendHorizonal, BookOpen, Globe, Sparkles, Bot, BarChart3, Paperclip, Settings, Trash2 } from 'lucide-react';
 import { supabase } from '@/lib/supabase';
 import { useSessionContext } from '@supabase/auth-helpers-react';
 import FileUpload from '@/components/FileUpload';
@@ -131,6 +131,37 @@ export default function IntegratedAgentPage() {
     fetchUserName();
   }, [session, userId]);
 
+  // 노션 게시 상태를 주기적으로 확인하고, 게시되면 링크를 표시하고 기록을 갱신합니다.
+  const pollPublishStatus = async (postId: string, historyId?: number) => {
+    for (let attempt = 0; attempt < 120; attempt++) {
+      await new Promise((resolve) => setTimeout(resolve, 5000));
+      try {
+        const res = await fetch(`/api/publish-status?postId=${postId}`);
+        if (!res.ok) continue;
+        const status = await res.json();
+        if (status.status === 'published' && status.url) {
+          setMessages((prev) => [
+            ...prev,
+            { type: 'system', content: `<a href="${status.url}" target="_blank" class="underline text-blue-400">노션 페이지로 이동</a>` }
+          ]);
+          if (historyId) {
+            await supabase.from('histories').update({ url: status.url }).eq('id', historyId);
+          }
+          return;
+        }
+        if (status.status === 'failed') {
+          setMessages((prev) => [
+            ...prev,
+            { type: 'system', content: `노션 게시 실패: ${status.last_error || '알 수 없는 오류'} (글은 보관되어 있습니다)` }
+          ]);
+          return;
+        }
+      } catch (error) {
+        console.error('Publish status error:', error);
+      }
+    }
+  };
+
   const handleSubmit = async () => {
     if (!input.trim() || loading) return;
     const userInput = input.trim();
@@ -176,13 +207,13 @@ export default function IntegratedAgentPage() {
       
       if (selectedAgent === 'blog') {
         endpoint = '/api/generate';
-        body = { topic: userInput, userId };
+        body = { topic: userInput };
       } else if (selectedAgent === 'web') {
         endpoint = '/api/web';
         body = { prompt: userInput };
       } else if (selectedAgent === 'data') {
         endpoint = '/api/analyze';
-        body = { request: userInput, userId };
+        body = { request: userInput };
       }
 
       const res = await fetch(endpoint, {
@@ -211,12 +242,23 @@ export default function IntegratedAgentPage() {
           )
         };
 
-        await supabase.from('histories').insert([historyData]);
+        const { data: insertedHistory } = await supabase
+          .from('histories')
+          .insert([historyData])
+          .select('id')
+          .single();
 
         // 결과 메시지 생성
         const resultMessages: Message[] = [];
         
-        if (selectedAgent === 'blog') {
+        if (selectedAgent === 'blog' && data.status === 'pending') {
+          // 글은 저장되었고 노션 게시는 백그라운드에서 진행됩니다.
+          resultMessages.push(
+            { type: 'system', content: `블로그가 생성되었습니다: ${data.title}` },
+            { type: 'system', content: '노션에 게시하는 중입니다. 완료되면 링크가 표시됩니다.' }
+          );
+          pollPublishStatus(data.post_id, insertedHistory?.id);
+        } else if (selectedAgent === 'blog') {
           resultMessages.push(
             { type: 'system', content: `블로그가 생성되었습니다: ${data.title}` },
             { type: 'system', content: `<a href="${data.url}" target="_blank" class="underline text-blue-400">노션 페이지로 이동</a>` }
@@ -225,7 +267,7 @@ export default function IntegratedAgentPage() {
           resultMessages.push(
             { type: 'system', content: `프로젝트가 생성되었습니다: ${data.project_name || userInput}` },
             { type: 'system', content: `<span>파일 경로: ${data.zip_path}</span>` },
-            { type: 'system', content: `<a href="${data.zip_path}" download class="text-blue-400 underline">ZIP 파일 다운로드</a>` }
+            { type: 'system', content: `<a href="${data.zip_path}?name=${encodeURIComponent(data.zip_name || '')}" download="${data.zip_name || ''}" class="text-blue-400 underline">ZIP 파일 다운로드</a>` }
           );
         } else if (selectedAgent === 'data') {
           resultMessages.push(
@@ -245,6 +287,10 @@ export default function IntegratedAgentPage() {
         // 파일 업로드 초기화
         setUploadedFiles([]);
         setShowFileUpload(false);
+      } else if (res.status === 429) {
+        // 스케줄러가 과부하로 요청을 거절함: 재시도 가능 시간을 안내합니다.
+        const retryAfter = data.retry_after || res.headers.get('Retry-After');
+        setMessages((prev) => [...prev, { type: 'system', content: `요청이 많아 잠시 후 다시 시도해 주세요${retryAfter ? ` (약 ${retryAfter}초 후)` : ''}.` }]);
       } else {
         setMessages((prev) => [...prev, { type: 'system', content: `오류: ${data.error || '알 수 없는 오류'}` }]);
       }
@@ -282,6 +328,14 @@ export default function IntegratedAgentPage() {
     setSelectedAgent(item.agent_type);
   };
 
+  // 기록 삭제 (웹사이트 기록이면 서버가 ZIP 아티팩트 참조도 해제)
+  const handleHistoryDelete = async (item: HistoryItem) => {
+    const res = await fetch(`/api/history?id=${item.id}`, { method: 'DELETE' });
+    if (res.ok) {
+      setHistory((prev) => prev.filter((entry) => entry.id !== item.id));
+    }
+  };
+
   const getAgentInfo = (agentType: AgentType) => {
     return agents.find(agent => agent.id === agentType) || agents[0];
   };
@@ -321,25 +375,33 @@ export default function IntegratedAgentPage() {
         </div>
         
         {history.map((item) => (
-          <button
-            key={item.id}
-            onClick={() => handleHistoryClick(item)}
-            className="text-left w-full text-white mb-2 hover:text-purple-400 hover:bg-purple-900/30 rounded-md transition p-2"
-          >
-            <div className="flex items-center gap-2 mb-1">
-              {item.agent_type === 'blog' ? (
-                <BookOpen className="w-4 h-4 text-purple-400" />
-              ) : item.agent_type === 'web' ? (
-                <Globe className="w-4 h-4 text-blue-400" />
-              ) : (
-                <BarChart3 className="w-4 h-4 text-green-400" />
-              )}
-              <span className="text-xs text-gray-400">
-                {item.agent_type === 'blog' ? '블로그' : item.agent_type === 'web' ? '웹사이트' : '데이터분석'}
-              </span>
-            </div>
-            <div className="text-sm truncate">{item.input}</div>
-          </button>
+          <div key={item.id} className="group relative w-full mb-2">
+            <button
+              onClick={() => handleHistoryClick(item)}
+              className="text-left w-full text-white hover:text-purple-400 hover:bg-purple-900/30 rounded-md transition p-2"
+            >
+              <div className="flex items-center gap-2 mb-1">
+                {item.agent_type === 'blog' ? (
+                  <BookOpen className="w-4 h-4 text-purple-400" />
+                ) : item.agent_type === 'web' ? (
+                  <Globe className="w-4 h-4 text-blue-400" />
+                ) : (
+                  <BarChart3 className="w-4 h-4 text-green-400" />
+                )}
+                <span className="text-xs text-gray-400">
+                  {item.agent_type === 'blog' ? '블로그' : item.agent_type === 'web' ? '웹사이트' : '데이터분석'}
+                </span>
+              </div>
+              <div className="text-sm truncate">{item.input}</div>
+            </button>
+            <button
+              onClick={() => handleHistoryDelete(item)}
+              className="absolute right-2 top-2 hidden group-hover:block text-gray-400 hover:text-red-400"
+              title="기록 삭제"
+            >
+              <Trash2 className="w-4 h-4" />
+            </button>
+          </div>
         ))}
       </aside>
 
@@ -80,6 +80,11 @@ const UserSettings: React.FC<UserSettingsProps> = ({ userId, isOpen, onClose })
 
       if (error) throw error;
 
+      // 서버에 캐시된 설정 무효화
+      await fetch('/api/user-settings', {
+        method: 'POST',
+      }).catch((err) => console.error('설정 캐시 무효화 오류:', err));
+
       setMessage({ type: 'success', text: '설정이 성공적으로 저장되었습니다!' });
       
       // 3초 후 메시지 제거
@@ -0,0 +1,36 @@
+// python/scheduler.py 를 통해 에이전트 스크립트를 실행하기 위한 헬퍼
+// (사용자별/에이전트별 동시 실행 제한, 공정 큐잉, 과부하 시 조기 거절)
+import { pythonScript } from '@/lib/python';
+
+// 스케줄러가 요청을 거절했을 때의 종료 코드 (EX_TEMPFAIL)
+export const SCHEDULER_REJECTED_EXIT_CODE = 75;
+
+// `python scheduler.py run ... <script> <args>` 인자 목록을 만듭니다.
+// userId: Supabase 세션의 사용자 ID (sessionUser). 요청 본문의 값은 믿지 않습니다.
+// script: python/ 아래 스크립트 이름 (예: 'blog_agent.py')
+// sharedQuota: 사용자 API 키가 없어 서버 공용 키(공용 할당량)를 쓰는 경우 true
+export function schedulerArgs({ userId, agentType, sharedQuota, script, args = [] }) {
+  return [
+    '-W', 'ignore',
+    pythonScript('scheduler.py'), 'run',
+    '--user', userId,
+    '--agent', agentType,
+    ...(sharedQuota ? ['--shared-quota'] : []),
+    pythonScript(script),
+    ...args,
+  ];
+}
+
+// 거절 응답 ({ error, retry_after }) 을 429 + Retry-After 로 변환합니다.
+export function rejectedResponse(stdout, headers = {}) {
+  let body = { error: 'The agents are busy', retry_after: 30 };
+  try {
+    body = { ...body, ...JSON.parse(stdout) };
+  } catch {
+    // 기본값 사용
+  }
+  return new Response(JSON.stringify(body), {
+    status: 429,
+    headers: { ...headers, 'Retry-After': String(body.retry_after) },
+  });
+}
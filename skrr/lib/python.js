@@ -0,0 +1,10 @@
+import path from 'path';
+
+// 모든 API 라우트가 같은 인터프리터로 python/ 아래 스크립트를 실행합니다.
+// PYTHON_BIN 환경 변수로 바꿀 수 있습니다 (예: 가상환경의 python).
+export const PYTHON_BIN = process.env.PYTHON_BIN || 'python3';
+
+// python/<name> 의 절대 경로
+export function pythonScript(name) {
+  return path.join(process.cwd(), 'python', name);
+}
@@ -0,0 +1,10 @@
+import { cookies } from 'next/headers';
+import { createRouteHandlerClient } from '@supabase/auth-helpers-nextjs';
+
+// 요청 본문의 userId 가 아니라 Supabase 세션 쿠키로 로그인한 사용자를 확인합니다.
+// 로그인하지 않았으면 null 을 반환합니다.
+export async function sessionUser() {
+  const supabaseServer = createRouteHandlerClient({ cookies });
+  const { data: { user }, error } = await supabaseServer.auth.getUser();
+  return error || !user ? null : user;
+}
@@ -0,0 +1,10 @@
+import { randomUUID } from 'crypto';
+
+const TRACE_ID_RE = /^[0-9a-f]{32}$/;
+
+// 요청의 trace id (x-trace-id 헤더가 올바르면 재사용, 아니면 새로 생성)
+// Python 에이전트에는 TRACE_ID 환경 변수로 전달되어 python/.data/traces/<id>.jsonl 에 기록됩니다.
+export function traceIdFor(req) {
+  const incoming = (req.headers.get('x-trace-id') || '').toLowerCase();
+  return TRACE_ID_RE.test(incoming) ? incoming : randomUUID().replace(/-/g, '');
+}
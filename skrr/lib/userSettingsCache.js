@@ -0,0 +1,55 @@
+// lib/userSettingsCache.js
+// 서버 측 user_settings 캐시. 같은 사용자의 반복 요청은 Supabase 조회를 건너뜁니다.
+// 설정이 저장되면 /api/user-settings (POST) 가 로그인한 사용자의 캐시(Node, Python)를 무효화합니다.
+import { spawn } from 'child_process';
+import { supabase } from '@/lib/supabase';
+import { PYTHON_BIN, pythonScript } from '@/lib/python';
+
+const TTL_MS = Number(process.env.USER_SETTINGS_CACHE_TTL_MS || 5 * 60 * 1000);
+const cache = new Map(); // userId -> { settings, expiresAt }
+
+export async function getUserSettings(userId) {
+  if (!userId) return {};
+
+  const cached = cache.get(userId);
+  if (cached && cached.expiresAt > Date.now()) {
+    return cached.settings;
+  }
+
+  let settings = {};
+  try {
+    const { data, error } = await supabase
+      .from('user_settings')
+      .select('*')
+      .eq('user_id', userId)
+      .single();
+
+    if (data && !error) {
+      settings = data;
+    }
+  } catch (error) {
+    console.error('Failed to fetch user settings:', error);
+    // 조회 실패는 캐시하지 않습니다.
+    return settings;
+  }
+
+  cache.set(userId, { settings, expiresAt: Date.now() + TTL_MS });
+  return settings;
+}
+
+// Node 캐시와 Python 런타임의 클라이언트 캐시(python/client_cache.py)를 함께 무효화합니다.
+export async function invalidateUserSettings(userId) {
+  cache.delete(userId);
+
+  const pythonProcess = spawn(PYTHON_BIN, [pythonScript('client_cache.py'), 'invalidate', userId]);
+  let stderr = '';
+  pythonProcess.stderr.on('data', (data) => { stderr += data.toString(); });
+
+  const exitCode = await new Promise((resolve) => {
+    pythonProcess.on('close', resolve);
+    pythonProcess.on('error', () => resolve(-1));
+  });
+  if (exitCode !== 0) {
+    console.error('Failed to invalidate agent client cache:', stderr);
+  }
+}
@@ -0,0 +1,460 @@
+"""
+artifact_store.py
+=================
+
+Content-addressed storage for uploads and generated artifacts.
+
+Uploaded files and generated project zips used to be written under new,
+timestamped names on every request and were never cleaned up.  This store
+keeps every blob exactly once, named by its SHA-256, so uploading the same
+file twice costs no extra disk.  (Generated project zips are reproducible,
+but each contains an LLM-written README, so two runs rarely produce the
+same bytes.)  A SQLite index records who referenced each blob (owner, kind,
+original name), when it was created and when it was last accessed, and
+keeps a reference count:
+
+* every ``put`` adds a reference;
+* deleting a history entry releases the reference to its zip
+  (``/api/history`` DELETE -> ``release``);
+* upload references expire after ``AGENT_ARTIFACT_UPLOAD_TTL`` seconds,
+  since an upload only feeds the request that sent it;
+* every download goes through ``/api/artifacts/...``, which records the
+  access (``touch``) before serving the file.
+
+A garbage collector bounds disk usage without ever breaking a link that is
+still referenced.  Blobs with references are never collected; unreferenced
+blobs are kept for reuse while they fit, least recently accessed first out:
+
+1. Expired references are released.
+2. Unreferenced blobs not accessed for ``AGENT_ARTIFACT_MAX_AGE_DAYS`` are
+   evicted.
+3. While the store is larger than ``AGENT_ARTIFACT_MAX_BYTES``, the least
+   recently accessed unreferenced blobs are evicted.
+
+GC runs after every ``put`` (it is a couple of indexed queries when there is
+nothing to do) and can also be run from the command line.
+
+Blobs still live under ``public/artifacts`` so that ``/artifacts/...`` links
+handed out before the download route existed keep working; those links
+skip ``touch``, but their blobs are referenced and therefore kept.
+
+Configuration (environment variables):
+
+    AGENT_ARTIFACT_ROOT          Blob directory (default: public/artifacts).
+    AGENT_ARTIFACT_URL_PREFIX    URL prefix of the download route (default /api/artifacts).
+    AGENT_ARTIFACT_DB            Index path (default: python/.data/artifacts.sqlite3).
+    AGENT_ARTIFACT_MAX_BYTES     Size limit of the store (default 2 GiB).
+    AGENT_ARTIFACT_MAX_AGE_DAYS  Evict unreferenced blobs unused for this long (default 30).
+    AGENT_ARTIFACT_UPLOAD_TTL    Lifetime of ``put --kind upload`` references in seconds
+                                 (default 86400; ``--ttl`` overrides it).
+
+Usage:
+    from artifact_store import ArtifactStore, zip_directory
+    with ArtifactStore() as store:
+        artifact = store.put_bytes(zip_directory(path), user_id, "web_zip", "site.zip")
+
+    python artifact_store.py put --owner <user> --kind upload --name report.csv --ttl 86400 <file>
+    python artifact_store.py touch <sha256>          # record a download, print the blob path
+    python artifact_store.py release --owner <user> --sha256 <sha256>
+    python artifact_store.py gc
+    python artifact_store.py stats
+"""
+
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import zipfile
+from typing import Optional
+
+_SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_ROOT = os.path.join(_SCRIPT_DIR, os.pardir, "public", "artifacts")
+DEFAULT_DB_PATH = os.path.join(_SCRIPT_DIR, ".data", "artifacts.sqlite3")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+DEFAULT_MAX_AGE_DAYS = 30
+DEFAULT_UPLOAD_TTL_SECONDS = 86400
+_CHUNK = 1024 * 1024
+# Fixed timestamp for zip entries so identical trees produce identical bytes.
+_ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+_BLOBS_COLUMNS = """
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    refcount INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    last_access_at REAL NOT NULL
+"""
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS blobs ({_BLOBS_COLUMNS});
+CREATE INDEX IF NOT EXISTS idx_blobs_last_access ON blobs(last_access_at);
+CREATE TABLE IF NOT EXISTS refs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sha256 TEXT NOT NULL REFERENCES blobs(sha256),
+    owner TEXT,
+    kind TEXT NOT NULL,
+    name TEXT,
+    created_at REAL NOT NULL,
+    expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_refs_sha256 ON refs(sha256);
+CREATE INDEX IF NOT EXISTS idx_refs_owner_kind ON refs(owner, kind);
+"""
+
+
+class ArtifactStore:
+    """SHA-256 addressed blob store with a reference-counted SQLite index."""
+
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        db_path: Optional[str] = None,
+        url_prefix: Optional[str] = None,
+    ) -> None:
+        self.root = os.path.abspath(root or os.environ.get("AGENT_ARTIFACT_ROOT") or DEFAULT_ROOT)
+        self.db_path = db_path or os.environ.get("AGENT_ARTIFACT_DB") or DEFAULT_DB_PATH
+        self.url_prefix = (
+            url_prefix or os.environ.get("AGENT_ARTIFACT_URL_PREFIX") or "/api/artifacts"
+        ).rstrip("/")
+        os.makedirs(self.root, exist_ok=True)
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._migrate_blobs()
+        self.conn.executescript(_SCHEMA)
+        if "expires_at" not in self._columns("refs"):
+            self.conn.execute("ALTER TABLE refs ADD COLUMN expires_at REAL")
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "ArtifactStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _migrate_blobs(self) -> None:
+        """Restore reference counts in indexes written without them.
+
+        A short-lived version of this module dropped ``refcount`` and kept
+        only the time of the last put.  The table is rebuilt (which, unlike
+        DROP/RENAME COLUMN, works on any SQLite) with counts recomputed from
+        ``refs``.
+        """
+        if "last_put_at" not in self._columns("blobs"):
+            return
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            if "last_put_at" in self._columns("blobs"):
+                self.conn.execute(f"CREATE TABLE blobs_rebuild ({_BLOBS_COLUMNS})")
+                self.conn.execute(
+                    "INSERT INTO blobs_rebuild (sha256, size, path, refcount, created_at, last_access_at) "
+                    "SELECT b.sha256, b.size, b.path, "
+                    "(SELECT COUNT(*) FROM refs r WHERE r.sha256 = b.sha256), "
+                    "b.created_at, b.last_put_at FROM blobs b"
+                )
+                self.conn.execute("DROP TABLE blobs")
+                self.conn.execute("ALTER TABLE blobs_rebuild RENAME TO blobs")
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def _columns(self, table: str) -> list:
+        return [row["name"] for row in self.conn.execute(f"PRAGMA table_info({table})")]
+
+    # -- helpers -------------------------------------------------------------
+
+    def _url(self, rel_path: str) -> str:
+        return f"{self.url_prefix}/{rel_path}"
+
+    def _describe(self, row: sqlite3.Row, ref_id: Optional[int] = None, deduplicated: bool = False) -> dict:
+        return {
+            "sha256": row["sha256"],
+            "size": row["size"],
+            "path": os.path.join(self.root, row["path"]),
+            "url": self._url(row["path"]),
+            "ref_id": ref_id,
+            "deduplicated": deduplicated,
+        }
+
+    def _delete_blob(self, sha256: str, rel_path: str) -> None:
+        self.conn.execute("DELETE FROM refs WHERE sha256 = ?", (sha256,))
+        self.conn.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+        blob_path = os.path.join(self.root, rel_path)
+        try:
+            os.remove(blob_path)
+            os.rmdir(os.path.dirname(blob_path))  # only succeeds once the shard is empty
+        except OSError:
+            pass
+
+    # -- writes --------------------------------------------------------------
+
+    def put_file(self, src_path: str, owner: Optional[str], kind: str, name: Optional[str] = None,
+                 ttl: Optional[float] = None) -> dict:
+        """Store the file at ``src_path`` and add a reference to it.
+
+        The file is hashed while being copied into a temporary file inside
+        the store, which is then renamed into place (or discarded when the
+        content already exists).  With ``ttl`` the reference is released
+        automatically after that many seconds.
+        """
+        name = name or os.path.basename(src_path)
+        ext = os.path.splitext(name)[1].lower()[:16]
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out, open(src_path, "rb") as src:
+                for chunk in iter(lambda: src.read(_CHUNK), b""):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    out.write(chunk)
+            return self._commit(tmp_path, digest.hexdigest(), size, ext, owner, kind, name, ttl)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def put_bytes(self, data: bytes, owner: Optional[str], kind: str, name: str,
+                  ttl: Optional[float] = None) -> dict:
+        """Store ``data`` (e.g. an in-memory zip) and add a reference to it."""
+        ext = os.path.splitext(name)[1].lower()[:16]
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                out.write(data)
+            sha256 = hashlib.sha256(data).hexdigest()
+            return self._commit(tmp_path, sha256, len(data), ext, owner, kind, name, ttl)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _commit(self, tmp_path: str, sha256: str, size: int, ext: str,
+                owner: Optional[str], kind: str, name: str, ttl: Optional[float]) -> dict:
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute("SELECT * FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+            deduplicated = row is not None and os.path.exists(os.path.join(self.root, row["path"]))
+            if not deduplicated:
+                rel_path = row["path"] if row is not None else f"{sha256[:2]}/{sha256}{ext}"
+                dest = os.path.join(self.root, rel_path)
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                os.replace(tmp_path, dest)
+                if row is None:
+                    self.conn.execute(
+                        "INSERT INTO blobs (sha256, size, path, refcount, created_at, last_access_at) "
+                        "VALUES (?, ?, ?, 0, ?, ?)",
+                        (sha256, size, rel_path, now, now),
+                    )
+            cursor = self.conn.execute(
+                "INSERT INTO refs (sha256, owner, kind, name, created_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (sha256, owner, kind, name, now, now + ttl if ttl is not None else None),
+            )
+            self.conn.execute(
+                "UPDATE blobs SET refcount = refcount + 1, last_access_at = ? WHERE sha256 = ?",
+                (now, sha256),
+            )
+            row = self.conn.execute("SELECT * FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        result = self._describe(row, cursor.lastrowid, deduplicated)
+        self.gc(keep=sha256)
+        return result
+
+    def touch(self, sha256: str) -> Optional[dict]:
+        """Record an access so the blob is treated as recently used by GC.
+
+        Returns the blob's descriptor, or ``None`` when it is not stored.
+        """
+        self.conn.execute(
+            "UPDATE blobs SET last_access_at = ? WHERE sha256 = ?", (time.time(), sha256)
+        )
+        row = self.conn.execute("SELECT * FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+        if row is None or not os.path.exists(os.path.join(self.root, row["path"])):
+            return None
+        return self._describe(row)
+
+    def release(self, ref_id: int) -> None:
+        """Drop one reference; the blob is collected once nothing refers to it."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute("SELECT sha256 FROM refs WHERE id = ?", (ref_id,)).fetchone()
+            if row is not None:
+                self.conn.execute("DELETE FROM refs WHERE id = ?", (ref_id,))
+                self.conn.execute(
+                    "UPDATE blobs SET refcount = MAX(refcount - 1, 0) WHERE sha256 = ?",
+                    (row["sha256"],),
+                )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def release_owned(self, owner: str, sha256: str) -> bool:
+        """Drop one of ``owner``'s references to ``sha256``.
+
+        Used when a user deletes a history entry, which knows the blob (from
+        its download URL) but not the reference id.  Returns whether a
+        reference was found.
+        """
+        row = self.conn.execute(
+            "SELECT id FROM refs WHERE owner = ? AND sha256 = ? ORDER BY id LIMIT 1",
+            (owner, sha256),
+        ).fetchone()
+        if row is None:
+            return False
+        self.release(row["id"])
+        return True
+
+    def _release_expired(self, now: float) -> None:
+        for row in self.conn.execute(
+            "SELECT sha256, COUNT(*) AS n FROM refs WHERE expires_at < ? GROUP BY sha256", (now,)
+        ).fetchall():
+            self.conn.execute(
+                "UPDATE blobs SET refcount = MAX(refcount - ?, 0) WHERE sha256 = ?",
+                (row["n"], row["sha256"]),
+            )
+        self.conn.execute("DELETE FROM refs WHERE expires_at < ?", (now,))
+
+    # -- garbage collection ----------------------------------------------------
+
+    def gc(
+        self,
+        max_bytes: Optional[int] = None,
+        max_age_seconds: Optional[float] = None,
+        keep: Optional[str] = None,
+    ) -> dict:
+        """Evict unreferenced blobs until the store is within its limits.
+
+        Expired references are released first.  Blobs that are still
+        referenced are never evicted, so the size limit is a target rather
+        than a hard cap.  ``keep`` names a blob that must survive this pass
+        (the one just stored, whose URL is about to be handed out).
+
+        Returns:
+            ``{"evicted": <blobs>, "freed_bytes": <bytes>, "total_bytes": <remaining>}``
+        """
+        if max_bytes is None:
+            max_bytes = int(os.environ.get("AGENT_ARTIFACT_MAX_BYTES", DEFAULT_MAX_BYTES))
+        if max_age_seconds is None:
+            days = float(os.environ.get("AGENT_ARTIFACT_MAX_AGE_DAYS", DEFAULT_MAX_AGE_DAYS))
+            max_age_seconds = days * 86400
+        now = time.time()
+        evicted = 0
+        freed = 0
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._release_expired(now)
+            doomed = self.conn.execute(
+                "SELECT sha256, path, size FROM blobs "
+                "WHERE refcount = 0 AND last_access_at < ? AND sha256 IS NOT ?",
+                (now - max_age_seconds, keep),
+            ).fetchall()
+            for row in doomed:
+                self._delete_blob(row["sha256"], row["path"])
+                evicted += 1
+                freed += row["size"]
+
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            if total > max_bytes:
+                for row in self.conn.execute(
+                    "SELECT sha256, path, size FROM blobs "
+                    "WHERE refcount = 0 AND sha256 IS NOT ? ORDER BY last_access_at",
+                    (keep,),
+                ).fetchall():
+                    if total <= max_bytes:
+                        break
+                    self._delete_blob(row["sha256"], row["path"])
+                    total -= row["size"]
+                    evicted += 1
+                    freed += row["size"]
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return {"evicted": evicted, "freed_bytes": freed, "total_bytes": total}
+
+    def stats(self) -> dict:
+        """Blob/reference counts and total size of the store."""
+        blobs, total = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs"
+        ).fetchone()
+        refs = self.conn.execute("SELECT COUNT(*) FROM refs").fetchone()[0]
+        return {"blobs": blobs, "refs": refs, "total_bytes": total}
+
+
+def zip_directory(directory: str) -> bytes:
+    """Zip ``directory`` reproducibly and return the archive bytes.
+
+    Entries are sorted and carry a fixed timestamp and mode, so the same
+    tree always hashes to the same blob and is stored only once.
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for dirpath, dirnames, filenames in os.walk(directory):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                full_path = os.path.join(dirpath, filename)
+                arcname = os.path.relpath(full_path, directory).replace(os.sep, "/")
+                info = zipfile.ZipInfo(arcname, date_time=_ZIP_EPOCH)
+                info.external_attr = 0o644 << 16
+                info.compress_type = zipfile.ZIP_DEFLATED
+                with open(full_path, "rb") as f:
+                    archive.writestr(info, f.read())
+    return buffer.getvalue()
+
+
+def _main(argv: list) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Content-addressed artifact store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    put = sub.add_parser("put", help="store a file and print its descriptor as JSON")
+    put.add_argument("file")
+    put.add_argument("--owner")
+    put.add_argument("--kind", required=True)
+    put.add_argument("--name")
+    put.add_argument("--ttl", type=float, help="release the reference after this many seconds")
+    touch = sub.add_parser("touch", help="record a download and print the blob's descriptor")
+    touch.add_argument("sha256")
+    release = sub.add_parser("release", help="drop one of an owner's references to a blob")
+    release.add_argument("--owner", required=True)
+    release.add_argument("--sha256", required=True)
+    sub.add_parser("gc", help="evict blobs beyond the configured limits")
+    sub.add_parser("stats", help="print store statistics")
+    args = parser.parse_args(argv)
+
+    with ArtifactStore() as store:
+        if args.command == "put":
+            ttl = args.ttl
+            if ttl is None and args.kind == "upload":
+                ttl = float(os.environ.get("AGENT_ARTIFACT_UPLOAD_TTL", DEFAULT_UPLOAD_TTL_SECONDS))
+            result = store.put_file(args.file, args.owner, args.kind, args.name, ttl)
+        elif args.command == "touch":
+            result = store.touch(args.sha256)
+            if result is None:
+                print(json.dumps({"error": f"unknown artifact {args.sha256}"}))
+                return 1
+        elif args.command == "release":
+            result = {"released": store.release_owned(args.owner, args.sha256)}
+        elif args.command == "gc":
+            result = store.gc()
+        else:
+            result = store.stats()
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))
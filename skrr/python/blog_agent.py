@@ -5,11 +5,23 @@ blog_agent.py
 
 This script defines a simple two‑agent CrewAI workflow that
 researches a user‑provided topic and writes a formatted blog post.
-After the article is generated, it automatically publishes the
-content to a Notion database using the official Notion client.
+After the article is generated, it is stored in a local outbox
+(see notion_outbox.py) and the script returns immediately with a pending
+status; a detached background publisher then creates the page in a Notion
+database using the official Notion client, retrying on failures.
 
 Usage:
     python blog_agent.py "Topic of the blog"
+    python blog_agent.py --batch topics.txt --concurrency 4
+    cat topics.txt | python blog_agent.py --batch -
+
+In batch mode, topics are read one per line and generated concurrently (up
+to ``--concurrency``, default ``BLOG_BATCH_CONCURRENCY`` or 4).  Every topic
+shares the same LLM client and search cache, LLM and Notion calls are
+globally rate limited via ``AGENT_LLM_RPM`` and ``AGENT_NOTION_RPS``, and one
+JSON line (``url``/``title`` or ``error``, plus ``topic``) is printed per
+topic as it finishes.  Posts whose Notion publish fails are queued in the
+outbox (``status: pending`` with a ``post_id``) instead of being dropped.
 
 The script expects a number of environment variables to be set:
 
@@ -18,6 +30,10 @@ The script expects a number of environment variables to be set:
     SERPER_API_KEY          API key for Serper (optional if using DuckDuckGoSearchTool).
     NOTION_TOKEN            The integration token for Notion.
     NOTION_DATABASE_ID      The ID of the Notion database where posts will be created.
+    AGENT_PIPELINE_STREAM   Set to 1 to stream the research and write each section
+                            as soon as its notes are complete (see pipeline.py).
+    BLOG_RESEARCH_MODE      Set to "fanout" to research sub-questions of the topic
+                            concurrently before writing (see research_fanout.py).
 
 You can place these in a .env file in the root of the project and load
 them using python‑dotenv, or export them in your shell before running
@@ -35,7 +51,15 @@ order and passing inputs as needed【289190495545497†L151-L163】.
 import json
 import os
 import sys
-from ddgs import DDGS
+
+from client_cache import get_clients, settings_from_env
+from cassette import intercept, request_key
+from http_transport import shared_ddgs
+from memory_index import recall, remember
+from notion_outbox import enqueue, start_background_publisher
+from pipeline import stream_blog_post, stream_enabled
+from research_fanout import fanout_enabled, fanout_research
+from tracing import bind_context, kickoff, span
 
 # Load environment variables from a .env file if present.  This allows the
 # Python script to find API keys and other settings even when they are not
@@ -53,22 +77,15 @@ except Exception:
 from typing import List
 
 
-def main(topic: str) -> None:
-    """Entrypoint for blog generation and publication.
-
-    Args:
-        topic: The topic to research and write about.
-    """
+def _load_clients():
+    """Check dependencies and settings; return ``(clients, notion_database_id)``."""
     try:
         # Defer expensive imports until runtime to improve cold start times.
-        from crewai import Agent, Task, Crew, Process, LLM
-        # Attempt to import SerperDevTool.  If the import fails, we'll handle it
-        # gracefully by disabling external search.
-        try:
-            from crewai_tools import SerperDevTool  # type: ignore
-        except Exception:
-            SerperDevTool = None  # type: ignore
-        from notion_client import Client
+        import crewai  # noqa: F401
+        # The LLM, search tool and Notion client are built lazily by
+        # client_cache; check the Notion client is importable up front
+        # so a missing dependency fails before any tokens are spent.
+        import notion_client  # noqa: F401
     except ImportError as e:
         # If dependencies are missing, inform the caller via stderr and exit.
         sys.stderr.write(
@@ -78,53 +95,48 @@ def main(topic: str) -> None:
         sys.stderr.flush()
         raise e
 
-    # Load environment variables. We do not hardcode any secrets.
-    openai_key = os.environ.get("OPENAI_API_KEY")
-    openai_model = os.environ.get("OPENAI_MODEL", "gpt-4o")
-    gemini_key = os.environ.get("GEMINI_API_KEY")
-    gemini_model = os.environ.get("GEMINI_MODEL", "gemini/gemini-pro")
-    serper_key = os.environ.get("SERPER_API_KEY")
-    notion_token = os.environ.get("NOTION_TOKEN")
-    notion_db_id = os.environ.get("NOTION_DATABASE_ID")
-
-    if not notion_token or not notion_db_id:
+    # Load settings from the environment. We do not hardcode any secrets.
+    settings = settings_from_env()
+    if not settings.get("notion_token") or not settings.get("notion_database_id"):
         raise RuntimeError(
             "NOTION_TOKEN and NOTION_DATABASE_ID must be set to publish the blog post."
         )
+    notion_db_id = settings["notion_database_id"]
+
+    # In batch mode every topic shares the clients built for these settings
+    # (see client_cache).
+    clients = get_clients(os.environ.get("AGENT_USER_ID"), settings)
+
+    return clients, notion_db_id
+
+
+def generate_post(topic: str, clients) -> str:
+    """Research ``topic`` and write a Markdown blog post with a two-agent crew.
+
+    With ``AGENT_PIPELINE_STREAM=1`` the research is streamed instead and
+    each section is written as soon as its notes are complete (see
+    pipeline.py).
+
+    Raises whatever the crew raises (API, quota or network errors).
+    """
+    if stream_enabled():
+        blog_content = stream_blog_post(topic, clients, recall("blog", topic))
+        remember("blog", topic, blog_content)
+        return blog_content
+
+    from crewai import Agent, Task, Crew, Process
 
     # Configure the language model for CrewAI.  If a Gemini API key is provided,
     # use Gemini; otherwise fall back to OpenAI.  You can override the model
     # names via the GEMINI_MODEL or OPENAI_MODEL environment variables.  The
     # CrewAI LLM class internally uses LiteLLM, which supports a variety of
     # providers, including Google Gemini【662141623612446†L287-L296】.
-    if gemini_key:
-        llm = LLM(
-            model=gemini_model,
-            api_key=gemini_key,
-            temperature=0.5,
-            base_url=os.environ.get("GEMINI_BASE_URL"),
-        )
-    else:
-        if not openai_key:
-            raise RuntimeError(
-                "OPENAI_API_KEY is not set and no GEMINI_API_KEY provided."
-            )
-        llm = LLM(
-            model=openai_model,
-            api_key=openai_key,
-            temperature=0.5,
-            base_url=os.environ.get("OPENAI_BASE_URL"),
-        )
+    llm = clients.llm(temperature=0.5)
 
     # Choose a search tool.  We prefer Serper when an API key is provided.
-    search_tool = None
-    if serper_key and SerperDevTool:
-        # SerperDevTool automatically reads the SERPER_API_KEY from the
-        # environment.  Without the key the tool will still be instantiated
-        # but will not function.
-        search_tool = SerperDevTool()
     # If no search tool is available, the researcher will rely solely on
     # the language model's knowledge without external search.
+    search_tool = clients.search_tool()
 
     # Define the Researcher agent. This agent uses the search tool to gather
     # up‑to‑date information about the topic, summarising key points.
@@ -155,12 +167,18 @@ def main(topic: str) -> None:
         llm=llm,
     )
 
+    # Past runs of this user that relate to the topic (bounded by top-k and a
+    # token budget).  Empty when memory is disabled or nothing matches.
+    memory_context = recall("blog", topic)
+    memory_section = f"\n\n{memory_context}" if memory_context else ""
+
     # Research task: gather information. The expected output should be a
     # structured summary that includes facts, statistics, and citations.
     research_task = Task(
         description=(
             f"Research the topic '{topic}'. Provide a bullet list of at least 5 key points, "
             "including important facts, figures, or arguments. Cite the sources you used."
+            f"{memory_section}"
         ),
         expected_output=(
             "A research summary containing bullet points with facts and citations."
@@ -168,6 +186,12 @@ def main(topic: str) -> None:
         agent=researcher,
     )
 
+    # With BLOG_RESEARCH_MODE=fanout the research happens up front, split into
+    # concurrently researched sub-questions, and only the writer runs in the crew.
+    # When it finds nothing usable, the crew's own researcher takes over.
+    research_summary = fanout_research(topic, clients, memory_context) if fanout_enabled() else ""
+    summary_section = f"\n\nResearch summary:\n{research_summary}" if research_summary else ""
+
     # Writing task: create the blog post. It should transform the summary into a
     # coherent article in Markdown format.
     write_task = Task(
@@ -175,6 +199,7 @@ def main(topic: str) -> None:
             "Using the research summary provided by the researcher, write a detailed blog post "
             f"about '{topic}'. The blog should have a clear introduction, sections for each key point, "
             "and a conclusion. Format the output in Markdown, using headings and bullet points where appropriate."
+            f"{summary_section}"
         ),
         expected_output=(
             "A Markdown‑formatted blog post ready for publication on Notion."
@@ -185,30 +210,26 @@ def main(topic: str) -> None:
     # Assemble the crew. We run tasks sequentially so that the writer has access
     # to the researcher's output. The crew orchestrates the flow of information
     # between agents【289190495545497†L151-L163】.
-    crew = Crew(
-        agents=[researcher, writer],
-        tasks=[research_task, write_task],
-        process=Process.sequential,
-        verbose=False,
-    )
+    if research_summary:
+        crew = Crew(
+            agents=[writer],
+            tasks=[write_task],
+            process=Process.sequential,
+            verbose=False,
+        )
+        # No inputs: interpolation would trip over braces in the research summary.
+        result = kickoff(crew, "blog.write")
+    else:
+        crew = Crew(
+            agents=[researcher, writer],
+            tasks=[research_task, write_task],
+            process=Process.sequential,
+            verbose=False,
+        )
 
-    # Kick off the process. We inject the topic as an input, which CrewAI
-    # substitutes into task descriptions and agent roles.  Wrap this call in
-    # a try/except to handle common API and quota errors gracefully.  If an
-    # exception occurs, we emit a JSON error message and exit with a non‑zero
-    # code so the API route can return a 500.
-    try:
-        result = crew.kickoff(inputs={"topic": topic})
-    except Exception as e:
-        # Serialize the exception message into JSON.  Certain exceptions
-        # (e.g., OpenAI quota errors) originate from underlying libraries and
-        # contain useful details.
-        error_response = {
-            "error": f"Agent execution failed: {str(e)}"
-        }
-        print(json.dumps(error_response))
-        # Exit with a non‑zero status to signal failure to the caller.
-        sys.exit(1)
+        # Kick off the process. We inject the topic as an input, which CrewAI
+        # substitutes into task descriptions and agent roles.
+        result = kickoff(crew, "blog", inputs={"topic": topic})
 
     # The result contains the final output of the workflow. When using
     # CrewAI, this is typically a `CrewOutput` object. According to the
@@ -225,40 +246,37 @@ def main(topic: str) -> None:
         # Pydantic and JSON outputs before falling back to raw text【993581283242212†L444-L476】.
         blog_content = str(result)
 
+    remember("blog", topic, blog_content)
+    return blog_content
+
+
+def _post_title(topic: str) -> str:
+    """Title of the Notion page for ``topic``."""
+    # Notion requires a Title property on database items. We set it to the
+    # topic for clarity.
+    return topic.strip().capitalize() if topic.strip() else "New Blog Post"
+
+
+def queue_post(clients, notion_db_id: str, topic: str, blog_content: str) -> dict:
+    """Store the post in the Notion outbox; return ``{"status", "post_id", "title"}``."""
+    title_text = _post_title(topic)
+    post_id = enqueue(
+        topic,
+        title_text,
+        blog_content,
+        notion_db_id,
+        user_id=os.environ.get("AGENT_USER_ID"),
+    )
+    return {"status": "pending", "post_id": post_id, "title": title_text}
+
+
+def publish_post(clients, notion_db_id: str, topic: str, blog_content: str) -> dict:
+    """Create a Notion page for the post and return ``{"url", "title", "page_id"}``."""
     # Publish the blog to Notion. We'll create a new page in the specified
-    # database. Each line of the blog becomes a separate paragraph block.
-    notion = Client(auth=notion_token)
-    paragraphs = []  # type: List[dict]
-    for line in blog_content.splitlines():
-        line = line.strip()
-        if not line:
-            # Insert an empty paragraph to preserve spacing.
-            paragraphs.append(
-                {
-                    "object": "block",
-                    "type": "paragraph",
-                    "paragraph": {"rich_text": []},
-                }
-            )
-        else:
-            paragraphs.append(
-                {
-                    "object": "block",
-                    "type": "paragraph",
-                    "paragraph": {
-                        "rich_text": [
-                            {
-                                "type": "text",
-                                "text": {"content": line},
-                            }
-                        ],
-                    },
-                }
-            )
+    # database, converting the Markdown into Notion blocks.
+    notion = clients.notion()
 
-    # Use the first line or the topic itself as the title. Notion requires a
-    # Title property on database items. We set it to the topic for clarity.
-    title_text = topic.strip().capitalize() if topic.strip() else "New Blog Post"
+    title_text = _post_title(topic)
 
     # 1. 주제와 관련된 이미지를 검색합니다.
     image_url = fetch_image_url(topic)
@@ -277,31 +295,63 @@ def main(topic: str) -> None:
     if image_block:
         blog_blocks.insert(0, image_block)
 
-    page = notion.pages.create(
-        parent={"database_id": notion_db_id},
-        properties={
-            "Name": {
-                "title": [
-                    {
-                        "type": "text",
-                        "text": {"content": title_text},
-                    }
-                ]
-            }
-        },
-        children=blog_blocks,
-    )
+    with span("notion.pages.create", blocks=len(blog_blocks)):
+        page = notion.pages.create(
+            parent={"database_id": notion_db_id},
+            properties={
+                "Name": {
+                    "title": [
+                        {
+                            "type": "text",
+                            "text": {"content": title_text},
+                        }
+                    ]
+                }
+            },
+            children=blog_blocks,
+        )
     url = page.get("url")
 
-    # Output a JSON payload for the Node API route. We include the page URL and
-    # optionally the content for debugging. The Node route will parse this
-    # output and relay it to the frontend.
-    response = {
+    return {
         "url": url,
         "title": title_text,
+        "page_id": page.get("id"),
     }
+
+
+def main(topic: str) -> None:
+    """Entrypoint for blog generation and publication.
+
+    Args:
+        topic: The topic to research and write about.
+    """
+    clients, notion_db_id = _load_clients()
+
+    # Wrap generation in a try/except to handle common API and quota errors
+    # gracefully.  If an exception occurs, we emit a JSON error message and
+    # exit with a non‑zero code so the API route can return a 500.
+    try:
+        blog_content = generate_post(topic, clients)
+    except Exception as e:
+        # Serialize the exception message into JSON.  Certain exceptions
+        # (e.g., OpenAI quota errors) originate from underlying libraries and
+        # contain useful details.
+        error_response = {
+            "error": f"Agent execution failed: {str(e)}"
+        }
+        print(json.dumps(error_response))
+        # Exit with a non‑zero status to signal failure to the caller.
+        sys.exit(1)
+
+    # Persist the finished post before touching Notion so a publish failure
+    # can never lose it, then let a detached publisher deliver it.  The Node
+    # route relays this payload right away; the page URL can be fetched
+    # later via `notion_outbox.py status <post_id>` (/api/publish-status).
+    response = queue_post(clients, notion_db_id, topic, blog_content)
+    start_background_publisher()
     print(json.dumps(response))
-    
+
+
 def _markdown_to_notion_blocks(markdown_text: str) -> list:
     """Convert simple Markdown to Notion block format."""
     blocks = []
@@ -357,18 +407,112 @@ def _markdown_to_notion_blocks(markdown_text: str) -> list:
 
 def fetch_image_url(query: str) -> str | None:
     """DuckDuckGo를 이용해 첫 번째 이미지 URL을 가져옵니다."""
-    try:
-        with DDGS() as ddgs:
-            results = list(ddgs.images(query, max_results=1))
+    with span("image.search", query=query) as s:
+        try:
+            # 프로세스 전체에서 하나의 DDGS 세션을 재사용합니다.
+            results = intercept(
+                "ddgs.images",
+                request_key(query),
+                {"query": query},
+                lambda: list(shared_ddgs().images(query, max_results=1)),
+            )
             if results and len(results) > 0:
+                s.set("found", True)
                 return results[0]["image"]  # 직접 링크
-    except Exception:
-        pass
+        except Exception as e:
+            s.set("error", e)
+        s.set("found", False)
     return None
 
+def _read_topics(source: str) -> List[str]:
+    """Read one topic per line from a file path, or from stdin for ``-``."""
+    if source == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(source, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    # Blank lines and '#' comments are skipped so topic files can be annotated.
+    return [line.strip() for line in lines if line.strip() and not line.lstrip().startswith("#")]
+
+
+def run_batch(topics: List[str], concurrency: int) -> int:
+    """Generate and publish ``topics`` concurrently, streaming JSONL results.
+
+    All crews share one set of cached clients (one warm LLM, one search
+    result cache) and the process-wide LLM and Notion rate limiters
+    (``AGENT_LLM_RPM``, ``AGENT_NOTION_RPS``).  One JSON line is written to
+    stdout per topic as soon as it finishes, in completion order.
+
+    Returns:
+        The number of topics that failed.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    import threading
+
+    clients, notion_db_id = _load_clients()
+    output_lock = threading.Lock()
+
+    def run_one(topic: str) -> dict:
+        with span("blog.topic", topic=topic):
+            try:
+                blog_content = generate_post(topic, clients)
+            except Exception as e:
+                return {"topic": topic, "error": f"Agent execution failed: {str(e)}"}
+            try:
+                return dict(publish_post(clients, notion_db_id, topic, blog_content), topic=topic)
+            except Exception as e:
+                # Keep the article: hand it to the outbox for retried delivery.
+                sys.stderr.write(f"Notion publish failed for '{topic}', queued for retry: {e}\n")
+                return dict(queue_post(clients, notion_db_id, topic, blog_content), topic=topic)
+
+    failures = 0
+    queued = 0
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        # bind_context makes each topic's spans children of the batch span.
+        futures = [pool.submit(bind_context(run_one), topic) for topic in topics]
+        for future in as_completed(futures):
+            result = future.result()
+            if "error" in result:
+                failures += 1
+            elif result.get("status") == "pending":
+                queued += 1
+            with output_lock:
+                sys.stdout.write(json.dumps(result) + "\n")
+                sys.stdout.flush()
+    if queued:
+        start_background_publisher()
+    return failures
+
+
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        sys.stderr.write("Usage: python blog_agent.py <topic>\n")
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Research a topic, write a blog post and publish it to Notion."
+    )
+    parser.add_argument("topic", nargs="?", help="Topic of the blog post")
+    parser.add_argument(
+        "--batch",
+        metavar="FILE",
+        help="Read topics (one per line) from FILE, or from stdin when FILE is '-', "
+             "and write one JSON result line per topic",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=int(os.environ.get("BLOG_BATCH_CONCURRENCY", "4")),
+        help="Maximum number of topics generated at once in batch mode (default 4)",
+    )
+    args = parser.parse_args()
+
+    if args.batch:
+        batch_topics = _read_topics(args.batch)
+        with span("blog_agent", mode="batch", topics=len(batch_topics)):
+            batch_failures = run_batch(batch_topics, args.concurrency)
+        sys.exit(1 if batch_failures else 0)
+    if not args.topic:
+        sys.stderr.write("Usage: python blog_agent.py <topic>\n"
+                         "       python blog_agent.py --batch <file|-> [--concurrency N]\n")
         sys.exit(1)
-    topic_argument = sys.argv[1]
-    main(topic_argument)
\ No newline at end of file
+    with span("blog_agent", mode="single", topic=args.topic):
+        main(args.topic)
@@ -0,0 +1,297 @@
+"""
+cassette.py
+===========
+
+Record and replay the external interactions of an agent run.
+
+LLM output is nondeterministic, so two runs of the same workload differ in
+size and duration and before/after performance comparisons are noise.  In
+``record`` mode every LLM completion, every HTTP exchange sent through
+``http_transport`` (Serper, Notion) and every DuckDuckGo image lookup is
+appended to a cassette file together with its latency (credential headers
+and credential lookups are never written, see ``_SECRET_HEADERS``).  In ``replay`` mode
+the same calls are answered from the cassette without touching the
+network, optionally sleeping for the recorded latency, so the exact same
+workload can be re-run against a code change and compared on CPU, memory
+and wall time.
+
+Interactions are matched by a hash of the request (model and messages for
+LLM calls; method, URL and body for HTTP; the query for image search).
+Identical requests are served in recorded order.  When nothing matches,
+e.g. because a prompt now includes recalled memories that were not there
+while recording, the next unused interaction of the same kind is served
+instead and counted as a fallback; ``replay`` fails with ``CassetteMiss``
+only when the kind is exhausted.  HTTP exchanges are kinded by method and
+host (``http:POST:google.serper.dev``), so a fallback never answers a
+Notion request with a recorded search response.
+
+The cassette is a JSON Lines file and recording appends to it, so the
+detached Notion publisher can record into the same cassette; delete the
+file to start a new recording.
+
+Configuration (environment variables):
+
+    AGENT_CASSETTE_MODE     ``off`` (default), ``record`` or ``replay``.
+    AGENT_CASSETTE          Cassette path (default: python/.data/cassette.jsonl).
+    AGENT_CASSETTE_LATENCY  In replay: ``zero`` (default) to answer instantly,
+                            ``recorded`` to sleep for the recorded latency.
+
+Usage:
+    AGENT_CASSETTE_MODE=record python blog_agent.py "Topic"
+    AGENT_CASSETTE_MODE=replay python blog_agent.py "Topic"
+    python cassette.py stats [path]
+"""
+
+import atexit
+import base64
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Callable, Deque, Dict, List, Optional
+
+DEFAULT_CASSETTE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".data", "cassette.jsonl"
+)
+
+
+class CassetteMiss(RuntimeError):
+    """Raised in replay mode when the cassette has no answer for a request."""
+
+
+def mode() -> str:
+    value = os.environ.get("AGENT_CASSETTE_MODE", "off").lower()
+    return value if value in ("record", "replay") else "off"
+
+
+def active() -> bool:
+    return mode() != "off"
+
+
+def _cassette_path() -> str:
+    return os.environ.get("AGENT_CASSETTE") or DEFAULT_CASSETTE_PATH
+
+
+def request_key(*parts: object) -> str:
+    """Stable hash of the parts of a request that determine its response."""
+    payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """One cassette file, either being recorded or replayed."""
+
+    def __init__(self, path: str, mode: str) -> None:
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._by_key = defaultdict(deque)  # type: Dict[tuple, Deque[dict]]
+        self._by_kind = defaultdict(list)  # type: Dict[str, List[dict]]
+        self._cursor = defaultdict(int)  # type: Dict[str, int]
+        self.stats = defaultdict(lambda: {"recorded": 0, "replayed": 0, "fallbacks": 0})  # type: Dict[str, dict]
+        if mode == "replay":
+            self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            raise CassetteMiss(f"Cassette {self.path} does not exist; record one first")
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # line cut short by a killed recorder
+                entry["_used"] = False
+                self._by_key[(entry["kind"], entry["key"])].append(entry)
+                self._by_kind[entry["kind"]].append(entry)
+
+    def _take(self, kind: str, key: str) -> dict:
+        with self._lock:
+            matches = self._by_key.get((kind, key))
+            while matches:
+                entry = matches.popleft()
+                if not entry["_used"]:
+                    entry["_used"] = True
+                    return entry
+            entries = self._by_kind.get(kind, [])
+            while self._cursor[kind] < len(entries):
+                entry = entries[self._cursor[kind]]
+                self._cursor[kind] += 1
+                if not entry["_used"]:
+                    entry["_used"] = True
+                    self.stats[kind]["fallbacks"] += 1
+                    return entry
+        raise CassetteMiss(f"No recorded {kind} interaction left for request {key[:12]}")
+
+    def replay(self, kind: str, key: str) -> object:
+        entry = self._take(kind, key)
+        self.stats[kind]["replayed"] += 1
+        if os.environ.get("AGENT_CASSETTE_LATENCY", "zero").lower() == "recorded":
+            time.sleep(entry.get("latency_ms", 0) / 1000)
+        return entry["response"]
+
+    def record(self, kind: str, key: str, request: object, response: object, latency_ms: float) -> None:
+        line = json.dumps(
+            {
+                "kind": kind,
+                "key": key,
+                "request": request,
+                "response": response,
+                "latency_ms": round(latency_ms, 3),
+                "recorded_at": time.time(),
+            },
+            ensure_ascii=False,
+            default=str,
+        ) + "\n"
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+            self.stats[kind]["recorded"] += 1
+
+
+_cassette = None  # type: Optional[Cassette]
+_cassette_lock = threading.Lock()
+
+
+def current() -> Optional[Cassette]:
+    """The process-wide cassette for the configured mode, or None when off."""
+    global _cassette
+    if not active():
+        return None
+    with _cassette_lock:
+        if _cassette is None or _cassette.mode != mode() or _cassette.path != _cassette_path():
+            _cassette = Cassette(_cassette_path(), mode())
+            atexit.register(_report, _cassette)
+        return _cassette
+
+
+def intercept(kind: str, key: str, request: object, call: Callable[[], object],
+              encode: Callable[[object], object] = lambda r: r,
+              decode: Callable[[object], object] = lambda r: r) -> object:
+    """Run ``call`` through the cassette.
+
+    * off: just ``call()``.
+    * record: ``call()``, then append ``encode(result)`` with its latency.
+    * replay: return ``decode(recorded)`` without calling ``call``.
+
+    ``request`` is a JSON-serialisable summary stored for inspection only;
+    matching uses ``key``.  Failed calls are not recorded.
+    """
+    cassette = current()
+    if cassette is None:
+        return call()
+    if cassette.mode == "replay":
+        return decode(cassette.replay(kind, key))
+    start = time.perf_counter()
+    result = call()
+    cassette.record(kind, key, request, encode(result), (time.perf_counter() - start) * 1000)
+    return result
+
+
+# -- httpx -------------------------------------------------------------------
+
+# Request headers that carry credentials are never written to a cassette
+# (``apikey`` is Supabase's).
+_SECRET_HEADERS = ("authorization", "x-api-key", "apikey", "cookie")
+
+# Credential lookups are passed through without recording, because their
+# response bodies are secrets (the Supabase ``user_settings`` row holds the
+# user's Notion token) and base64 is not redaction.  In replay they still go
+# to the network.
+_UNRECORDED_PATHS = ("/rest/v1/user_settings", "/auth/v1/")
+
+
+def wrap_transport(transport):
+    """Return ``transport`` wrapped for recording/replay when a cassette is active."""
+    if not active():
+        return transport
+    import httpx
+
+    class CassetteTransport(httpx.BaseTransport):
+        """Records or replays every exchange sent through the wrapped transport."""
+
+        def __init__(self, inner) -> None:
+            self._inner = inner
+
+        def handle_request(self, request: httpx.Request) -> httpx.Response:
+            if request.url.path.startswith(_UNRECORDED_PATHS):
+                return self._inner.handle_request(request)
+            body = request.read()
+            key = request_key(request.method, str(request.url), hashlib.sha256(body).hexdigest())
+            summary = {
+                "method": request.method,
+                "url": str(request.url),
+                "headers": {
+                    k: v for k, v in request.headers.items() if k.lower() not in _SECRET_HEADERS
+                },
+                "body": body[:2000].decode("utf-8", "replace"),
+            }
+
+            def send() -> httpx.Response:
+                response = self._inner.handle_request(request)
+                response.read()
+                return response
+
+            def encode(response: httpx.Response) -> dict:
+                return {
+                    "status": response.status_code,
+                    "headers": {"content-type": response.headers.get("content-type", "")},
+                    "body_b64": base64.b64encode(response.content).decode("ascii"),
+                }
+
+            def decode(recorded: dict) -> httpx.Response:
+                return httpx.Response(
+                    recorded["status"],
+                    headers=recorded.get("headers", {}),
+                    content=base64.b64decode(recorded["body_b64"]),
+                    request=request,
+                )
+
+            kind = f"http:{request.method}:{request.url.host}"
+            return intercept(kind, key, summary, send, encode, decode)
+
+        def close(self) -> None:
+            self._inner.close()
+
+    return CassetteTransport(transport)
+
+
+def _report(cassette: Cassette) -> None:
+    if any(s["fallbacks"] for s in cassette.stats.values()):
+        sys.stderr.write(
+            f"Cassette {cassette.path}: some requests did not match exactly and were served "
+            f"in recorded order: {json.dumps(dict(cassette.stats))}\n"
+        )
+
+
+def _summarize(path: str) -> dict:
+    kinds = defaultdict(lambda: {"interactions": 0, "latency_ms": 0.0})  # type: Dict[str, dict]
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            kinds[entry["kind"]]["interactions"] += 1
+            kinds[entry["kind"]]["latency_ms"] += entry.get("latency_ms", 0)
+    return {kind: {"interactions": s["interactions"], "latency_ms": round(s["latency_ms"], 1)}
+            for kind, s in kinds.items()}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) in (2, 3) and sys.argv[1] == "stats":
+        target = sys.argv[2] if len(sys.argv) == 3 else _cassette_path()
+        if not os.path.exists(target):
+            print(json.dumps({"error": f"No cassette at {target}"}))
+            sys.exit(1)
+        print(json.dumps(_summarize(target)))
+    else:
+        sys.stderr.write("Usage: python cassette.py stats [path]\n")
+        sys.exit(1)
@@ -0,0 +1,263 @@
+"""
+client_cache.py
+===============
+
+TTL-bounded cache of per-user configured clients for the agent runtime.
+
+Building the CrewAI ``LLM``, the Serper search tool and the Notion ``Client``
+is not free (imports, validation, and the first request of every client pays
+for DNS/TCP/TLS).  This module keeps the configured clients for each user
+and reuses them for as long as the user's settings stay the same, so that a
+long-lived runtime only pays that cost once per user: ``blog_agent.py
+--batch``, and the detached Notion outbox publisher, which serves the queued
+posts of many users from one process.  A one-shot agent run (one process
+per API request) goes through the same code path and simply sees a cold
+cache.
+
+Entries are keyed by the user id *and* a hash of the settings, so a changed
+API key can never be served from a stale entry.  In addition, entries expire
+after ``AGENT_CLIENT_CACHE_TTL`` seconds, and saving settings through
+``/api/user-settings`` invalidates them explicitly by touching a per-user
+stamp file that every process checks before using a cached entry.
+
+Configuration (environment variables):
+
+    AGENT_CLIENT_CACHE_TTL      Entry lifetime in seconds (default 900).
+    AGENT_CLIENT_CACHE_DIR      Directory holding the invalidation stamps
+                                (default: python/.data/client_cache).
+
+Usage:
+    from client_cache import get_clients, settings_from_env
+    clients = get_clients(user_id, settings_from_env())
+    llm = clients.llm(temperature=0.5)
+
+    # Invalidate after a settings change (also used by the API route):
+    python client_cache.py invalidate <user_id>
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from http_transport import configure_litellm, new_http_client
+from cassette import intercept, request_key
+from rate_limit import RateLimiter, get_limiter
+from scheduler import report_llm_usage
+from tracing import span
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data", "client_cache")
+DEFAULT_TTL_SECONDS = 900
+# Upper bound on cached users per process; least recently used are dropped.
+MAX_ENTRIES = 64
+
+# Environment variable -> settings key.  The user_settings columns use the
+# same names in lowercase, which is what the API routes inject.
+_SETTINGS_ENV = {
+    "OPENAI_API_KEY": "openai_api_key",
+    "OPENAI_MODEL": "openai_model",
+    "OPENAI_BASE_URL": "openai_base_url",
+    "GEMINI_API_KEY": "gemini_api_key",
+    "GEMINI_MODEL": "gemini_model",
+    "GEMINI_BASE_URL": "gemini_base_url",
+    "SERPER_API_KEY": "serper_api_key",
+    "NOTION_TOKEN": "notion_token",
+    "NOTION_DATABASE_ID": "notion_database_id",
+}
+
+
+def settings_from_env(env: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Collect the client-relevant settings from the environment."""
+    env = os.environ if env is None else env
+    return {key: env[name] for name, key in _SETTINGS_ENV.items() if env.get(name)}
+
+
+def settings_hash(settings: Dict[str, str]) -> str:
+    """Stable digest of a settings mapping (never stored alongside the secrets)."""
+    payload = json.dumps(settings, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+def _stamp_path(user_id: str) -> str:
+    root = os.environ.get("AGENT_CLIENT_CACHE_DIR") or DEFAULT_CACHE_DIR
+    key = hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:32]
+    return os.path.join(root, f"{key}.stamp")
+
+
+def _stamp_time(user_id: str) -> float:
+    try:
+        return os.path.getmtime(_stamp_path(user_id))
+    except OSError:
+        return 0.0
+
+
+def _rate_limited(llm, limiter: RateLimiter):
+    """Make every ``llm.call`` wait on ``limiter`` first, inside an ``llm.call`` span.
+
+    The wrapper is installed on the instance so that CrewAI keeps seeing its
+    own ``LLM`` type (which may be a provider-specific subclass).  Calls go
+    through the cassette, so a replayed completion skips both the limiter
+    and the provider.
+    """
+    original_call = llm.call
+    model = getattr(llm, "model", None)
+
+    def call(*args, **kwargs):
+        messages = args[0] if args else kwargs.get("messages")
+
+        def send():
+            s.set("rate_limit_wait_ms", round(limiter.acquire() * 1000, 1))
+            response = original_call(*args, **kwargs)
+            report_llm_usage(messages, response)
+            return response
+
+        with span("llm.call", model=model) as s:
+            result = intercept(
+                "llm",
+                request_key(model, messages),
+                {"model": model, "messages": messages},
+                send,
+            )
+            s.set("response_chars", len(result) if isinstance(result, str) else None)
+            return result
+
+    object.__setattr__(llm, "call", call)
+    return llm
+
+
+class AgentClients:
+    """Configured clients for one user and one version of their settings.
+
+    The LLM is created lazily per temperature/default-model combination;
+    the search tool and Notion client are created on first access.
+    """
+
+    def __init__(self, settings: Dict[str, str]) -> None:
+        self.settings = settings
+        self._llms = {}  # type: Dict[Tuple[Optional[float], str], object]
+        self._search_tool = None
+        self._search_tool_built = False
+        self._notion = None
+        self._lock = threading.Lock()
+
+    def llm(self, temperature: Optional[float] = None, gemini_model: str = "gemini/gemini-pro"):
+        """Return a CrewAI ``LLM``, preferring Gemini when its key is configured.
+
+        Args:
+            temperature: Sampling temperature, or None for the provider default.
+            gemini_model: Model used when ``GEMINI_MODEL`` is not set.
+        """
+        key = (temperature, gemini_model)
+        with self._lock:
+            if key not in self._llms:
+                self._llms[key] = self._build_llm(temperature, gemini_model)
+            return self._llms[key]
+
+    def _build_llm(self, temperature: Optional[float], gemini_model: str):
+        return _rate_limited(self._build_raw_llm(temperature, gemini_model), get_limiter("llm"))
+
+    def _build_raw_llm(self, temperature: Optional[float], gemini_model: str):
+        from crewai import LLM
+
+        configure_litellm()
+        s = self.settings
+        kwargs = {}
+        if temperature is not None:
+            kwargs["temperature"] = temperature
+        if s.get("gemini_api_key"):
+            return LLM(
+                model=s.get("gemini_model", gemini_model),
+                api_key=s["gemini_api_key"],
+                base_url=s.get("gemini_base_url"),
+                **kwargs,
+            )
+        if not s.get("openai_api_key"):
+            raise RuntimeError(
+                "No language model API key provided. Set OPENAI_API_KEY or GEMINI_API_KEY."
+            )
+        return LLM(
+            model=s.get("openai_model", "gpt-4o"),
+            api_key=s["openai_api_key"],
+            base_url=s.get("openai_base_url"),
+            **kwargs,
+        )
+
+    def search_tool(self):
+        """Return the Serper search tool, or None without a key or crewai."""
+        with self._lock:
+            if not self._search_tool_built:
+                self._search_tool_built = True
+                from search_tools import build_search_tool
+
+                self._search_tool = build_search_tool(self.settings.get("serper_api_key"))
+            return self._search_tool
+
+    def notion(self):
+        """Return a Notion ``Client`` for the configured integration token."""
+        with self._lock:
+            if self._notion is None:
+                token = self.settings.get("notion_token")
+                if not token:
+                    raise RuntimeError("NOTION_TOKEN must be set to publish to Notion.")
+                from notion_client import Client
+
+                # The Notion client rewrites base_url/headers on the httpx
+                # client it is given, so it gets its own client object; the
+                # connections underneath still come from the shared pool.
+                # Every Notion request waits on the process-wide limiter.
+                limiter = get_limiter("notion")
+                http_client = new_http_client(
+                    event_hooks={"request": [lambda request: limiter.acquire()]}
+                )
+                self._notion = Client(auth=token, client=http_client)
+            return self._notion
+
+
+_cache = OrderedDict()  # type: OrderedDict[Tuple[str, str], Tuple[float, AgentClients]]
+_cache_lock = threading.Lock()
+
+
+def get_clients(user_id: Optional[str], settings: Dict[str, str]) -> AgentClients:
+    """Return cached clients for ``user_id`` and ``settings``, building them if needed."""
+    user_key = user_id or "anonymous"
+    key = (user_key, settings_hash(settings))
+    ttl = float(os.environ.get("AGENT_CLIENT_CACHE_TTL", DEFAULT_TTL_SECONDS))
+    now = time.time()
+    invalidated_at = _stamp_time(user_key)
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            created, clients = entry
+            if now - created < ttl and created > invalidated_at:
+                _cache.move_to_end(key)
+                return clients
+            del _cache[key]
+        clients = AgentClients(settings)
+        _cache[key] = (now, clients)
+        while len(_cache) > MAX_ENTRIES:
+            _cache.popitem(last=False)
+        return clients
+
+
+def invalidate(user_id: str) -> None:
+    """Drop every cached entry for ``user_id`` in this and all other processes."""
+    with _cache_lock:
+        for key in [k for k in _cache if k[0] == user_id]:
+            del _cache[key]
+    path = _stamp_path(user_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a", encoding="utf-8"):
+        pass
+    os.utime(path, None)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "invalidate":
+        sys.stderr.write("Usage: python client_cache.py invalidate <user_id>\n")
+        sys.exit(1)
+    invalidate(sys.argv[2])
+    print(json.dumps({"invalidated": sys.argv[2]}))
@@ -0,0 +1,309 @@
+"""
+code_checks.py
+==============
+
+Local static checks for the files produced by the web builder's coder.
+
+The checks are intentionally cheap and dependency-free (no Node toolchain
+is needed) so they can run between ``code_task`` and ``review_task`` on
+every build:
+
+* JSON files must parse; ``package.json`` must name the project, define the
+  ``dev``/``build``/``start`` scripts and depend on ``next``, ``react`` and
+  ``react-dom``.
+* JS/TS/JSX/TSX files must have balanced brackets, strings, template
+  literals and comments (a structural parse, not a full grammar check).
+* Relative and ``@/`` imports must resolve to a file in the generated
+  ``files`` map; bare imports must be declared in ``package.json`` (or be a
+  Node built-in).
+* Empty files flag a file for review as well, and so do leftover Markdown
+  code fences and TODO/FIXME markers in script and JSON files (Markdown and
+  other text files may legitimately contain both).
+
+Only files with problems are sent to the reviewer LLM; everything else is
+written out untouched.
+
+Usage:
+    from code_checks import check_files
+    problems = check_files(files)   # {path: ["problem", ...]} for bad files
+"""
+
+import json
+import posixpath
+import re
+from typing import Dict, List, Optional, Set
+
+SCRIPT_EXTENSIONS = (".js", ".jsx", ".ts", ".tsx", ".mjs", ".cjs")
+# Extensions tried, in order, when an import omits one (as bundlers do).
+RESOLVE_SUFFIXES = (
+    "", ".ts", ".tsx", ".js", ".jsx", ".mjs", ".cjs", ".json",
+    "/index.ts", "/index.tsx", "/index.js", "/index.jsx",
+)
+REQUIRED_SCRIPTS = ("dev", "build", "start")
+REQUIRED_DEPENDENCIES = ("next", "react", "react-dom")
+NODE_BUILTINS = frozenset(
+    "assert buffer child_process crypto events fs http https os path process querystring "
+    "stream string_decoder timers url util zlib".split()
+)
+
+_IMPORT_RE = re.compile(
+    r"""(?:^|[\s;])(?:import|export)\s+(?:type\s+)?(?:[\w*{}\s,$]+?\s+from\s+)?["']([^"'\n]+)["']"""
+    r"""|\brequire\(\s*["']([^"'\n]+)["']\s*\)"""
+    r"""|\bimport\(\s*["']([^"'\n]+)["']\s*\)""",
+    re.MULTILINE,
+)
+_BRACKETS = {")": "(", "]": "[", "}": "{"}
+# A '/' after one of these characters starts a regex literal, not a division.
+# '<' and '>' are left out so JSX closing tags (``</p>``) are not mistaken
+# for regex literals.
+_REGEX_PRECEDERS = set("(,=:[!&|?{};+-*%~^")
+
+
+def normalize_path(path: str) -> str:
+    """Normalise a generated file path to a relative path inside the project.
+
+    Leading ``./`` and ``/`` are dropped and ``..`` cannot climb above the
+    project root; dotfiles such as ``.env`` keep their name.
+    """
+    return posixpath.normpath("/" + path.replace("\\", "/")).lstrip("/")
+
+
+def _check_structure(source: str, jsx: bool) -> Optional[str]:
+    """Return a description of the first structural error, or None.
+
+    In JSX files an unterminated quote on a single line is treated as text
+    (``<p>Don't</p>``) rather than an error, since JS string literals
+    cannot span lines anyway.
+    """
+    stack = []  # type: List[tuple]
+    i, n, line = 0, len(source), 1
+    last_significant = ""
+    while i < n:
+        ch = source[i]
+        if ch == "\n":
+            line += 1
+            i += 1
+            continue
+        if ch in " \t\r":
+            i += 1
+            continue
+        nxt = source[i + 1] if i + 1 < n else ""
+        if ch == "/" and nxt == "/":
+            end = source.find("\n", i)
+            i = n if end == -1 else end
+            continue
+        if ch == "/" and nxt == "*":
+            end = source.find("*/", i + 2)
+            if end == -1:
+                return f"line {line}: unterminated block comment"
+            line += source.count("\n", i, end)
+            i = end + 2
+            continue
+        if ch in "'\"":
+            j = i + 1
+            while j < n and source[j] != ch and source[j] != "\n":
+                j += 2 if source[j] == "\\" else 1
+            if j >= n or source[j] == "\n":
+                if not jsx:
+                    return f"line {line}: unterminated string literal"
+                i += 1
+                continue
+            i = j + 1
+            last_significant = ch
+            continue
+        if ch == "`":
+            # Template literal; ${...} expressions are handled by pushing a
+            # marker so the matching '}' returns to template mode.
+            stack.append(("`", line))
+            i += 1
+            i, line, error = _skip_template(source, i, line, stack)
+            if error:
+                return error
+            last_significant = "`"
+            continue
+        if ch == "/" and (last_significant in _REGEX_PRECEDERS or last_significant == ""):
+            j = i + 1
+            in_class = False
+            while j < n and source[j] != "\n":
+                c = source[j]
+                if c == "\\":
+                    j += 2
+                    continue
+                if c == "[":
+                    in_class = True
+                elif c == "]":
+                    in_class = False
+                elif c == "/" and not in_class:
+                    break
+                j += 1
+            if j < n and source[j] == "/":
+                i = j + 1
+                last_significant = "/"
+                continue
+        if ch in "([{":
+            stack.append((ch, line))
+        elif ch in ")]}":
+            if not stack:
+                return f"line {line}: unexpected '{ch}'"
+            opener, opened_at = stack.pop()
+            if opener == "${" and ch == "}":
+                # End of a template expression: continue the template text.
+                i += 1
+                i, line, error = _skip_template(source, i, line, stack)
+                if error:
+                    return error
+                last_significant = "`"
+                continue
+            if opener != _BRACKETS[ch]:
+                return f"line {line}: '{ch}' does not match '{opener}' opened on line {opened_at}"
+        last_significant = ch
+        i += 1
+    if stack:
+        opener, opened_at = stack[-1]
+        if opener in ("`", "${"):
+            return f"line {opened_at}: unterminated template literal"
+        return f"line {opened_at}: '{opener}' is never closed"
+    return None
+
+
+def _skip_template(source: str, i: int, line: int, stack: list) -> tuple:
+    """Scan template text from ``i``; return ``(index, line, error)``.
+
+    Stops after the closing backtick (popping its marker) or after ``${``
+    (pushing a ``${`` marker for the expression).
+    """
+    n = len(source)
+    while i < n:
+        c = source[i]
+        if c == "\\":
+            i += 2
+            continue
+        if c == "\n":
+            line += 1
+        elif c == "`":
+            stack.pop()
+            return i + 1, line, None
+        elif c == "$" and i + 1 < n and source[i + 1] == "{":
+            stack.append(("${", line))
+            return i + 2, line, None
+        i += 1
+    return i, line, f"line {stack[-1][1]}: unterminated template literal"
+
+
+def _imports(source: str) -> List[str]:
+    return [next(g for g in m.groups() if g) for m in _IMPORT_RE.finditer(source)]
+
+
+def _package_name(specifier: str) -> str:
+    parts = specifier.split("/")
+    if specifier.startswith("@") and len(parts) > 1:
+        return "/".join(parts[:2])
+    return parts[0]
+
+
+def _resolves(target: str, paths: Set[str]) -> bool:
+    return any(normalize_path(target + suffix) in paths for suffix in RESOLVE_SUFFIXES)
+
+
+def _check_package_json(data: object) -> List[str]:
+    if not isinstance(data, dict):
+        return ["package.json must contain a JSON object"]
+    problems = []
+    if not isinstance(data.get("name"), str) or not data.get("name"):
+        problems.append("package.json: missing 'name'")
+    scripts = data.get("scripts") if isinstance(data.get("scripts"), dict) else {}
+    for script in REQUIRED_SCRIPTS:
+        if script not in scripts:
+            problems.append(f"package.json: missing script '{script}'")
+    deps = {}  # type: Dict[str, object]
+    for section in ("dependencies", "devDependencies"):
+        value = data.get(section, {})
+        if not isinstance(value, dict):
+            problems.append(f"package.json: '{section}' must be an object")
+            continue
+        for name, version in value.items():
+            if not isinstance(version, str) or not version.strip():
+                problems.append(f"package.json: invalid version for '{name}'")
+        deps.update(value)
+    for dep in REQUIRED_DEPENDENCIES:
+        if dep not in deps:
+            problems.append(f"package.json: missing dependency '{dep}'")
+    return problems
+
+
+def _declared_packages(files: Dict[str, str]) -> Optional[Set[str]]:
+    """Package names declared in the generated package.json, or None if unusable."""
+    source = files.get("package.json")
+    if source is None:
+        return None
+    try:
+        data = json.loads(source)
+    except ValueError:
+        return None
+    declared = set()  # type: Set[str]
+    for section in ("dependencies", "devDependencies", "peerDependencies"):
+        value = data.get(section) if isinstance(data, dict) else None
+        if isinstance(value, dict):
+            declared.update(value)
+    return declared
+
+
+def check_file(path: str, source: str, paths: Set[str], declared: Optional[Set[str]]) -> List[str]:
+    """Return the problems found in one file (empty when it is clean)."""
+    problems = []
+    if not source.strip():
+        return ["file is empty"]
+    if path.endswith(SCRIPT_EXTENSIONS + (".json",)):
+        if source.lstrip().startswith("```") or "\n```" in source:
+            problems.append("contains Markdown code fences")
+        if re.search(r"\b(TODO|FIXME)\b", source):
+            problems.append("contains TODO/FIXME markers")
+
+    if path.endswith(".json"):
+        try:
+            data = json.loads(source)
+        except ValueError as e:
+            return problems + [f"invalid JSON: {e}"]
+        if path == "package.json":
+            problems.extend(_check_package_json(data))
+        return problems
+
+    if not path.endswith(SCRIPT_EXTENSIONS):
+        return problems
+
+    # Next.js projects commonly put JSX in plain .js files too.
+    error = _check_structure(source, jsx=not path.endswith((".ts", ".mjs", ".cjs")))
+    if error:
+        problems.append(f"syntax: {error}")
+
+    base_dir = posixpath.dirname(path)
+    for specifier in _imports(source):
+        if specifier.startswith("."):
+            target = posixpath.join(base_dir, specifier)
+        elif specifier.startswith("@/"):
+            target = specifier[2:]
+        else:
+            package = _package_name(specifier)
+            bare = package[5:] if package.startswith("node:") else package
+            if declared is not None and package not in declared and bare not in NODE_BUILTINS:
+                problems.append(f"import '{specifier}': package '{package}' is not in package.json")
+            continue
+        if not _resolves(target, paths):
+            problems.append(f"import '{specifier}' does not resolve to a generated file")
+    return problems
+
+
+def check_files(files: Dict[str, str]) -> Dict[str, List[str]]:
+    """Check every generated file; return ``{path: problems}`` for the failing ones."""
+    normalized = {normalize_path(p): src for p, src in files.items()}
+    paths = set(normalized)
+    declared = _declared_packages(normalized)
+    report = {}  # type: Dict[str, List[str]]
+    for path, source in files.items():
+        if not isinstance(source, str):
+            report[path] = ["file content is not a string"]
+            continue
+        problems = check_file(normalize_path(path), source, paths, declared)
+        if problems:
+            report[path] = problems
+    return report
@@ -14,6 +14,11 @@ The script expects environment variables to be set:
     OPENAI_API_KEY or GEMINI_API_KEY
     OPENAI_MODEL or GEMINI_MODEL
 
+Optional:
+    ANALYSIS_SAMPLE_TOKEN_BUDGET   Token budget for the representative row
+                                   sample shown to the agents (default 600,
+                                   0 disables the sample).
+
 """
 
 import json
@@ -25,6 +30,11 @@ from typing import Dict, Any, List
 import base64
 import io
 
+from client_cache import get_clients, settings_from_env
+from memory_index import recall, remember
+from row_sampler import sample_representative_rows
+from tracing import kickoff, span
+
 # Load environment variables
 try:
     from dotenv import load_dotenv
@@ -35,7 +45,7 @@ except Exception:
 def main(analysis_request: str) -> None:
     """Entrypoint for data analysis workflow."""
     try:
-        from crewai import Agent, Task, Crew, Process, LLM
+        from crewai import Agent, Task, Crew, Process
     except ImportError as e:
         sys.stderr.write(
             "Required libraries are missing. Please install crewai via pip.\n"
@@ -43,28 +53,37 @@ def main(analysis_request: str) -> None:
         sys.stderr.flush()
         raise e
 
-    # Load environment variables
-    openai_key = os.environ.get("OPENAI_API_KEY")
-    openai_model = os.environ.get("OPENAI_MODEL", "gpt-4o")
-    gemini_key = os.environ.get("GEMINI_API_KEY")
-    gemini_model = os.environ.get("GEMINI_MODEL", "gemini/gemini-2.5-pro")
-
-    # Configure LLM
-    if gemini_key:
-        llm = LLM(
-            model=gemini_model,
-            api_key=gemini_key,
-        )
-    elif openai_key:
-        llm = LLM(
-            model=openai_model,
-            api_key=openai_key,
-        )
-    else:
+    # Configure LLM (see client_cache)
+    settings = settings_from_env()
+    if not settings.get("gemini_api_key") and not settings.get("openai_api_key"):
         raise RuntimeError("Either OPENAI_API_KEY or GEMINI_API_KEY must be set.")
+    clients = get_clients(os.environ.get("AGENT_USER_ID"), settings)
+    llm = clients.llm(gemini_model="gemini/gemini-2.5-pro")
 
     # Create sample data for demonstration
     sample_data = create_sample_data()
+
+    # Give the agents a handful of real rows (strata, outliers, time range
+    # boundaries) alongside the aggregate summary.  The sample is capped by a
+    # token budget so the prompt cost does not grow with the dataset.
+    try:
+        sample_budget = int(os.environ.get("ANALYSIS_SAMPLE_TOKEN_BUDGET", "600"))
+    except ValueError:
+        # A bad value only costs us the custom budget, not the analysis.
+        sys.stderr.write("Ignoring invalid ANALYSIS_SAMPLE_TOKEN_BUDGET; using 600\n")
+        sample_budget = 600
+    row_sample = ""
+    if sample_budget > 0:
+        row_sample = sample_representative_rows(
+            sample_data['dataframe'], token_budget=sample_budget
+        )
+    row_sample_section = (
+        f"Representative Rows:\n{row_sample}\n\n" if row_sample else ""
+    )
+
+    # Related findings from this user's previous runs, within a fixed budget.
+    memory_context = recall("data", analysis_request)
+    memory_section = f"{memory_context}\n\n" if memory_context else ""
     
     # Define agents
     data_explorer = Agent(
@@ -106,11 +125,14 @@ def main(analysis_request: str) -> None:
         description=(
             f"Analyze the following dataset based on the request: '{analysis_request}'\n\n"
             f"Dataset Summary:\n{sample_data['summary']}\n\n"
+            f"{row_sample_section}"
+            f"{memory_section}"
             "Perform initial data exploration including:\n"
             "- Data structure and types\n"
             "- Missing values and data quality\n"
             "- Basic statistics and distributions\n"
-            "- Potential data issues or anomalies"
+            "- Potential data issues or anomalies (check the representative rows, if given, "
+            "for row-level evidence)"
         ),
         expected_output="A comprehensive data exploration report with key findings and observations.",
         agent=data_explorer,
@@ -150,7 +172,8 @@ def main(analysis_request: str) -> None:
 
     # Execute analysis
     try:
-        result = crew.kickoff()
+        result = kickoff(crew, "data.analysis")
+        remember("data", analysis_request, str(result))
         
         # Create analysis report
         analysis_report = {
@@ -270,4 +293,5 @@ if __name__ == "__main__":
         sys.exit(1)
     
     topic_argument = sys.argv[1]
-    main(topic_argument) 
\ No newline at end of file
+    with span("data_analysis_agent", request=topic_argument):
+        main(topic_argument) 
\ No newline at end of file
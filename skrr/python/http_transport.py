@@ -0,0 +1,204 @@
+"""
+http_transport.py
+=================
+
+One shared, pooled HTTP transport for every outbound client of the agents.
+
+Without it, LiteLLM, the Serper search tool and the Notion client each open
+their own connections, so every small request a crew makes pays for DNS,
+TCP and TLS again.  This module owns a single ``httpx`` transport with a
+keep-alive connection pool per host (HTTP/2 when the ``h2`` package is
+installed) and hands out lightweight ``httpx.Client`` objects that share
+it.  Closing one of those clients does not close the shared pool.
+
+Configuration (environment variables):
+
+    AGENT_HTTP_MAX_CONNECTIONS     Total connections across all hosts (default 100).
+    AGENT_HTTP_MAX_KEEPALIVE       Idle keep-alive connections kept open (default 20).
+    AGENT_HTTP_KEEPALIVE_EXPIRY    Seconds an idle connection is kept (default 30).
+    AGENT_HTTP_TIMEOUT             Read/write/pool timeout in seconds (default 60).
+    AGENT_HTTP_CONNECT_TIMEOUT     Connect timeout in seconds (default 10).
+    AGENT_HTTP2                    "auto" (default), "1" or "0".
+    AGENT_HTTP_STATS               When "1", print pool statistics to stderr at exit.
+
+Usage:
+    from http_transport import new_http_client, pool_stats
+    with new_http_client(base_url="https://google.serper.dev") as client:
+        client.post("/search", json={"q": "..."})
+    print(pool_stats())
+"""
+
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Optional
+
+import httpx
+
+from cassette import wrap_transport
+
+_lock = threading.Lock()
+_transport = None  # type: Optional["_PooledTransport"]
+_ddgs = threading.local()
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+def _http2_enabled() -> bool:
+    setting = os.environ.get("AGENT_HTTP2", "auto").lower()
+    if setting in ("0", "false", "no"):
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        if setting in ("1", "true", "yes"):
+            sys.stderr.write("AGENT_HTTP2 is enabled but the 'h2' package is missing; using HTTP/1.1\n")
+        return False
+    return True
+
+
+def default_timeout() -> httpx.Timeout:
+    """Timeouts from the environment, shared by every client built here."""
+    return httpx.Timeout(
+        _env_float("AGENT_HTTP_TIMEOUT", 60),
+        connect=_env_float("AGENT_HTTP_CONNECT_TIMEOUT", 10),
+    )
+
+
+class _PooledTransport(httpx.BaseTransport):
+    """Shared connection pool that records per-host request statistics."""
+
+    def __init__(self) -> None:
+        self.http2 = _http2_enabled()
+        self.limits = httpx.Limits(
+            max_connections=int(_env_float("AGENT_HTTP_MAX_CONNECTIONS", 100)),
+            max_keepalive_connections=int(_env_float("AGENT_HTTP_MAX_KEEPALIVE", 20)),
+            keepalive_expiry=_env_float("AGENT_HTTP_KEEPALIVE_EXPIRY", 30),
+        )
+        self._inner = httpx.HTTPTransport(http2=self.http2, limits=self.limits, retries=1)
+        self._stats_lock = threading.Lock()
+        self._hosts = defaultdict(lambda: {"requests": 0, "errors": 0, "seconds": 0.0})  # type: Dict[str, dict]
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        start = time.perf_counter()
+        try:
+            response = self._inner.handle_request(request)
+        except Exception:
+            with self._stats_lock:
+                self._hosts[host]["errors"] += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                stats = self._hosts[host]
+                stats["requests"] += 1
+                stats["seconds"] += elapsed
+        return response
+
+    def close(self) -> None:
+        # Clients built on the shared transport must not tear down the pool
+        # for everyone else; the pool is closed once at interpreter exit.
+        pass
+
+    def shutdown(self) -> None:
+        self._inner.close()
+
+    def stats(self) -> dict:
+        pool = getattr(self._inner, "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        open_by_host = defaultdict(lambda: {"open": 0, "idle": 0})  # type: Dict[str, dict]
+        for conn in connections:
+            origin = getattr(conn, "_origin", None)
+            host = origin.host.decode("ascii", "replace") if origin is not None else "?"
+            open_by_host[host]["open"] += 1
+            if conn.is_idle():
+                open_by_host[host]["idle"] += 1
+        with self._stats_lock:
+            hosts = {
+                host: {
+                    "requests": s["requests"],
+                    "errors": s["errors"],
+                    "avg_ms": round(1000 * s["seconds"] / s["requests"], 1) if s["requests"] else 0.0,
+                    **open_by_host.get(host, {"open": 0, "idle": 0}),
+                }
+                for host, s in self._hosts.items()
+            }
+        return {
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "open_connections": len(connections),
+            "hosts": hosts,
+        }
+
+
+def shared_transport() -> _PooledTransport:
+    """Return the process-wide pooled transport, creating it on first use."""
+    global _transport
+    with _lock:
+        if _transport is None:
+            _transport = _PooledTransport()
+            atexit.register(_shutdown)
+        return _transport
+
+
+def new_http_client(record: bool = True, **kwargs) -> httpx.Client:
+    """Return an ``httpx.Client`` that sends through the shared pool.
+
+    Keyword arguments are passed to ``httpx.Client`` (base_url, headers, ...);
+    the timeout defaults to the configured one.  When a cassette is active
+    (see ``cassette.py``) the exchanges are recorded or replayed, unless
+    ``record`` is false, which credential lookups use to stay out of it.
+    """
+    kwargs.setdefault("timeout", default_timeout())
+    transport = shared_transport()
+    return httpx.Client(transport=wrap_transport(transport) if record else transport, **kwargs)
+
+
+def configure_litellm() -> None:
+    """Route LiteLLM's synchronous provider calls through the shared pool."""
+    try:
+        import litellm  # type: ignore
+    except ImportError:
+        return
+    if getattr(litellm, "client_session", None) is None:
+        # Not new_http_client(): LLM completions are recorded/replayed at the
+        # llm.call level (client_cache), not as raw HTTP exchanges.
+        litellm.client_session = httpx.Client(transport=shared_transport(), timeout=default_timeout())
+
+
+def shared_ddgs():
+    """Return the calling thread's reused DDGS instance for image search.
+
+    DDGS uses its own HTTP client (primp) that cannot be pointed at the httpx
+    pool, so the best we can do is keep an instance, and with it its session,
+    alive and apply the configured timeout.  DDGS is not safe to share across
+    threads, so batch workers each get their own.
+    """
+    instance = getattr(_ddgs, "instance", None)
+    if instance is None:
+        from ddgs import DDGS
+
+        instance = _ddgs.instance = DDGS(timeout=int(_env_float("AGENT_HTTP_TIMEOUT", 60)))
+    return instance
+
+
+def pool_stats() -> dict:
+    """Return connection pool and per-host request statistics."""
+    if _transport is None:
+        return {"open_connections": 0, "hosts": {}}
+    return _transport.stats()
+
+
+def _shutdown() -> None:
+    if os.environ.get("AGENT_HTTP_STATS") == "1":
+        sys.stderr.write(f"HTTP pool stats: {json.dumps(pool_stats())}\n")
+    if _transport is not None:
+        _transport.shutdown()
@@ -0,0 +1,305 @@
+"""
+memory_index.py
+===============
+
+Per-user conversation memory for the Python agents.
+
+Every successful run is recorded as a document (the user's input plus the
+agent's output) in a small inverted index that is persisted as one JSON file
+per user.  Before a new run, the agent asks the index for the past runs that
+are most relevant to the new input (Okapi BM25 ranking) and injects short
+snippets from them into its task description.  Retrieval is bounded twice –
+by ``top_k`` documents and by a token budget for the rendered text – so the
+prompt cost of memory stays fixed no matter how much history a user has.
+
+The index is updated incrementally: adding a document only touches the
+postings of its own terms, and the oldest documents are evicted once a user
+exceeds ``MAX_DOCUMENTS``.  Updates reload, modify and atomically replace
+the file while holding an exclusive lock on ``<index>.lock``, so concurrent
+runs of the same user do not lose each other's entries.
+
+Configuration (environment variables):
+
+    AGENT_USER_ID               Supabase user id of the caller; memory is
+                                disabled when it is not set.
+    AGENT_MEMORY_DIR            Directory for the index files
+                                (default: python/.data/memory).
+    AGENT_MEMORY_TOP_K          Maximum number of past runs to inject (default 3).
+    AGENT_MEMORY_TOKEN_BUDGET   Token budget for the injected text (default 400,
+                                0 disables retrieval).
+
+Usage:
+    from memory_index import recall, remember
+    context = recall("blog", topic)        # "" when nothing relevant is found
+    ...
+    remember("blog", topic, blog_content)
+"""
+
+import json
+import math
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: updates are only serialized within a process
+    fcntl = None  # type: ignore
+
+from token_budget import take_within_budget
+
+DEFAULT_MEMORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data", "memory")
+
+# Oldest documents are evicted beyond this many per user.
+MAX_DOCUMENTS = 500
+# Outputs are truncated before indexing so a single huge run (e.g. a whole
+# generated project) cannot dominate the index file.
+MAX_STORED_CHARS = 4000
+# Upper bound on the size of a single snippet, in tokens.
+MAX_SNIPPET_TOKENS = 120
+
+# BM25 parameters (standard defaults).
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Serializes index updates between threads of one process (batch runs);
+# the file lock in ``MemoryIndex.locked`` does the same across processes.
+_update_lock = threading.Lock()
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from how in is it of on or that the this to was what "
+    "with about into your you our we".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase index terms, dropping stopwords and 1-char tokens."""
+    return [
+        tok for tok in _TOKEN_RE.findall(text.lower())
+        if len(tok) > 1 and tok not in _STOPWORDS
+    ]
+
+
+def _safe_user_key(user_id: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_-]+", "_", user_id) or "anonymous"
+
+
+class MemoryIndex:
+    """BM25 inverted index over one user's past agent runs."""
+
+    def __init__(self, user_id: str, root: Optional[str] = None) -> None:
+        self.user_id = user_id
+        self.root = root or os.environ.get("AGENT_MEMORY_DIR") or DEFAULT_MEMORY_DIR
+        self.path = os.path.join(self.root, f"{_safe_user_key(user_id)}.json")
+        self.next_id = 1
+        self.docs = {}  # type: Dict[str, dict]
+        self.postings = {}  # type: Dict[str, Dict[str, int]]
+        self.total_length = 0
+        self._load()
+
+    # -- persistence -------------------------------------------------------
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            # A corrupt index only costs us the history; start over.
+            sys.stderr.write(f"Ignoring unreadable memory index {self.path}\n")
+            return
+        self.next_id = state.get("next_id", 1)
+        self.docs = state.get("docs", {})
+        self.postings = state.get("postings", {})
+        self.total_length = state.get("total_length", 0)
+
+    def save(self) -> None:
+        """Atomically write the index to disk."""
+        os.makedirs(self.root, exist_ok=True)
+        state = {
+            "next_id": self.next_id,
+            "docs": self.docs,
+            "postings": self.postings,
+            "total_length": self.total_length,
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """Hold an exclusive lock on this user's index across processes.
+
+        Wrap a reload/modify/save sequence in it so that two runs of the
+        same user do not overwrite each other's entries.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        with open(self.path + ".lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    # -- updates -----------------------------------------------------------
+
+    def add(self, agent_type: str, user_input: str, output: str) -> str:
+        """Index a finished run and return its document id."""
+        doc_id = str(self.next_id)
+        self.next_id += 1
+        output = output[:MAX_STORED_CHARS]
+        terms = Counter(tokenize(user_input) * 2 + tokenize(output))
+        length = sum(terms.values())
+        self.docs[doc_id] = {
+            "agent_type": agent_type,
+            "input": user_input,
+            "output": output,
+            "created": time.time(),
+            "length": length,
+        }
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+        self.total_length += length
+
+        while len(self.docs) > MAX_DOCUMENTS:
+            oldest = min(self.docs, key=lambda d: self.docs[d]["created"])
+            self.remove(oldest)
+        return doc_id
+
+    def remove(self, doc_id: str) -> None:
+        """Drop a document and its postings."""
+        doc = self.docs.pop(doc_id, None)
+        if doc is None:
+            return
+        self.total_length -= doc["length"]
+        for term in set(tokenize(doc["input"]) + tokenize(doc["output"])):
+            plist = self.postings.get(term)
+            if plist is None:
+                continue
+            plist.pop(doc_id, None)
+            if not plist:
+                del self.postings[term]
+
+    # -- retrieval ---------------------------------------------------------
+
+    def search(self, query: str, top_k: int = 3, agent_type: Optional[str] = None) -> List[dict]:
+        """Return up to ``top_k`` documents ranked by BM25 score for ``query``.
+
+        Each result is the stored document plus ``id`` and ``score`` keys.
+        """
+        n_docs = len(self.docs)
+        if n_docs == 0:
+            return []
+        avg_len = self.total_length / n_docs or 1.0
+        scores = Counter()  # type: Counter
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            df = len(plist)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for doc_id, tf in plist.items():
+                doc = self.docs[doc_id]
+                if agent_type and doc["agent_type"] != agent_type:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * doc["length"] / avg_len)
+                scores[doc_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        results = []
+        for doc_id, score in scores.most_common(top_k):
+            results.append(dict(self.docs[doc_id], id=doc_id, score=score))
+        return results
+
+
+def _snippet(text: str, query_terms: set, max_tokens: int) -> str:
+    """Return the lines of ``text`` that mention the most query terms, in order."""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if not lines:
+        return ""
+    ranked = sorted(
+        range(len(lines)),
+        key=lambda i: len(query_terms.intersection(tokenize(lines[i]))),
+        reverse=True,
+    )
+    kept = take_within_budget((lines[i] for i in ranked), max_tokens, separator=" / ")
+    chosen = sorted(ranked[: len(kept)])
+    if not chosen:
+        # Even the best line is over budget; fall back to its beginning.
+        return lines[ranked[0]][: max_tokens * 4]
+    return " / ".join(lines[i] for i in chosen)
+
+
+def format_memories(results: List[dict], query: str, token_budget: int) -> str:
+    """Render search results as a prompt section no larger than ``token_budget``."""
+    if not results or token_budget <= 0:
+        return ""
+    header = "Relevant context from this user's previous requests (for reference only):"
+    query_terms = set(tokenize(query))
+    per_doc = max(20, min(MAX_SNIPPET_TOKENS, token_budget // len(results)))
+    entries = []
+    for doc in results:
+        created = time.strftime("%Y-%m-%d", time.localtime(doc["created"]))
+        entries.append(
+            f"- [{doc['agent_type']}, {created}] request: {doc['input'][:200]}\n"
+            f"  result: {_snippet(doc['output'], query_terms, per_doc)}"
+        )
+    kept = take_within_budget([header] + entries, token_budget)
+    if len(kept) <= 1:
+        return ""
+    return "\n".join(kept)
+
+
+def recall(agent_type: str, query: str) -> str:
+    """Return a memory section for ``query`` or an empty string.
+
+    Searches all of the current user's runs, not just ``agent_type``, so that
+    e.g. a blog post can build on an earlier data analysis.  Any failure is
+    reported on stderr and treated as "no memory" so that it never breaks a
+    run.
+    """
+    user_id = os.environ.get("AGENT_USER_ID")
+    if not user_id:
+        return ""
+    try:
+        budget = int(os.environ.get("AGENT_MEMORY_TOKEN_BUDGET", "400"))
+        if budget <= 0:
+            return ""
+        index = MemoryIndex(user_id)
+        results = index.search(query, top_k=int(os.environ.get("AGENT_MEMORY_TOP_K", "3")))
+        return format_memories(results, query, budget)
+    except Exception as e:
+        sys.stderr.write(f"Memory recall failed: {e}\n")
+        return ""
+
+
+def remember(agent_type: str, user_input: str, output: str) -> None:
+    """Record a finished run for the current user (no-op without AGENT_USER_ID)."""
+    user_id = os.environ.get("AGENT_USER_ID")
+    if not user_id or not output:
+        return
+    try:
+        index = MemoryIndex(user_id)
+        with _update_lock, index.locked():
+            # Reload under the lock so entries added by a concurrent run of
+            # the same user since the first load are kept.
+            index._load()
+            index.add(agent_type, user_input, output)
+            index.save()
+    except Exception as e:
+        sys.stderr.write(f"Memory update failed: {e}\n")
+
@@ -0,0 +1,430 @@
+"""
+notion_outbox.py
+================
+
+Durable local outbox for publishing blog posts to Notion.
+
+Generating a post is the slow, paid part of a blog run; creating the Notion
+page is a single API call that can still fail (rate limits, timeouts, an
+expired integration).  Instead of making the user wait for Notion, and
+losing the article when it fails, ``blog_agent`` stores the finished post
+here first and returns immediately with a ``pending`` status.  A detached
+background publisher then drains the outbox, retrying failed posts with
+exponential backoff, and the status of each post can be queried later.
+
+The outbox is a SQLite database, so enqueueing is atomic and any number of
+publisher processes can drain it concurrently: each post is claimed with a
+lease before it is published, and a lease left behind by a crashed
+publisher expires after ``LEASE_SECONDS``.
+
+No credentials are stored: a post only records its user id, and the
+publisher looks up that user's Notion token in ``user_settings`` (Supabase
+REST API) when it publishes; a post whose user cannot be resolved is marked
+``failed`` instead of being published with some other token.
+
+Publishing is idempotent without touching the user's database schema: the
+id of the created page is stored in the outbox row, and a publisher that
+took over an attempt which may have died between creating the page and
+recording it first looks in the database for a page with the post's title
+created since that attempt started.
+
+Configuration (environment variables):
+
+    AGENT_OUTBOX_DB          Path of the SQLite file
+                             (default: python/.data/notion_outbox.sqlite3).
+    AGENT_OUTBOX_MAX_ATTEMPTS  Publish attempts before a post is marked
+                             ``failed`` (default 8).
+    NEXT_PUBLIC_SUPABASE_URL   Supabase project used for the token lookup.
+    SUPABASE_SERVICE_ROLE_KEY  Service-role key for the lookup (required for
+                             posts with a user id; the anon key cannot read
+                             other users' settings under RLS).
+    NOTION_DEFAULT_TOKEN     Token for users without their own (set by the
+                             API route to the server's NOTION_TOKEN); posts
+                             without a user id use NOTION_TOKEN.
+
+Usage:
+    python notion_outbox.py drain           # publish everything that is due
+    python notion_outbox.py status <id>     # print the status of one post
+"""
+
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+import uuid
+from typing import Callable, List, Optional
+
+from tracing import current_trace_id, span, use_trace
+
+DEFAULT_DB_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".data", "notion_outbox.sqlite3"
+)
+
+# A claimed post whose publisher has not reported back within this many
+# seconds is considered abandoned and becomes claimable again.
+LEASE_SECONDS = 600
+# Retry delays grow as BASE * 2**attempts, capped at MAX.
+RETRY_BASE_SECONDS = 15
+RETRY_MAX_SECONDS = 30 * 60
+# A background publisher gives up waiting for future retries after this long;
+# the next blog run starts a new one.
+DRAIN_MAX_SECONDS = 60 * 60
+
+# Clock skew allowed when matching a page's created_time against the start of
+# the attempt that may have created it (Notion rounds it to the minute).
+CREATED_TIME_SLACK_SECONDS = 120
+
+_POSTS_COLUMNS = """
+    id TEXT PRIMARY KEY,
+    user_id TEXT,
+    topic TEXT NOT NULL,
+    title TEXT NOT NULL,
+    content TEXT NOT NULL,
+    database_id TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending'
+        CHECK (status IN ('pending', 'publishing', 'published', 'failed')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    lease_expires_at REAL,
+    last_error TEXT,
+    url TEXT,
+    trace_id TEXT,
+    page_id TEXT,
+    create_started_at REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+"""
+_INDEX = "CREATE INDEX IF NOT EXISTS idx_posts_due ON posts(status, next_attempt_at)"
+_SCHEMA = f"CREATE TABLE IF NOT EXISTS posts ({_POSTS_COLUMNS});\n{_INDEX};"
+
+
+class PublishConfigError(RuntimeError):
+    """The post cannot be published as configured; it fails without retries."""
+
+
+def _db_path() -> str:
+    return os.environ.get("AGENT_OUTBOX_DB") or DEFAULT_DB_PATH
+
+
+def connect() -> sqlite3.Connection:
+    """Open the outbox database, creating it on first use."""
+    path = _db_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    columns = _columns(conn)
+    if "notion_token" in columns:  # outboxes that stored the token per post
+        _drop_token_column(conn)
+        columns = _columns(conn)
+    # Outboxes created before tracing / idempotent publishing.
+    for name, kind in (("trace_id", "TEXT"), ("page_id", "TEXT"), ("create_started_at", "REAL")):
+        if name not in columns:
+            conn.execute(f"ALTER TABLE posts ADD COLUMN {name} {kind}")
+    return conn
+
+
+def _columns(conn: sqlite3.Connection, table: str = "posts") -> List[str]:
+    return [row["name"] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _drop_token_column(conn: sqlite3.Connection) -> None:
+    """Rebuild ``posts`` without the ``notion_token`` column.
+
+    Rebuilding instead of ``ALTER TABLE ... DROP COLUMN`` works on SQLite
+    versions older than 3.35.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if "notion_token" in _columns(conn):  # another process may have won
+            conn.execute(f"CREATE TABLE posts_rebuild ({_POSTS_COLUMNS})")
+            old = set(_columns(conn))
+            kept = ", ".join(c for c in _columns(conn, "posts_rebuild") if c in old)
+            conn.execute(f"INSERT INTO posts_rebuild ({kept}) SELECT {kept} FROM posts")
+            conn.execute("DROP TABLE posts")
+            conn.execute("ALTER TABLE posts_rebuild RENAME TO posts")
+            conn.execute(_INDEX)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("VACUUM")  # do not leave the old tokens in free pages
+
+
+def enqueue(
+    topic: str,
+    title: str,
+    content: str,
+    database_id: str,
+    user_id: Optional[str] = None,
+) -> str:
+    """Persist a finished post and return its outbox id.
+
+    The user id is stored so that a publisher started later (or by another
+    user's run) can look up the token, and the trace id so that its publish
+    attempts show up in the trace of the run that wrote it.
+    """
+    post_id = uuid.uuid4().hex
+    now = time.time()
+    conn = connect()
+    try:
+        conn.execute(
+            "INSERT INTO posts (id, user_id, topic, title, content, database_id, "
+            "trace_id, next_attempt_at, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (post_id, user_id, topic, title, content, database_id,
+             current_trace_id(), now, now, now),
+        )
+    finally:
+        conn.close()
+    return post_id
+
+
+def _claim_next(conn: sqlite3.Connection) -> Optional[sqlite3.Row]:
+    """Atomically lease the oldest post that is due for publishing."""
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT * FROM posts WHERE "
+            "(status = 'pending' AND next_attempt_at <= ?) OR "
+            "(status = 'publishing' AND lease_expires_at <= ?) "
+            "ORDER BY created_at LIMIT 1",
+            (now, now),
+        ).fetchone()
+        if row is not None:
+            conn.execute(
+                "UPDATE posts SET status = 'publishing', lease_expires_at = ?, updated_at = ? "
+                "WHERE id = ?",
+                (now + LEASE_SECONDS, now, row["id"]),
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return row
+
+
+def _mark_published(conn: sqlite3.Connection, post_id: str, url: Optional[str]) -> None:
+    conn.execute(
+        "UPDATE posts SET status = 'published', url = ?, lease_expires_at = NULL, "
+        "last_error = NULL, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+        (url, time.time(), post_id),
+    )
+
+
+def _mark_failed(conn: sqlite3.Connection, row: sqlite3.Row, error: str, permanent: bool = False) -> None:
+    attempts = row["attempts"] + 1
+    max_attempts = int(os.environ.get("AGENT_OUTBOX_MAX_ATTEMPTS", "8"))
+    now = time.time()
+    delay = min(RETRY_BASE_SECONDS * (2 ** (attempts - 1)), RETRY_MAX_SECONDS)
+    status = "failed" if permanent or attempts >= max_attempts else "pending"
+    conn.execute(
+        "UPDATE posts SET status = ?, attempts = ?, next_attempt_at = ?, lease_expires_at = NULL, "
+        "last_error = ?, updated_at = ? WHERE id = ?",
+        (status, attempts, now + delay, error[:2000], now, row["id"]),
+    )
+
+
+def _update(post_id: str, **fields: object) -> None:
+    """Persist progress of a publish attempt right away, outside the drain loop."""
+    conn = connect()
+    try:
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        conn.execute(
+            f"UPDATE posts SET {assignments}, updated_at = ? WHERE id = ?",
+            (*fields.values(), time.time(), post_id),
+        )
+    finally:
+        conn.close()
+
+
+def _user_notion_token(user_id: str) -> Optional[str]:
+    """Look up ``user_id``'s Notion token in the Supabase ``user_settings`` table.
+
+    Raises:
+        PublishConfigError: without a service-role key, or when the user
+            has no settings row.
+    """
+    from http_transport import new_http_client
+
+    url = os.environ.get("SUPABASE_URL") or os.environ.get("NEXT_PUBLIC_SUPABASE_URL")
+    key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
+    if not url or not key:
+        raise PublishConfigError(
+            "NEXT_PUBLIC_SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY are required to look up "
+            "the user's Notion token."
+        )
+    # Not recorded: the response is the user's Notion token.
+    with span("outbox.user_settings"), new_http_client(record=False) as client:
+        response = client.get(
+            f"{url.rstrip('/')}/rest/v1/user_settings",
+            params={"user_id": f"eq.{user_id}", "select": "notion_token"},
+            headers={"apikey": key, "Authorization": f"Bearer {key}"},
+        )
+        response.raise_for_status()
+        rows = response.json()
+    if not rows:
+        raise PublishConfigError(f"No user_settings found for user {user_id}.")
+    return rows[0].get("notion_token")
+
+
+def _notion_token(user_id: Optional[str]) -> str:
+    if user_id:
+        token = _user_notion_token(user_id) or os.environ.get("NOTION_DEFAULT_TOKEN")
+    else:
+        token = os.environ.get("NOTION_TOKEN")
+    if not token:
+        raise PublishConfigError("No Notion token is configured for this post's user.")
+    return token
+
+
+def _find_created_page(notion, row: sqlite3.Row) -> Optional[dict]:
+    """Return a page an earlier, interrupted attempt created for ``row``, if any.
+
+    Matches the post's title among pages created since that attempt
+    started, skipping pages already recorded for other posts.
+    """
+    since = time.strftime(
+        "%Y-%m-%dT%H:%M:%SZ",
+        time.gmtime(row["create_started_at"] - CREATED_TIME_SLACK_SECONDS),
+    )
+    with span("notion.find_created_page", post_id=row["id"]):
+        found = notion.databases.query(
+            database_id=row["database_id"],
+            filter={"and": [
+                {"property": "Name", "title": {"equals": row["title"]}},
+                {"timestamp": "created_time", "created_time": {"on_or_after": since}},
+            ]},
+        )
+    conn = connect()
+    try:
+        for page in found.get("results", []):
+            claimed = conn.execute(
+                "SELECT 1 FROM posts WHERE page_id = ? AND id != ?", (page["id"], row["id"])
+            ).fetchone()
+            if claimed is None:
+                return page
+    finally:
+        conn.close()
+    return None
+
+
+def _publish_row(row: sqlite3.Row) -> Optional[str]:
+    """Default publisher: create the Notion page through ``blog_agent``.
+
+    The page id is recorded as soon as the page exists, and a retry of an
+    attempt that may already have created the page reuses it.
+    """
+    from blog_agent import publish_post
+    from client_cache import get_clients
+
+    settings = {
+        "notion_token": _notion_token(row["user_id"]),
+        "notion_database_id": row["database_id"],
+    }
+    clients = get_clients(row["user_id"], settings)
+    if row["page_id"]:
+        return clients.notion().pages.retrieve(page_id=row["page_id"]).get("url")
+    if row["create_started_at"] is not None:
+        page = _find_created_page(clients.notion(), row)
+        if page is not None:
+            _update(row["id"], page_id=page["id"])
+            return page.get("url")
+    _update(row["id"], create_started_at=time.time())
+    result = publish_post(clients, row["database_id"], row["topic"], row["content"])
+    _update(row["id"], page_id=result.get("page_id"))
+    return result.get("url")
+
+
+def drain(
+    publish: Callable[[sqlite3.Row], Optional[str]] = _publish_row,
+    max_seconds: float = DRAIN_MAX_SECONDS,
+) -> int:
+    """Publish due posts until none are left or ``max_seconds`` have passed.
+
+    Posts waiting for a retry keep the publisher alive (sleeping until the
+    next one is due) so that a transient Notion outage resolves itself
+    without another blog run.
+
+    Returns:
+        The number of posts published.
+    """
+    deadline = time.time() + max_seconds
+    published = 0
+    conn = connect()
+    try:
+        while time.time() < deadline:
+            row = _claim_next(conn)
+            if row is None:
+                upcoming = conn.execute(
+                    "SELECT MIN(next_attempt_at) FROM posts WHERE status = 'pending'"
+                ).fetchone()[0]
+                if upcoming is None or upcoming > deadline:
+                    break
+                time.sleep(max(0.0, min(upcoming - time.time(), deadline - time.time())))
+                continue
+            try:
+                with use_trace(row["trace_id"]), span(
+                    "outbox.publish", post_id=row["id"], attempt=row["attempts"] + 1
+                ):
+                    url = publish(row)
+            except PublishConfigError as e:
+                _mark_failed(conn, row, str(e), permanent=True)
+                sys.stderr.write(f"Notion publish failed for {row['id']}: {e}\n")
+            except Exception as e:
+                _mark_failed(conn, row, str(e))
+                sys.stderr.write(f"Notion publish failed for {row['id']}: {e}\n")
+            else:
+                _mark_published(conn, row["id"], url)
+                published += 1
+    finally:
+        conn.close()
+    return published
+
+
+def status(post_id: str) -> Optional[dict]:
+    """Return the public status of a post (never its content or token)."""
+    conn = connect()
+    try:
+        row = conn.execute(
+            "SELECT id, title, status, attempts, url, last_error, created_at, updated_at "
+            "FROM posts WHERE id = ?",
+            (post_id,),
+        ).fetchone()
+    finally:
+        conn.close()
+    return dict(row) if row is not None else None
+
+
+def start_background_publisher() -> None:
+    """Spawn a detached ``drain`` process that outlives the calling script."""
+    with open(os.devnull, "rb") as devnull_in, open(os.devnull, "wb") as devnull_out:
+        subprocess.Popen(
+            [sys.executable, "-W", "ignore", os.path.abspath(__file__), "drain"],
+            stdin=devnull_in,
+            stdout=devnull_out,
+            stderr=devnull_out,
+            close_fds=True,
+            # A new session keeps the publisher running after the API
+            # route has collected the parent's output and moved on.
+            start_new_session=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 2 and sys.argv[1] == "drain":
+        print(json.dumps({"published": drain()}))
+    elif len(sys.argv) == 3 and sys.argv[1] == "status":
+        post = status(sys.argv[2])
+        if post is None:
+            print(json.dumps({"error": "Unknown post id"}))
+            sys.exit(1)
+        print(json.dumps(post))
+    else:
+        sys.stderr.write("Usage: python notion_outbox.py drain | status <post_id>\n")
+        sys.exit(1)
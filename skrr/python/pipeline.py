@@ -0,0 +1,296 @@
+"""
+pipeline.py
+===========
+
+Optional streaming mode that overlaps the stages of the blog and web agents.
+
+With the regular crews, a downstream task starts only after the upstream
+LLM has produced its complete output, so a run takes the sum of all the
+generation times.  In streaming mode the upstream LLM streams its tokens,
+its output is split into self-contained *units* as soon as each one is
+complete, and every unit is handed straight to a downstream worker:
+
+* blog: the research notes start with the outline of the whole post and
+  are then streamed section by section (a ``## title`` line followed by
+  ``- fact [source]`` bullets); each finished section is drafted by the
+  writer, who sees the full outline and all research so far, while the
+  research for the next one is still being generated.
+* web: the plan is streamed as JSON Lines, one file per line; each file is
+  written by the coder as soon as its plan entry is complete.
+
+Each unit gets the same inputs as in the crew version (the topic or spec,
+the search results, the memory context and the scaffold note), plus the
+upstream output produced so far.  Two differences remain: the researcher
+works from one search up front instead of calling the search tool as it
+goes, and a section writer does not see the notes for later sections that
+have not been streamed yet.
+
+Configuration (environment variables):
+
+    AGENT_PIPELINE_STREAM    Set to 1 to use the streaming pipeline.
+    AGENT_PIPELINE_WORKERS   Downstream units generated at once (default 4).
+
+Usage:
+    from pipeline import stream_enabled, stream_blog_post, stream_web_files
+    if stream_enabled():
+        post = stream_blog_post(topic, clients, memory_context)
+"""
+
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from cassette import current as current_cassette, request_key
+from rate_limit import get_limiter
+from scheduler import report_llm_usage
+from search_tools import format_results, serper_search
+from tracing import bind_context, span, start_span
+
+_FENCE_RE = re.compile(r"^\s*```[\w-]*\s*\n(.*?)\n\s*```\s*$", re.DOTALL)
+
+
+def stream_enabled() -> bool:
+    return os.environ.get("AGENT_PIPELINE_STREAM", "0") == "1"
+
+
+def _workers() -> int:
+    return max(1, int(os.environ.get("AGENT_PIPELINE_WORKERS", "4")))
+
+
+# -- LLM streaming -------------------------------------------------------------
+
+def stream_llm(llm, prompt: str) -> Iterator[str]:
+    """Yield the completion of ``prompt`` piece by piece.
+
+    ``llm`` is a CrewAI ``LLM`` from ``client_cache``; its model, key,
+    base URL and temperature are passed to LiteLLM's streaming API.  The
+    call waits on the shared LLM rate limiter and goes through the
+    cassette like ``llm.call`` does (a replay yields the recorded text
+    line by line).
+    """
+    model = getattr(llm, "model", None)
+    messages = [{"role": "user", "content": prompt}]
+    key = request_key(model, messages)
+    cassette = current_cassette()
+    s = start_span("llm.stream", model=model)
+    try:
+        if cassette is not None and cassette.mode == "replay":
+            text = cassette.replay("llm", key)
+            s.set("response_chars", len(text))
+            yield from text.splitlines(keepends=True)
+            return
+
+        import litellm  # type: ignore
+
+        s.set("rate_limit_wait_ms", round(get_limiter("llm").acquire() * 1000, 1))
+        start = time.perf_counter()
+        kwargs = {}
+        for attr, name in (("api_key", "api_key"), ("base_url", "api_base"), ("temperature", "temperature")):
+            value = getattr(llm, attr, None)
+            if value is not None:
+                kwargs[name] = value
+        pieces = []  # type: List[str]
+        for chunk in litellm.completion(model=model, messages=messages, stream=True, **kwargs):
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                if not pieces:
+                    s.set("first_token_ms", round((time.perf_counter() - start) * 1000, 1))
+                pieces.append(delta)
+                yield delta
+        text = "".join(pieces)
+        s.set("response_chars", len(text))
+        report_llm_usage(messages, text)
+        if cassette is not None:
+            cassette.record("llm", key, {"model": model, "messages": messages}, text,
+                            (time.perf_counter() - start) * 1000)
+    except BaseException as e:
+        if not isinstance(e, GeneratorExit):
+            s.status = "error"
+            s.error = f"{type(e).__name__}: {e}"[:500]
+        raise
+    finally:
+        s.end()
+
+
+def iter_lines(chunks: Iterable[str]) -> Iterator[str]:
+    """Re-split streamed chunks into complete lines (without the newline)."""
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split("\n")
+        yield from lines
+    if buffer:
+        yield buffer
+
+
+def iter_json_lines(chunks: Iterable[str]) -> Iterator[dict]:
+    """Yield each JSON object line of a streamed JSON Lines answer.
+
+    Blank lines, Markdown fences and lines that do not parse are skipped,
+    so a stray remark from the model does not end the stream.
+    """
+    for line in iter_lines(chunks):
+        line = line.strip().rstrip(",")
+        if not line.startswith("{"):
+            continue
+        try:
+            value = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(value, dict):
+            yield value
+
+
+def run_overlapped(units: Iterable, work: Callable, concurrency: Optional[int] = None) -> List:
+    """Apply ``work`` to each unit as soon as ``units`` yields it.
+
+    Producing the units (typically parsing a stream) and working on the
+    ones already produced happen at the same time.  Results are returned
+    in unit order; the first failure is re-raised after the stream ends.
+    """
+    with ThreadPoolExecutor(max_workers=concurrency or _workers()) as pool:
+        futures = [pool.submit(bind_context(work), unit) for unit in units]
+        return [future.result() for future in futures]
+
+
+def _strip_fence(text: str) -> str:
+    match = _FENCE_RE.match(text.strip())
+    return match.group(1) if match else text.strip()
+
+
+# -- blog ------------------------------------------------------------------------
+
+def _research_sections(lines: Iterable[str], outline: Optional[List[str]] = None) -> Iterator[Tuple[str, List[str]]]:
+    """Group streamed research lines into ``(title, bullets)`` sections.
+
+    An ``OUTLINE: a | b | c`` line is not a section; its titles are added
+    to ``outline`` when one is given.
+    """
+    title = None  # type: Optional[str]
+    bullets = []  # type: List[str]
+    for line in lines:
+        stripped = line.strip()
+        if stripped.upper().startswith("OUTLINE:"):
+            if outline is not None:
+                outline.extend(t.strip() for t in stripped.split(":", 1)[1].split("|") if t.strip())
+        elif stripped.startswith("#"):
+            if title is not None and bullets:
+                yield title, bullets
+            title, bullets = stripped.lstrip("#").strip(), []
+        elif stripped.startswith(("-", "*")) and title is not None:
+            bullets.append(stripped.lstrip("-* ").strip())
+    if title is not None and bullets:
+        yield title, bullets
+
+
+def stream_blog_post(topic: str, clients, memory_context: str = "") -> str:
+    """Research and write a Markdown post about ``topic`` with overlapped stages."""
+    llm = clients.llm(temperature=0.5)
+    sources = ""
+    api_key = clients.settings.get("serper_api_key")
+    if api_key:
+        try:
+            sources = "\n\nSearch results:\n" + format_results(serper_search(topic, api_key))
+        except Exception:
+            sources = ""  # research from the model's knowledge, as the crew does without search
+    memory_section = f"\n\n{memory_context}" if memory_context else ""
+
+    research_prompt = (
+        f"You are an expert researcher specialising in {topic}. Research the topic '{topic}' "
+        "for a blog post and organise your notes by the sections of the article: start with an "
+        "introduction, then one section per key point (at least 5 key points in total), and end "
+        "with a conclusion. First output one line 'OUTLINE: <section title> | <section title> | ...' "
+        "listing every section title in order. Then output each section as a line "
+        "'## <section title>' followed by bullet lines "
+        "'- <fact, figure or argument> [source: <url or publication>]'. Output nothing else."
+        f"{sources}{memory_section}"
+    )
+    outline = []  # type: List[str]
+    research = []  # type: List[Tuple[str, List[str]]]
+
+    def draft(section: Tuple[int, str, List[str]]) -> str:
+        index, title, bullets = section
+        with span("pipeline.write_section", section=title, index=index):
+            titles = outline or [t for t, _ in research]
+            plan = "\n".join(f"{i}. {t}" for i, t in enumerate(titles, 1))
+            notes = "\n\n".join(
+                f"## {t}\n" + "\n".join(f"- {b}" for b in bs) for t, bs in list(research)
+            )
+            prompt = (
+                f"You are a talented writer known for clarity and storytelling, writing a blog post "
+                f"about '{topic}' in Markdown. The post is written section by section; this is "
+                f"section {index + 1}, '{title}'.\n\nOutline of the whole post:\n{plan}\n\n"
+                f"Research notes so far:\n{notes}\n\n"
+                f"Write only section {index + 1}, based mainly on its own notes and citing sources "
+                "inline where useful; use the outline and the other notes for context and "
+                "transitions, without covering what other sections cover. Start with the heading "
+                f"'## {title}' and use bullet points where appropriate. Output only the section."
+            )
+            return _strip_fence("".join(stream_llm(llm, prompt)))
+
+    def sections() -> Iterator[Tuple[int, str, List[str]]]:
+        stream = _research_sections(iter_lines(stream_llm(llm, research_prompt)), outline)
+        for index, (title, bullets) in enumerate(stream):
+            research.append((title, bullets))
+            yield index, title, bullets
+
+    with span("pipeline.blog", topic=topic):
+        drafts = run_overlapped(sections(), draft)
+    if not drafts:
+        raise RuntimeError("The research stream produced no sections")
+    heading = topic.strip().capitalize() or "Blog Post"
+    return f"# {heading}\n\n" + "\n\n".join(d.strip() for d in drafts)
+
+
+# -- web builder -----------------------------------------------------------------
+
+def stream_web_files(spec: str, llm, scaffold_note: str, memory_section: str = "") -> Tuple[Dict[str, str], Optional[dict]]:
+    """Plan and code the feature files for ``spec`` with overlapped stages.
+
+    Returns:
+        ``(files, dependencies)`` where ``files`` maps paths to code and
+        ``dependencies`` is the plan's extra npm packages (or None).
+    """
+    plan_prompt = (
+        f"You are a seasoned Next.js architect. The user has requested the following Next.js "
+        f"feature: '{spec}'. {scaffold_note}Do NOT list scaffold files. Plan the feature-specific "
+        "files using App Router conventions (app/page.tsx and app/<route>/page.tsx for pages, "
+        "components/ for reusable components, app/api/<route>/route.ts for API routes). "
+        "Output JSON Lines only: one JSON object per line, "
+        '{"path": "<file path>", "purpose": "<what the file contains and exports>"}, listing '
+        "files that others import (components, lib) before the files that import them. If the "
+        "feature needs npm packages beyond next, react and react-dom, add one final line "
+        '{"dependencies": {"<package>": "<version range>"}}.'
+        f"{memory_section}"
+    )
+    plan = []  # type: List[dict]
+    dependencies = {}  # type: Dict[str, str]
+
+    def entries() -> Iterator[dict]:
+        for entry in iter_json_lines(stream_llm(llm, plan_prompt)):
+            if isinstance(entry.get("dependencies"), dict):
+                dependencies.update(entry["dependencies"])
+            if isinstance(entry.get("path"), str) and entry["path"].strip():
+                plan.append(entry)
+                yield entry
+
+    def code(entry: dict) -> Tuple[str, str]:
+        path = entry["path"].strip()
+        with span("pipeline.write_file", path=path):
+            known = "\n".join(f"- {e['path']}: {e.get('purpose', '')}" for e in list(plan))
+            prompt = (
+                f"You are an expert Next.js developer. Feature request: '{spec}'. {scaffold_note}"
+                f"Project files planned so far:\n{known}\n\n"
+                f"Write the complete contents of {path} ({entry.get('purpose', '')}). Use modern "
+                "React (functional components, hooks) and make sure imports refer to the files "
+                "above or to next/react. Output only the file contents, without Markdown fences "
+                "or explanation."
+            )
+            return path, _strip_fence("".join(stream_llm(llm, prompt))) + "\n"
+
+    with span("pipeline.web", spec=spec):
+        files = dict(run_overlapped(entries(), code))
+    return files, dependencies or None
@@ -0,0 +1,75 @@
+"""
+rate_limit.py
+=============
+
+Process-wide token-bucket rate limiters for outbound providers.
+
+Concurrent crews in the same process (e.g. ``blog_agent.py --batch``) share
+one limiter per provider, so the combined request rate stays under the
+provider's quota instead of every worker backing off on 429s independently.
+
+Configuration (environment variables, 0 or unset means unlimited):
+
+    AGENT_LLM_RPM        LLM requests per minute.
+    AGENT_NOTION_RPS     Notion API requests per second (Notion allows ~3).
+
+Usage:
+    from rate_limit import get_limiter
+    get_limiter("notion").acquire()
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+# Limiter name -> (environment variable, seconds per unit of that variable).
+_LIMITS = {
+    "llm": ("AGENT_LLM_RPM", 60.0),
+    "notion": ("AGENT_NOTION_RPS", 1.0),
+}
+
+_limiters = {}  # type: Dict[str, RateLimiter]
+_lock = threading.Lock()
+
+
+class RateLimiter:
+    """Thread-safe token bucket allowing ``rate`` acquisitions per ``per`` seconds.
+
+    A rate of 0 disables limiting.  ``burst`` defaults to one second's worth
+    of tokens (at least one), so short spikes are smoothed rather than
+    released all at once.
+    """
+
+    def __init__(self, rate: float, per: float = 1.0, burst: Optional[float] = None) -> None:
+        self.rate = rate / per if rate > 0 else 0.0
+        self.capacity = burst if burst is not None else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Block until ``tokens`` are available; return the seconds waited."""
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def get_limiter(name: str) -> RateLimiter:
+    """Return the shared limiter for provider ``name`` (``"llm"`` or ``"notion"``)."""
+    with _lock:
+        if name not in _limiters:
+            env_name, per = _LIMITS[name]
+            _limiters[name] = RateLimiter(float(os.environ.get(env_name, 0) or 0), per=per)
+        return _limiters[name]
@@ -0,0 +1,203 @@
+"""
+research_fanout.py
+==================
+
+Concurrent research for ``blog_agent``: one topic, several sub-questions.
+
+The crew's single researcher investigates a topic in one serialized chain
+of search-and-think steps, so broad topics are slow and come back shallow.
+Here the topic is first split into a few focused sub-questions (one short
+LLM call).  Each sub-question is then researched independently and
+concurrently, under a cap: it gets its own Serper search and one LLM call
+that turns the results into cited bullet points.  The findings are merged
+into the single research summary the writer consumes, with near-duplicate
+bullets collapsed and citations renumbered and de-duplicated by URL, so
+research wall time approaches that of the slowest sub-question.
+
+Configuration (environment variables):
+
+    BLOG_RESEARCH_MODE             ``fanout`` to use this module (default: crew researcher).
+    BLOG_RESEARCH_SUBQUESTIONS     Sub-questions per topic (default 4).
+    BLOG_RESEARCH_CONCURRENCY      Sub-questions researched at once (default 4).
+
+Usage:
+    from research_fanout import fanout_enabled, fanout_research
+    if fanout_enabled():
+        summary = fanout_research(topic, clients, memory_context)
+"""
+
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from search_tools import serper_search
+from tracing import bind_context, span
+
+# Bullets sharing at least this fraction of their words are duplicates.
+DUPLICATE_JACCARD = 0.7
+RESULTS_PER_QUESTION = 6
+
+_CITATION_RE = re.compile(r"\[(\d+)\]")
+_WORD_RE = re.compile(r"\w+")
+
+
+def fanout_enabled() -> bool:
+    return os.environ.get("BLOG_RESEARCH_MODE", "").lower() == "fanout"
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.environ.get(name, str(default))))
+    except ValueError:
+        sys.stderr.write(f"Ignoring invalid {name}; using {default}\n")
+        return default
+
+
+def _llm_text(llm, prompt: str) -> str:
+    result = llm.call(prompt)
+    return result if isinstance(result, str) else str(result)
+
+
+def split_topic(topic: str, llm, count: int) -> List[str]:
+    """Ask the LLM for ``count`` complementary sub-questions about ``topic``."""
+    prompt = (
+        f"Split the blog topic '{topic}' into {count} distinct, complementary research "
+        "questions that together cover it (background, current state, key facts and figures, "
+        "debates or trade-offs, outlook). Output one question per line and nothing else."
+    )
+    questions = []  # type: List[str]
+    for line in _llm_text(llm, prompt).splitlines():
+        question = re.sub(r"^\s*(?:[-*]|\d+[.)])\s*", "", line).strip()
+        if question and question.lower() not in (q.lower() for q in questions):
+            questions.append(question)
+    return questions[:count] or [topic]
+
+
+def research_question(question: str, topic: str, llm, api_key: Optional[str]) -> Tuple[List[Tuple[str, List[str]]], Dict[str, str]]:
+    """Research one sub-question.
+
+    Returns:
+        ``(bullets, sources)``: bullets as ``(text, [url, ...])`` and the
+        cited sources as ``{url: title}``.
+    """
+    with span("research.subquestion", question=question):
+        results = []  # type: List[dict]
+        if api_key:
+            try:
+                results = serper_search(f"{topic} {question}", api_key, RESULTS_PER_QUESTION)
+            except Exception:
+                results = []  # answer from the model's knowledge, as the crew does without search
+        numbered = "\n".join(
+            f"[{i}] {r['title']} ({r['link']}): {r['snippet']}" for i, r in enumerate(results, 1)
+        )
+        prompt = (
+            f"You are researching '{topic}' for a blog post. Answer this research question: "
+            f"{question}\n\n"
+            + (f"Search results:\n{numbered}\n\n" if numbered else "")
+            + "Write 3 to 6 bullet points ('- ...') with concrete facts, figures or arguments. "
+            + ("End each bullet with the numbers of the search results that support it, e.g. [2][5]. "
+               if numbered else "Name the source of each fact in the bullet. ")
+            + "Output only the bullets."
+        )
+        bullets = []  # type: List[Tuple[str, List[str]]]
+        sources = {}  # type: Dict[str, str]
+        for line in _llm_text(llm, prompt).splitlines():
+            line = line.strip()
+            if not line.startswith(("-", "*")):
+                continue
+            urls = []  # type: List[str]
+            for number in _CITATION_RE.findall(line):
+                index = int(number) - 1
+                if 0 <= index < len(results):
+                    url = results[index]["link"]
+                    sources.setdefault(url, results[index]["title"])
+                    if url not in urls:
+                        urls.append(url)
+            text = _CITATION_RE.sub("", line.lstrip("-* ")).strip()
+            if text:
+                bullets.append((text, urls))
+        return bullets, sources
+
+
+def _words(text: str) -> set:
+    return set(_WORD_RE.findall(text.lower()))
+
+
+def merge_findings(questions: List[str], findings: List[Tuple[List[Tuple[str, List[str]]], Dict[str, str]]]) -> str:
+    """Merge per-question findings into one summary with numbered citations.
+
+    A bullet that repeats an earlier one (by word overlap) is dropped and
+    its citations are added to the earlier bullet; each URL gets a single
+    citation number across the whole summary.
+    """
+    kept = []  # type: List[Tuple[int, str, set, List[str]]]
+    titles = {}  # type: Dict[str, str]
+    for q_index, (bullets, sources) in enumerate(findings):
+        titles.update({url: title for url, title in sources.items() if url not in titles})
+        for text, urls in bullets:
+            words = _words(text)
+            for _, _, other_words, other_urls in kept:
+                union = words | other_words
+                if union and len(words & other_words) / len(union) >= DUPLICATE_JACCARD:
+                    other_urls.extend(u for u in urls if u not in other_urls)
+                    break
+            else:
+                kept.append((q_index, text, words, list(urls)))
+
+    numbers = {}  # type: Dict[str, int]
+    sections = []  # type: List[str]
+    for q_index, question in enumerate(questions):
+        lines = []
+        for index, text, _, urls in kept:
+            if index != q_index:
+                continue
+            refs = "".join(f"[{numbers.setdefault(url, len(numbers) + 1)}]" for url in urls)
+            lines.append(f"- {text} {refs}".rstrip())
+        if lines:
+            sections.append(f"### {question}\n" + "\n".join(lines))
+    summary = "\n\n".join(sections)
+    if numbers:
+        summary += "\n\nSources:\n" + "\n".join(
+            f"[{n}] {titles.get(url, url)} - {url}" for url, n in sorted(numbers.items(), key=lambda x: x[1])
+        )
+    return summary
+
+
+def fanout_research(topic: str, clients, memory_context: str = "") -> str:
+    """Research ``topic`` through concurrent sub-questions; return the merged summary.
+
+    Returns an empty string when every sub-question failed or no findings
+    could be parsed, so the caller can fall back to the crew researcher.
+    """
+    count = _env_int("BLOG_RESEARCH_SUBQUESTIONS", 4)
+    concurrency = _env_int("BLOG_RESEARCH_CONCURRENCY", 4)
+    llm = clients.llm(temperature=0.5)
+    api_key = clients.settings.get("serper_api_key")
+    with span("research.fanout", topic=topic) as s:
+        questions = split_topic(topic, llm, count)
+        s.set("subquestions", len(questions))
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = [
+                pool.submit(bind_context(research_question), q, topic, llm, api_key)
+                for q in questions
+            ]
+            findings = []
+            errors = []  # type: List[Exception]
+            for future in futures:
+                try:
+                    findings.append(future.result())
+                except Exception as e:
+                    # One failed sub-question should not sink the others.
+                    errors.append(e)
+                    findings.append(([], {}))
+        s.set("failed", len(errors))
+        if errors and len(errors) == len(questions):
+            s.set("error", repr(errors[0]))
+            return ""
+        summary = merge_findings(questions, findings)
+        s.set("empty", not summary)
+    if summary and memory_context:
+        summary += f"\n\n{memory_context}"
+    return summary
@@ -0,0 +1,197 @@
+"""
+row_sampler.py
+==============
+
+Pick a small, representative subset of rows from a DataFrame and render it
+compactly so that the analysis agents can look at real records without the
+prompt growing with the size of the dataset.
+
+Rows are chosen for three reasons, each tagged in the output:
+
+* ``time``    – the first and last row of every datetime column's range.
+* ``outlier`` – rows whose numeric values are extreme by z-score or fall
+  outside the Tukey IQR fences.
+* ``stratum`` – one typical row (closest to the group median) for every
+  value of each low-cardinality categorical column.
+
+Candidates are interleaved across the three groups so that, when the token
+budget runs out, the sample still covers every kind of evidence instead of
+being filled with outliers alone.
+
+Usage:
+    from row_sampler import sample_representative_rows
+    text = sample_representative_rows(df, token_budget=600)
+"""
+
+from collections import OrderedDict
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from token_budget import estimate_tokens
+
+# Categorical columns with more distinct values than this are treated as
+# identifiers and are not used for stratification.
+MAX_CATEGORIES = 20
+# Longest string cell rendered before it is truncated with an ellipsis.
+MAX_CELL_CHARS = 24
+
+
+def _categorical_columns(df: pd.DataFrame) -> List[str]:
+    columns = []
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_bool_dtype(series) or isinstance(series.dtype, pd.CategoricalDtype) \
+                or pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            if 1 < series.nunique(dropna=True) <= MAX_CATEGORIES:
+                columns.append(col)
+    return columns
+
+
+def _numeric_columns(df: pd.DataFrame) -> List[str]:
+    return [
+        col for col in df.select_dtypes(include=[np.number]).columns
+        if not pd.api.types.is_bool_dtype(df[col])
+    ]
+
+
+def _datetime_columns(df: pd.DataFrame) -> List[str]:
+    return [col for col in df.columns if pd.api.types.is_datetime64_any_dtype(df[col])]
+
+
+def _time_boundary_rows(df: pd.DataFrame) -> List[tuple]:
+    """Return ``(index, reason)`` pairs for the first and last row of each time range."""
+    rows = []
+    for col in _datetime_columns(df):
+        series = df[col].dropna()
+        if series.empty:
+            continue
+        rows.append((series.idxmin(), f"time:first {col}"))
+        rows.append((series.idxmax(), f"time:last {col}"))
+    return rows
+
+
+def _outlier_rows(df: pd.DataFrame, z_threshold: float, iqr_factor: float) -> List[tuple]:
+    """Return ``(index, reason)`` pairs for outliers, most extreme first."""
+    scored = {}  # type: Dict[object, tuple]
+    for col in _numeric_columns(df):
+        series = df[col].dropna()
+        if len(series) < 4:
+            continue
+        std = series.std()
+        q1, q3 = series.quantile(0.25), series.quantile(0.75)
+        iqr = q3 - q1
+        z = (series - series.mean()) / std if std and std > 0 else pd.Series(0.0, index=series.index)
+        low, high = q1 - iqr_factor * iqr, q3 + iqr_factor * iqr
+        flagged = (z.abs() > z_threshold) | (series < low) | (series > high)
+        for idx in series[flagged].index:
+            score = float(abs(z[idx]))
+            tag = f"outlier:{col} z={z[idx]:+.1f}"
+            # Keep the strongest reason per row when several columns flag it.
+            if idx not in scored or score > scored[idx][0]:
+                scored[idx] = (score, tag)
+    ranked = sorted(scored.items(), key=lambda item: item[1][0], reverse=True)
+    return [(idx, tag) for idx, (_, tag) in ranked]
+
+
+def _stratum_rows(df: pd.DataFrame) -> List[tuple]:
+    """Return ``(index, reason)`` pairs with one typical row per category value."""
+    numeric = _numeric_columns(df)
+    rows = []
+    for col in _categorical_columns(df):
+        for value, group in df.groupby(col, sort=True, observed=True):
+            if numeric:
+                # The row nearest to the group's median (in per-column std
+                # units) is a better representative than an arbitrary one.
+                values = group[numeric]
+                spread = values.std().replace(0, 1).fillna(1)
+                distance = ((values - values.median()) / spread).abs().sum(axis=1)
+                idx = distance.idxmin()
+            else:
+                idx = group.index[0]
+            rows.append((idx, f"stratum:{col}={value}"))
+    return rows
+
+
+def _interleave(*groups: List[tuple]) -> "OrderedDict[object, List[str]]":
+    """Round-robin over candidate groups, merging reasons for duplicate rows."""
+    merged = OrderedDict()  # type: OrderedDict[object, List[str]]
+    longest = max((len(g) for g in groups), default=0)
+    for position in range(longest):
+        for group in groups:
+            if position < len(group):
+                idx, reason = group[position]
+                merged.setdefault(idx, []).append(reason)
+    return merged
+
+
+def _format_cell(value: object) -> str:
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ""
+    if isinstance(value, pd.Timestamp):
+        if value == value.normalize():
+            return value.strftime("%Y-%m-%d")
+        return value.strftime("%Y-%m-%d %H:%M")
+    if isinstance(value, (float, np.floating)):
+        return f"{value:.6g}"
+    text = str(value).replace("|", "/").replace("\n", " ")
+    if len(text) > MAX_CELL_CHARS:
+        text = text[: MAX_CELL_CHARS - 1] + "…"
+    return text
+
+
+def sample_representative_rows(
+    df: pd.DataFrame,
+    token_budget: int = 600,
+    z_threshold: float = 3.0,
+    iqr_factor: float = 1.5,
+) -> str:
+    """Render a representative sample of ``df`` within ``token_budget`` tokens.
+
+    Args:
+        df: The dataset to sample from.
+        token_budget: Upper bound on the estimated size of the rendered text.
+        z_threshold: Absolute z-score above which a value is an outlier.
+        iqr_factor: Multiplier for the IQR fences (1.5 is Tukey's default).
+
+    Returns:
+        A pipe-separated table with a ``row`` index and ``why`` column
+        explaining the selection, followed by a one-line footer.  The text
+        is empty if the DataFrame has no rows.
+    """
+    if df.empty:
+        return ""
+
+    candidates = _interleave(
+        _time_boundary_rows(df),
+        _outlier_rows(df, z_threshold, iqr_factor),
+        _stratum_rows(df),
+    )
+
+    header = "row|why|" + "|".join(str(c) for c in df.columns)
+    footer_template = "({shown} of {total} rows shown; why = selection reason)"
+    footer_reserve = estimate_tokens(footer_template.format(shown=len(df), total=len(df)))
+    used = estimate_tokens(header) + footer_reserve
+
+    selected = {}  # type: Dict[object, str]
+    for idx, reasons in candidates.items():
+        row = df.loc[idx]
+        line = "|".join(
+            [str(idx), ",".join(reasons)] + [_format_cell(row[c]) for c in df.columns]
+        )
+        cost = estimate_tokens(line) + 1
+        if used + cost > token_budget:
+            # Later candidates are lower priority; a shorter one could still
+            # fit, but skipping around would break the interleaving order.
+            break
+        selected[idx] = line
+        used += cost
+
+    if not selected:
+        return ""
+
+    # Present rows in dataset order so time-ordered data reads naturally.
+    ordered = [selected[idx] for idx in df.index if idx in selected]
+    footer = footer_template.format(shown=len(ordered), total=len(df))
+    return "\n".join([header] + ordered + [footer])
@@ -0,0 +1,130 @@
+"""
+scaffold.py
+===========
+
+Deterministic Next.js project scaffolds for the web builder.
+
+Every generated project needs the same boilerplate – ``package.json``,
+``tsconfig.json``, ``next.config.mjs``, the root ``app/layout.tsx`` and the
+global stylesheet.  Having the LLM write it costs thousands of output tokens
+per build for text that never changes, so the web builder renders it
+locally from the versioned templates in ``scaffold_templates/<version>/``
+and asks the planner and coder for the feature-specific files only.
+
+Templates are plain files.  ``{{name}}`` placeholders are substituted on
+render; the ``*_literal`` placeholders receive JSON-quoted strings so they
+are safe inside TypeScript source.  To change the boilerplate, add a new
+version directory rather than editing an existing one, and point
+``WEB_SCAFFOLD_TEMPLATE`` (or ``DEFAULT_TEMPLATE``) at it.
+
+Usage:
+    from scaffold import render_scaffold, merge_over_scaffold
+    base = render_scaffold("todo_app", "Todo app", {"zustand": "^4"})
+    files = merge_over_scaffold(base, feature_files)
+"""
+
+import json
+import os
+import re
+from typing import Dict, List, Optional
+
+from code_checks import normalize_path
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scaffold_templates")
+DEFAULT_TEMPLATE = "nextjs-14.2"
+
+
+def template_version() -> str:
+    """The template version selected by ``WEB_SCAFFOLD_TEMPLATE`` or the default."""
+    return os.environ.get("WEB_SCAFFOLD_TEMPLATE") or DEFAULT_TEMPLATE
+
+
+def scaffold_paths(version: Optional[str] = None) -> List[str]:
+    """Relative paths (POSIX style) of the files a scaffold version provides."""
+    root = os.path.join(TEMPLATES_DIR, version or template_version())
+    if not os.path.isdir(root):
+        raise RuntimeError(f"Unknown scaffold template '{version or template_version()}'")
+    paths = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            rel = os.path.relpath(os.path.join(dirpath, filename), root)
+            paths.append(rel.replace(os.sep, "/"))
+    return sorted(paths)
+
+
+def _package_name(project_name: str) -> str:
+    # npm names: lowercase, URL-safe, at most 214 characters.
+    name = re.sub(r"[^a-z0-9._-]+", "-", project_name.lower()).strip("-._")
+    return (name or "nextjs-project")[:214]
+
+
+def render_scaffold(
+    project_name: str,
+    description: str,
+    extra_dependencies: Optional[Dict[str, str]] = None,
+    version: Optional[str] = None,
+) -> Dict[str, str]:
+    """Render a scaffold into a ``{path: content}`` mapping.
+
+    Args:
+        project_name: Project slug; also used (npm-normalised) as the package name.
+        description: Human readable description used for the page metadata.
+        extra_dependencies: Additional npm dependencies requested by the plan.
+        version: Template version; defaults to :func:`template_version`.
+    """
+    version = version or template_version()
+    root = os.path.join(TEMPLATES_DIR, version)
+    values = {
+        "package_name": _package_name(project_name),
+        "title_literal": json.dumps(description[:60]),
+        "description_literal": json.dumps(description[:200]),
+    }
+    files = {}  # type: Dict[str, str]
+    for rel_path in scaffold_paths(version):
+        with open(os.path.join(root, rel_path), "r", encoding="utf-8") as f:
+            content = f.read()
+        for key, value in values.items():
+            content = content.replace("{{" + key + "}}", value)
+        files[rel_path] = content
+
+    if extra_dependencies and "package.json" in files:
+        package = json.loads(files["package.json"])
+        for name, spec in extra_dependencies.items():
+            if isinstance(name, str) and isinstance(spec, str):
+                package["dependencies"].setdefault(name, spec)
+        files["package.json"] = json.dumps(package, indent=2) + "\n"
+    return files
+
+
+def merge_over_scaffold(scaffold: Dict[str, str], features: Dict[str, str]) -> Dict[str, str]:
+    """Overlay generated feature files on the scaffold.
+
+    Feature files win, except that a generated ``package.json`` is merged
+    into the scaffold's (dependencies and scripts are added, nothing
+    required is removed) so it cannot drop the pinned Next.js setup.
+    """
+    merged = dict(scaffold)
+    for path, content in features.items():
+        clean = normalize_path(path)
+        if clean == "package.json" and "package.json" in scaffold:
+            merged["package.json"] = _merge_package_json(scaffold["package.json"], content)
+        else:
+            merged[clean] = content
+    return merged
+
+
+def _merge_package_json(base_json: str, generated_json: str) -> str:
+    base = json.loads(base_json)
+    try:
+        generated = json.loads(generated_json)
+    except ValueError:
+        return base_json
+    if not isinstance(generated, dict):
+        return base_json
+    for section in ("dependencies", "devDependencies", "scripts"):
+        extra = generated.get(section)
+        if isinstance(extra, dict):
+            target = base.setdefault(section, {})
+            for key, value in extra.items():
+                target.setdefault(key, value)
+    return json.dumps(base, indent=2) + "\n"
@@ -0,0 +1,442 @@
+"""
+scheduler.py
+============
+
+Admission control and fair scheduling in front of the agent scripts.
+
+Every API request used to spawn its crew immediately, so one user firing
+web builds could occupy every worker and drain the shared provider quota
+(used when a user has no own key in ``user_settings``).  The routes now
+start the agents through this wrapper::
+
+    python scheduler.py run --user <id> --agent web [--shared-quota] web_builder_agent.py "<spec>"
+
+which waits for a slot, runs the script with the same stdout/stderr and
+exits with its exit code.
+
+* Concurrency is limited globally, per user and per agent type.
+* Waiting runs are dispatched by weighted fair queuing: each run gets a
+  virtual finish tag ``max(V, user's last tag) + cost / weight`` when it
+  is admitted, and the eligible run with the smallest tag starts next.  A
+  user with many queued runs is therefore interleaved with everyone
+  else instead of being served first-come-first-served.
+* Runs on the shared provider quota reserve their estimated requests and
+  tokens in a one-minute window and only start when the window has room
+  (``AGENT_SCHED_RPM``/``AGENT_SCHED_TPM``).  Each LLM call reported by
+  the running agent (``report_llm_usage``) is charged and shrinks the
+  remaining reservation by the same amount, so until the run finishes it
+  is charged ``max(estimate, actual)``.
+* Overload is rejected up front: when the user already has too many runs,
+  the queue is full, or the expected wait exceeds ``AGENT_SCHED_MAX_WAIT``,
+  the wrapper prints ``{"error", "retry_after"}`` and exits with
+  ``REJECTED_EXIT_CODE`` (75), which the routes turn into HTTP 429 with a
+  ``Retry-After`` header.
+
+The state is a SQLite database shared by all wrapper processes; waiting
+and running entries hold a lease that their process keeps renewing, so a
+killed wrapper never blocks a slot for longer than ``LEASE_SECONDS``.
+
+Configuration (environment variables):
+
+    AGENT_SCHED_DB            SQLite path (default: python/.data/scheduler.sqlite3).
+    AGENT_SCHED_MAX_RUNNING   Concurrent runs overall (default 4).
+    AGENT_SCHED_USER_RUNNING  Concurrent runs per user (default 2).
+    AGENT_SCHED_AGENT_LIMITS  Concurrent runs per agent type (default "web=2,blog=3,data=2").
+    AGENT_SCHED_USER_QUEUE    Runs (waiting + running) one user may have (default 4).
+    AGENT_SCHED_MAX_QUEUE     Waiting runs overall (default 32).
+    AGENT_SCHED_MAX_WAIT      Seconds a run may wait for a slot (default 120).
+    AGENT_SCHED_WEIGHTS       Per-user weights, e.g. "user-a=2,user-b=0.5" (default 1).
+    AGENT_SCHED_RPM           Shared-quota LLM requests per minute (0 = untracked).
+    AGENT_SCHED_TPM           Shared-quota LLM tokens per minute (0 = untracked).
+
+Usage:
+    python scheduler.py run --user <id> --agent <blog|web|data> [--shared-quota] <script> [args...]
+    python scheduler.py status
+"""
+
+import json
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import time
+import uuid
+from typing import Dict, Tuple
+
+from token_budget import estimate_tokens
+
+DEFAULT_DB_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".data", "scheduler.sqlite3"
+)
+# EX_TEMPFAIL: the request was valid but should be retried later.
+REJECTED_EXIT_CODE = 75
+LEASE_SECONDS = 30
+POLL_SECONDS = 0.25
+WINDOW_SECONDS = 60
+# Estimated LLM requests and tokens of one run, used for the quota
+# reservation and as the fair-queuing cost until real durations are known.
+AGENT_COSTS = {
+    "blog": (4, 12000),
+    "web": (6, 40000),
+    "data": (4, 10000),
+}
+DEFAULT_COST = (4, 10000)
+# Expected run time before any run of the agent type has finished.
+DEFAULT_DURATION_SECONDS = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    agent_type TEXT NOT NULL,
+    status TEXT NOT NULL CHECK (status IN ('queued', 'running')),
+    tag REAL NOT NULL,
+    shared_quota INTEGER NOT NULL DEFAULT 0,
+    enqueued_at REAL NOT NULL,
+    started_at REAL,
+    lease_expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_runs_status_tag ON runs(status, tag);
+CREATE TABLE IF NOT EXISTS user_tags (
+    user_id TEXT PRIMARY KEY,
+    last_tag REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS usage (
+    run_id TEXT NOT NULL,
+    at REAL NOT NULL,
+    requests INTEGER NOT NULL,
+    tokens INTEGER NOT NULL,
+    estimated INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_usage_at ON usage(at);
+CREATE TABLE IF NOT EXISTS durations (
+    agent_type TEXT PRIMARY KEY,
+    avg_seconds REAL NOT NULL
+);
+"""
+
+
+class Rejected(Exception):
+    """The run was not admitted; retry after ``retry_after`` seconds."""
+
+    def __init__(self, message: str, retry_after: float) -> None:
+        super().__init__(message)
+        self.retry_after = max(1, int(round(retry_after)))
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default) or default)
+
+
+def _parse_mapping(value: str) -> Dict[str, float]:
+    mapping = {}  # type: Dict[str, float]
+    for item in value.split(","):
+        key, sep, number = item.partition("=")
+        if sep and key.strip():
+            try:
+                mapping[key.strip()] = float(number)
+            except ValueError:
+                continue
+    return mapping
+
+
+def _agent_limit(agent_type: str) -> int:
+    limits = _parse_mapping(os.environ.get("AGENT_SCHED_AGENT_LIMITS", "web=2,blog=3,data=2"))
+    return int(limits.get(agent_type, _env_int("AGENT_SCHED_MAX_RUNNING", 4)))
+
+
+def _weight(user_id: str) -> float:
+    weight = _parse_mapping(os.environ.get("AGENT_SCHED_WEIGHTS", "")).get(user_id, 1.0)
+    return weight if weight > 0 else 1.0
+
+
+def connect() -> sqlite3.Connection:
+    """Open the scheduler database, creating it on first use."""
+    path = os.environ.get("AGENT_SCHED_DB") or DEFAULT_DB_PATH
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _expire(conn: sqlite3.Connection, now: float) -> None:
+    """Drop runs whose wrapper stopped renewing its lease, and old usage."""
+    conn.execute("DELETE FROM runs WHERE lease_expires_at < ?", (now,))
+    conn.execute("DELETE FROM usage WHERE at < ?", (now - WINDOW_SECONDS,))
+
+
+def _avg_duration(conn: sqlite3.Connection, agent_type: str) -> float:
+    row = conn.execute(
+        "SELECT avg_seconds FROM durations WHERE agent_type = ?", (agent_type,)
+    ).fetchone()
+    return row["avg_seconds"] if row is not None else DEFAULT_DURATION_SECONDS
+
+
+def _window_usage(conn: sqlite3.Connection, now: float) -> Tuple[int, int]:
+    row = conn.execute(
+        "SELECT COALESCE(SUM(requests), 0), COALESCE(SUM(tokens), 0) FROM usage WHERE at >= ?",
+        (now - WINDOW_SECONDS,),
+    ).fetchone()
+    return row[0], row[1]
+
+
+def _quota_allows(conn: sqlite3.Connection, agent_type: str, now: float) -> bool:
+    rpm = _env_int("AGENT_SCHED_RPM", 0)
+    tpm = _env_int("AGENT_SCHED_TPM", 0)
+    if not rpm and not tpm:
+        return True
+    requests, tokens = _window_usage(conn, now)
+    est_requests, est_tokens = AGENT_COSTS.get(agent_type, DEFAULT_COST)
+    # An idle window always admits one run, even if its estimate alone is too big.
+    if requests == 0 and tokens == 0:
+        return True
+    return (not rpm or requests + est_requests <= rpm) and (not tpm or tokens + est_tokens <= tpm)
+
+
+def admit(conn: sqlite3.Connection, user_id: str, agent_type: str, shared_quota: bool) -> str:
+    """Queue a run after the admission checks; return its id or raise ``Rejected``."""
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _expire(conn, now)
+        avg = _avg_duration(conn, agent_type)
+        max_running = max(1, _env_int("AGENT_SCHED_MAX_RUNNING", 4))
+        user_runs = conn.execute(
+            "SELECT COUNT(*) FROM runs WHERE user_id = ?", (user_id,)
+        ).fetchone()[0]
+        if user_runs >= _env_int("AGENT_SCHED_USER_QUEUE", 4):
+            raise Rejected("Too many runs in progress for this user", avg)
+        queued = conn.execute("SELECT COUNT(*) FROM runs WHERE status = 'queued'").fetchone()[0]
+        expected_wait = queued / max_running * avg
+        if queued >= _env_int("AGENT_SCHED_MAX_QUEUE", 32) or expected_wait > _env_int("AGENT_SCHED_MAX_WAIT", 120):
+            raise Rejected("The agents are busy", max(expected_wait, avg / 2))
+
+        row = conn.execute("SELECT value FROM meta WHERE key = 'virtual_time'").fetchone()
+        virtual_time = row["value"] if row is not None else 0.0
+        row = conn.execute("SELECT last_tag FROM user_tags WHERE user_id = ?", (user_id,)).fetchone()
+        start_tag = max(virtual_time, row["last_tag"] if row is not None else 0.0)
+        cost = AGENT_COSTS.get(agent_type, DEFAULT_COST)[1] / 1000.0
+        tag = start_tag + cost / _weight(user_id)
+        conn.execute(
+            "INSERT INTO user_tags (user_id, last_tag) VALUES (?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET last_tag = excluded.last_tag",
+            (user_id, tag),
+        )
+        run_id = uuid.uuid4().hex
+        conn.execute(
+            "INSERT INTO runs (id, user_id, agent_type, status, tag, shared_quota, enqueued_at, "
+            "lease_expires_at) VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)",
+            (run_id, user_id, agent_type, tag, int(shared_quota), now, now + LEASE_SECONDS),
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return run_id
+
+
+def try_start(conn: sqlite3.Connection, run_id: str) -> bool:
+    """Start ``run_id`` if it is the next eligible run; renew its lease otherwise.
+
+    Every waiting wrapper evaluates the same choice (smallest tag among the
+    runs whose user, agent type and quota limits allow them to start), so
+    exactly one of them moves its run to ``running``.
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _expire(conn, now)
+        conn.execute(
+            "UPDATE runs SET lease_expires_at = ? WHERE id = ?", (now + LEASE_SECONDS, run_id)
+        )
+        running = conn.execute("SELECT user_id, agent_type FROM runs WHERE status = 'running'").fetchall()
+        started = False
+        if len(running) < max(1, _env_int("AGENT_SCHED_MAX_RUNNING", 4)):
+            by_user = {}  # type: Dict[str, int]
+            by_agent = {}  # type: Dict[str, int]
+            for r in running:
+                by_user[r["user_id"]] = by_user.get(r["user_id"], 0) + 1
+                by_agent[r["agent_type"]] = by_agent.get(r["agent_type"], 0) + 1
+            user_limit = _env_int("AGENT_SCHED_USER_RUNNING", 2)
+            for candidate in conn.execute(
+                "SELECT * FROM runs WHERE status = 'queued' ORDER BY tag, enqueued_at"
+            ).fetchall():
+                if by_user.get(candidate["user_id"], 0) >= user_limit:
+                    continue
+                if by_agent.get(candidate["agent_type"], 0) >= _agent_limit(candidate["agent_type"]):
+                    continue
+                if candidate["shared_quota"] and not _quota_allows(conn, candidate["agent_type"], now):
+                    continue
+                if candidate["id"] == run_id:
+                    conn.execute(
+                        "UPDATE runs SET status = 'running', started_at = ? WHERE id = ?",
+                        (now, run_id),
+                    )
+                    conn.execute(
+                        "INSERT INTO meta (key, value) VALUES ('virtual_time', ?) "
+                        "ON CONFLICT(key) DO UPDATE SET value = MAX(value, excluded.value)",
+                        (candidate["tag"],),
+                    )
+                    if candidate["shared_quota"]:
+                        est_requests, est_tokens = AGENT_COSTS.get(candidate["agent_type"], DEFAULT_COST)
+                        conn.execute(
+                            "INSERT INTO usage (run_id, at, requests, tokens, estimated) "
+                            "VALUES (?, ?, ?, ?, 1)",
+                            (run_id, now, est_requests, est_tokens),
+                        )
+                    started = True
+                break  # the first eligible run is the one that starts
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return started
+
+
+def renew(conn: sqlite3.Connection, run_id: str) -> None:
+    conn.execute(
+        "UPDATE runs SET lease_expires_at = ? WHERE id = ?", (time.time() + LEASE_SECONDS, run_id)
+    )
+
+
+def finish(conn: sqlite3.Connection, run_id: str) -> None:
+    """Release the slot and the unused reservation; fold the run time into the average."""
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+        conn.execute("DELETE FROM runs WHERE id = ?", (run_id,))
+        if row is not None and row["started_at"] is not None:
+            duration = now - row["started_at"]
+            conn.execute(
+                "INSERT INTO durations (agent_type, avg_seconds) VALUES (?, ?) "
+                "ON CONFLICT(agent_type) DO UPDATE SET avg_seconds = 0.7 * avg_seconds + 0.3 * ?",
+                (row["agent_type"], duration, duration),
+            )
+        # The run is over: only the calls it actually made stay in the window.
+        conn.execute("DELETE FROM usage WHERE run_id = ? AND estimated = 1", (run_id,))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def report_llm_usage(prompt: object, response: object) -> None:
+    """Record one LLM call of the current run against the shared-quota window.
+
+    Called from the LLM wrappers; a no-op outside a scheduled shared-quota
+    run.  The call is taken out of the run's remaining estimated
+    reservation, so a run never holds less than its estimate until
+    ``finish`` releases what is left of it.
+    """
+    run_id = os.environ.get("SCHED_RUN_ID")
+    if not run_id or os.environ.get("SCHED_SHARED_QUOTA") != "1":
+        return
+    tokens = estimate_tokens(prompt if isinstance(prompt, str) else json.dumps(prompt, default=str))
+    tokens += estimate_tokens(response if isinstance(response, str) else str(response))
+    try:
+        conn = connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "UPDATE usage SET requests = MAX(requests - 1, 0), tokens = MAX(tokens - ?, 0) "
+                "WHERE run_id = ? AND estimated = 1",
+                (tokens, run_id),
+            )
+            conn.execute(
+                "INSERT INTO usage (run_id, at, requests, tokens, estimated) VALUES (?, ?, 1, ?, 0)",
+                (run_id, time.time(), tokens),
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        pass  # accounting must never fail a run
+
+
+def run(user_id: str, agent_type: str, shared_quota: bool, script: str, args: list) -> int:
+    """Wait for a slot, run ``script`` and return its exit code.
+
+    Raises:
+        Rejected: when the run is not admitted or waits longer than
+            ``AGENT_SCHED_MAX_WAIT``.
+    """
+    conn = connect()
+    try:
+        run_id = admit(conn, user_id, agent_type, shared_quota)
+        deadline = time.time() + _env_int("AGENT_SCHED_MAX_WAIT", 120)
+        try:
+            while not try_start(conn, run_id):
+                if time.time() > deadline:
+                    raise Rejected("Timed out waiting for a free agent", _avg_duration(conn, agent_type))
+                time.sleep(POLL_SECONDS)
+
+            env = dict(os.environ, SCHED_RUN_ID=run_id, SCHED_SHARED_QUOTA="1" if shared_quota else "0")
+            process = subprocess.Popen([sys.executable, "-W", "ignore", script] + list(args), env=env)
+            # Forward termination to the agent so a cancelled request frees its slot.
+            signal.signal(signal.SIGTERM, lambda *_: process.terminate())
+            while True:
+                try:
+                    return process.wait(timeout=LEASE_SECONDS / 3)
+                except subprocess.TimeoutExpired:
+                    renew(conn, run_id)
+        finally:
+            finish(conn, run_id)
+    finally:
+        conn.close()
+
+
+def status() -> dict:
+    """Current runs, provider window usage and average run times."""
+    conn = connect()
+    try:
+        now = time.time()
+        runs = [
+            dict(r) for r in conn.execute(
+                "SELECT id, user_id, agent_type, status, tag, enqueued_at, started_at "
+                "FROM runs WHERE lease_expires_at >= ? ORDER BY status, tag",
+                (now,),
+            )
+        ]
+        requests, tokens = _window_usage(conn, now)
+        durations = {
+            r["agent_type"]: round(r["avg_seconds"], 1) for r in conn.execute("SELECT * FROM durations")
+        }
+    finally:
+        conn.close()
+    return {"runs": runs, "window": {"requests": requests, "tokens": tokens}, "avg_seconds": durations}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Admission control for the agent scripts")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run", help="run an agent script once a slot is free")
+    run_parser.add_argument("--user", default="anonymous")
+    run_parser.add_argument("--agent", required=True, help="agent type (blog, web, data)")
+    run_parser.add_argument("--shared-quota", action="store_true",
+                            help="the run uses the server's provider keys")
+    run_parser.add_argument("script")
+    run_parser.add_argument("args", nargs=argparse.REMAINDER)
+    sub.add_parser("status", help="print the scheduler state as JSON")
+    cli = parser.parse_args()
+
+    if cli.command == "status":
+        print(json.dumps(status()))
+        sys.exit(0)
+    script_path = cli.script if os.path.isabs(cli.script) else os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), os.path.basename(cli.script)
+    )
+    try:
+        sys.exit(run(cli.user, cli.agent, cli.shared_quota, script_path, cli.args))
+    except Rejected as e:
+        print(json.dumps({"error": str(e), "retry_after": e.retry_after}))
+        sys.exit(REJECTED_EXIT_CODE)
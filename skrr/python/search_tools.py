@@ -0,0 +1,124 @@
+"""
+search_tools.py
+===============
+
+Web search for the agents, sent through the shared HTTP pool.
+
+``crewai_tools.SerperDevTool`` opens a fresh ``requests`` connection for
+every query.  ``SerperSearchTool`` calls the same Serper endpoint through
+``http_transport`` so that consecutive searches reuse one keep-alive
+connection, and exposes the plain ``serper_search`` function for code that
+searches without going through an agent.
+
+Results are kept in a small in-process LRU cache, so concurrent crews in
+one process (batch runs) that issue the same query only pay for it once.
+
+    AGENT_SEARCH_CACHE_SIZE   Cached queries (default 256, 0 disables).
+    AGENT_SEARCH_CACHE_TTL    Seconds a cached result stays valid (default 3600).
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple, Type
+
+from pydantic import BaseModel, Field
+
+from http_transport import new_http_client
+from tracing import span
+
+SERPER_BASE_URL = "https://google.serper.dev"
+
+try:
+    from crewai.tools import BaseTool  # type: ignore
+except Exception:  # crewai missing or too old; callers fall back to no search
+    BaseTool = None  # type: ignore
+
+
+_cache = OrderedDict()  # type: OrderedDict[Tuple[str, int], Tuple[float, List[dict]]]
+_cache_lock = threading.Lock()
+
+
+def serper_search(query: str, api_key: str, num_results: int = 8) -> List[dict]:
+    """Return Serper's organic results as ``{"title", "link", "snippet"}`` dicts."""
+    key = (" ".join(query.lower().split()), num_results)
+    max_size = int(os.environ.get("AGENT_SEARCH_CACHE_SIZE", "256"))
+    ttl = float(os.environ.get("AGENT_SEARCH_CACHE_TTL", "3600"))
+    with span("search.serper", query=query) as s:
+        if max_size > 0:
+            with _cache_lock:
+                entry = _cache.get(key)
+                if entry is not None and time.time() - entry[0] < ttl:
+                    _cache.move_to_end(key)
+                    s.set("cache_hit", True)
+                    return entry[1]
+        s.set("cache_hit", False)
+        results = _fetch_serper(query, api_key, num_results)
+        s.set("results", len(results))
+    if max_size > 0:
+        with _cache_lock:
+            _cache[key] = (time.time(), results)
+            _cache.move_to_end(key)
+            while len(_cache) > max_size:
+                _cache.popitem(last=False)
+    return results
+
+
+def _fetch_serper(query: str, api_key: str, num_results: int) -> List[dict]:
+    with new_http_client(
+        base_url=SERPER_BASE_URL,
+        headers={"X-API-KEY": api_key, "Content-Type": "application/json"},
+    ) as client:
+        response = client.post("/search", json={"q": query, "num": num_results})
+        response.raise_for_status()
+        payload = response.json()
+    return [
+        {
+            "title": item.get("title", ""),
+            "link": item.get("link", ""),
+            "snippet": item.get("snippet", ""),
+        }
+        for item in payload.get("organic", [])[:num_results]
+    ]
+
+
+def format_results(results: List[dict]) -> str:
+    """Render search results compactly for an LLM prompt."""
+    if not results:
+        return "No results found."
+    return "\n".join(
+        f"{i}. {r['title']}\n   {r['link']}\n   {r['snippet']}"
+        for i, r in enumerate(results, 1)
+    )
+
+
+class SerperSearchInput(BaseModel):
+    search_query: str = Field(..., description="The query to search the internet for")
+
+
+if BaseTool is not None:
+
+    class SerperSearchTool(BaseTool):
+        """CrewAI tool for Google search via Serper over the shared HTTP pool."""
+
+        name: str = "Search the internet"
+        description: str = (
+            "Searches the internet with Google (via Serper) and returns titles, links and snippets."
+        )
+        args_schema: Type[BaseModel] = SerperSearchInput
+        api_key: str = ""
+        num_results: int = 8
+
+        def _run(self, search_query: str) -> str:
+            return format_results(serper_search(search_query, self.api_key, self.num_results))
+
+else:
+    SerperSearchTool = None  # type: ignore
+
+
+def build_search_tool(api_key: Optional[str]):
+    """Return a search tool for ``api_key``, or None when search is unavailable."""
+    if not api_key or SerperSearchTool is None:
+        return None
+    return SerperSearchTool(api_key=api_key)
@@ -0,0 +1,50 @@
+"""
+token_budget.py
+===============
+
+Small helpers for keeping prompt fragments within a fixed token budget.
+
+The agents do not ship a tokenizer, so token counts are estimated from the
+character length of the text.  The estimate is deliberately conservative
+(about four characters per token for English/code, which over-counts for
+most model tokenizers) so that a fragment that fits the budget here will
+also fit once it reaches the provider.
+"""
+
+import math
+from typing import Iterable, List
+
+# Rough average number of characters per token for GPT/Gemini style BPE
+# tokenizers.  Korean text tokenizes denser, so callers that mostly deal with
+# Korean prompts should pass smaller budgets rather than change this value.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Return an approximate token count for ``text``."""
+    if not text:
+        return 0
+    return int(math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def take_within_budget(chunks: Iterable[str], budget: int, separator: str = "\n") -> List[str]:
+    """Return the longest prefix of ``chunks`` whose joined size fits ``budget``.
+
+    Args:
+        chunks: Text fragments in priority order.
+        budget: Maximum number of (estimated) tokens for the joined text.
+        separator: String used to join the fragments.
+
+    Returns:
+        The fragments that fit, in their original order.
+    """
+    taken = []  # type: List[str]
+    used = 0
+    sep_cost = len(separator)
+    for chunk in chunks:
+        cost = len(chunk) + (sep_cost if taken else 0)
+        if int(math.ceil((used + cost) / CHARS_PER_TOKEN)) > budget:
+            break
+        taken.append(chunk)
+        used += cost
+    return taken
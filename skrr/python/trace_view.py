@@ -0,0 +1,206 @@
+"""
+trace_view.py
+=============
+
+Render the span files written by ``tracing.py`` (fully offline).
+
+* ``list`` shows the most recent runs with their root span and duration.
+* ``show`` prints one run as an indented timeline: every span with its
+  start offset, duration and a bar positioned on the run's time axis, so
+  nesting (task -> LLM call -> retry) and gaps are visible at a glance.
+  ``--summary`` adds a flat profile (count, total and self time per span
+  name), the textual equivalent of a flame graph.
+* ``chrome`` exports a run in the Chrome trace-event format, which
+  ``chrome://tracing`` and the Perfetto UI load from a local file.
+
+``latest`` can be used instead of a trace id.
+
+Usage:
+    python trace_view.py list [-n 20]
+    python trace_view.py show <trace_id|latest> [--width 50] [--summary]
+    python trace_view.py chrome <trace_id|latest> [-o trace.json]
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List
+
+from tracing import DEFAULT_TRACE_DIR
+
+
+def _trace_dir() -> str:
+    return os.environ.get("AGENT_TRACE_DIR") or DEFAULT_TRACE_DIR
+
+
+def _trace_files() -> List[str]:
+    """Trace files, most recently written first."""
+    return sorted(glob.glob(os.path.join(_trace_dir(), "*.jsonl")), key=os.path.getmtime, reverse=True)
+
+
+def load_spans(trace_id: str) -> List[dict]:
+    """Read the spans of ``trace_id`` (or of the newest trace for ``latest``)."""
+    if trace_id == "latest":
+        files = _trace_files()
+        if not files:
+            raise FileNotFoundError(f"No traces in {_trace_dir()}")
+        path = files[0]
+    else:
+        path = os.path.join(_trace_dir(), f"{trace_id}.jsonl")
+    spans = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                spans.append(json.loads(line))
+            except ValueError:
+                continue  # a line cut short by a killed process
+    return spans
+
+
+def _children(spans: List[dict]) -> Dict[object, List[dict]]:
+    """Map span id -> child spans (roots under None), each list ordered by start."""
+    ids = {s["span_id"] for s in spans}
+    tree = defaultdict(list)  # type: Dict[object, List[dict]]
+    for s in spans:
+        # Spans whose parent never finished (crashed run) are shown as roots.
+        tree[s["parent_id"] if s["parent_id"] in ids else None].append(s)
+    for children in tree.values():
+        children.sort(key=lambda s: s["start"])
+    return tree
+
+
+def _label(s: dict) -> str:
+    attrs = s.get("attributes") or {}
+    detail = ", ".join(f"{k}={v}" for k, v in attrs.items() if v is not None)
+    label = s["name"] + (f" [{detail}]" if detail else "")
+    if s.get("status") == "error":
+        label += f"  !! {s.get('error')}"
+    return label
+
+
+def render_timeline(spans: List[dict], width: int = 50) -> str:
+    """Indented span tree with offsets, durations and timeline bars."""
+    if not spans:
+        return "(no spans)"
+    t0 = min(s["start"] for s in spans)
+    t1 = max(s["start"] + s["duration_ms"] / 1000 for s in spans)
+    total = max(t1 - t0, 1e-9)
+    tree = _children(spans)
+    lines = [f"trace {spans[0]['trace_id']}  {datetime.fromtimestamp(t0):%Y-%m-%d %H:%M:%S}  "
+             f"{total * 1000:.0f} ms  {len(spans)} spans"]
+
+    def walk(parent: object, depth: int) -> None:
+        for s in tree.get(parent, []):
+            offset = s["start"] - t0
+            begin = int(offset / total * width)
+            length = max(1, int(s["duration_ms"] / 1000 / total * width))
+            bar = " " * begin + "#" * min(length, width - begin)
+            lines.append(
+                f"{offset * 1000:>9.0f} {s['duration_ms']:>9.1f} ms |{bar:<{width}}| "
+                f"{'  ' * depth}{_label(s)}"
+            )
+            walk(s["span_id"], depth + 1)
+
+    walk(None, 0)
+    return "\n".join(lines)
+
+
+def render_summary(spans: List[dict]) -> str:
+    """Flat profile: count, total and self time (excluding children) per span name."""
+    child_time = defaultdict(float)  # type: Dict[str, float]
+    for s in spans:
+        if s["parent_id"]:
+            child_time[s["parent_id"]] += s["duration_ms"]
+    rows = defaultdict(lambda: [0, 0.0, 0.0])  # type: Dict[str, list]
+    for s in spans:
+        row = rows[s["name"]]
+        row[0] += 1
+        row[1] += s["duration_ms"]
+        # Children running concurrently can exceed the parent; clamp at 0.
+        row[2] += max(0.0, s["duration_ms"] - child_time[s["span_id"]])
+    lines = [f"{'span':<28} {'count':>6} {'total ms':>11} {'self ms':>11}"]
+    for name, (count, total, self_ms) in sorted(rows.items(), key=lambda r: -r[1][2]):
+        lines.append(f"{name:<28} {count:>6} {total:>11.1f} {self_ms:>11.1f}")
+    return "\n".join(lines)
+
+
+def to_chrome_trace(spans: List[dict]) -> dict:
+    """Convert spans to Chrome trace-event JSON (complete ``X`` events)."""
+    threads = {}  # type: Dict[tuple, int]
+    events = []
+    for s in spans:
+        tid = threads.setdefault((s.get("pid"), s.get("thread")), len(threads) + 1)
+        events.append({
+            "name": s["name"],
+            "cat": s["name"].split(".")[0],
+            "ph": "X",
+            "ts": s["start"] * 1e6,
+            "dur": s["duration_ms"] * 1e3,
+            "pid": s.get("pid", 0),
+            "tid": tid,
+            "args": dict(s.get("attributes") or {}, status=s.get("status"), error=s.get("error")),
+        })
+    for (pid, thread), tid in threads.items():
+        events.append({"name": "thread_name", "ph": "M", "pid": pid or 0, "tid": tid,
+                       "args": {"name": thread}})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def _list_traces(limit: int) -> str:
+    lines = []
+    for path in _trace_files()[:limit]:
+        trace_id = os.path.splitext(os.path.basename(path))[0]
+        try:
+            spans = load_spans(trace_id)
+        except OSError:
+            continue
+        roots = _children(spans).get(None, [])
+        root = max(roots, key=lambda s: s["duration_ms"]) if roots else None
+        lines.append(
+            f"{trace_id}  {datetime.fromtimestamp(os.path.getmtime(path)):%Y-%m-%d %H:%M:%S}  "
+            f"{len(spans):>5} spans  "
+            + (f"{root['duration_ms']:>10.0f} ms  {_label(root)}" if root else "")
+        )
+    return "\n".join(lines) or f"No traces in {_trace_dir()}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render agent run traces")
+    sub = parser.add_subparsers(dest="command", required=True)
+    list_parser = sub.add_parser("list", help="list recent traces")
+    list_parser.add_argument("-n", type=int, default=20)
+    show_parser = sub.add_parser("show", help="print a trace as a timeline")
+    show_parser.add_argument("trace_id")
+    show_parser.add_argument("--width", type=int, default=50)
+    show_parser.add_argument("--summary", action="store_true", help="append a per-span-name profile")
+    chrome_parser = sub.add_parser("chrome", help="export a trace for chrome://tracing / Perfetto")
+    chrome_parser.add_argument("trace_id")
+    chrome_parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "list":
+            print(_list_traces(args.n))
+        elif args.command == "show":
+            trace_spans = load_spans(args.trace_id)
+            print(render_timeline(trace_spans, args.width))
+            if args.summary:
+                print()
+                print(render_summary(trace_spans))
+        else:
+            payload = json.dumps(to_chrome_trace(load_spans(args.trace_id)))
+            if args.output:
+                with open(args.output, "w", encoding="utf-8") as f:
+                    f.write(payload)
+            else:
+                print(payload)
+    except FileNotFoundError as e:
+        sys.stderr.write(f"{e}\n")
+        sys.exit(1)
@@ -0,0 +1,259 @@
+"""
+tracing.py
+==========
+
+Lightweight, offline, OpenTelemetry-style spans for the agent runtime.
+
+A run is one *trace*; every timed operation inside it (crew kickoff, each
+task, each LLM call, searches, image lookups, file writes, zipping, Notion
+publishing) is a *span* with a parent, so a slow run can be read as a tree:
+which task issued which LLM call, which tool call it waited on and how many
+publish attempts were needed.
+
+The trace id is threaded in from the API route through the ``TRACE_ID``
+environment variable (the route returns it in the ``x-trace-id`` response
+header), so the spans of one request can be found again.  Scripts started
+without one get a fresh id.  Parent spans are tracked with ``contextvars``;
+use ``bind_context`` when handing work to a thread pool so that worker
+spans nest under the span that scheduled them.
+
+Finished spans are appended as JSON lines to ``<AGENT_TRACE_DIR>/<trace_id>.jsonl``.
+Nothing is sent over the network; ``trace_view.py`` renders the files as a
+timeline or exports them for ``chrome://tracing`` / Perfetto.
+
+Configuration (environment variables):
+
+    TRACE_ID          Trace id of the current run (32 hex chars; set by the route).
+    AGENT_TRACE_DIR   Directory of the JSONL files (default: python/.data/traces).
+    AGENT_TRACE       Set to 0 to disable tracing.
+
+Usage:
+    from tracing import span, traced
+    with span("notion.publish", post_id=post_id) as s:
+        ...
+        s.set("url", url)
+
+    @traced("files.write")
+    def _write_files(...): ...
+"""
+
+import contextvars
+import functools
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+DEFAULT_TRACE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data", "traces")
+# Attribute values are truncated so prompts or file contents never bloat a trace.
+MAX_ATTRIBUTE_CHARS = 200
+
+_TRACE_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_trace_override = contextvars.ContextVar("trace_override", default=None)
+_process_trace_id = None  # type: Optional[str]
+_write_lock = threading.Lock()
+_patch_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return os.environ.get("AGENT_TRACE", "1") != "0"
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex
+
+
+def current_trace_id() -> str:
+    """The trace id of the current context (``use_trace``), run or process."""
+    global _process_trace_id
+    override = _trace_override.get()
+    if override:
+        return override
+    if _process_trace_id is None:
+        env_id = os.environ.get("TRACE_ID", "").strip().lower()
+        _process_trace_id = env_id if _TRACE_ID_RE.match(env_id) else new_trace_id()
+    return _process_trace_id
+
+
+def _trace_path(trace_id: str) -> str:
+    return os.path.join(os.environ.get("AGENT_TRACE_DIR") or DEFAULT_TRACE_DIR, f"{trace_id}.jsonl")
+
+
+def _clean(value: object) -> object:
+    if isinstance(value, (bool, int, float)) or value is None:
+        return value
+    text = str(value)
+    return text if len(text) <= MAX_ATTRIBUTE_CHARS else text[:MAX_ATTRIBUTE_CHARS] + "..."
+
+
+class Span:
+    """One timed operation; written out when it ends."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes",
+                 "start", "_start_perf", "status", "error")
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, object]) -> None:
+        self.trace_id = parent.trace_id if parent is not None else current_trace_id()
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.name = name
+        self.attributes = {k: _clean(v) for k, v in attributes.items()}
+        self.start = time.time()
+        self._start_perf = time.perf_counter()
+        self.status = "ok"
+        self.error = None  # type: Optional[str]
+
+    def set(self, key: str, value: object) -> None:
+        self.attributes[key] = _clean(value)
+
+    def end(self) -> None:
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round((time.perf_counter() - self._start_perf) * 1000, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+            "pid": os.getpid(),
+            "thread": threading.current_thread().name,
+        }
+        path = _trace_path(self.trace_id)
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # One append per line keeps concurrent processes from interleaving.
+            with _write_lock, open(path, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError:
+            pass  # tracing must never break a run
+
+
+class _NoopSpan:
+    status = "ok"
+    error = None
+
+    def set(self, key: str, value: object) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[object]:
+    """Time the enclosed block as a child of the current span.
+
+    Exceptions are recorded on the span (status ``error``) and re-raised.
+    """
+    if not enabled():
+        yield _NOOP
+        return
+    current = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "error"
+        current.error = f"{type(e).__name__}: {e}"[:500]
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def start_span(name: str, **attributes) -> object:
+    """Start a child of the current span without making it current.
+
+    For work that cannot be wrapped in a ``with`` block, such as a generator
+    consumed by its caller; the caller must call ``end()`` on the result.
+    """
+    if not enabled():
+        return _NOOP
+    return Span(name, _current_span.get(), attributes)
+
+
+def traced(name: str) -> Callable:
+    """Decorator form of ``span`` for whole functions."""
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def use_trace(trace_id: Optional[str]) -> Iterator[None]:
+    """Attribute the enclosed spans to ``trace_id`` (e.g. a queued post's run)."""
+    if not trace_id:
+        yield
+        return
+    trace_token = _trace_override.set(trace_id)
+    span_token = _current_span.set(None)
+    try:
+        yield
+    finally:
+        _current_span.reset(span_token)
+        _trace_override.reset(trace_token)
+
+
+def bind_context(fn: Callable) -> Callable:
+    """Bind ``fn`` to the current context so pool threads inherit the parent span."""
+    ctx = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return ctx.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+
+_tasks_traced = False
+
+
+def trace_tasks() -> None:
+    """Make every CrewAI task execution a ``task`` span (idempotent).
+
+    ``Task.execute_sync`` is wrapped once on the class rather than on each
+    task instance: CrewAI tasks are pydantic models, and an extra instance
+    attribute would leak into ``model_dump``/``copy`` and outlive the run
+    on a reused crew.  LLM and tool spans issued while the task runs nest
+    under it.
+    """
+    global _tasks_traced
+    with _patch_lock:
+        if _tasks_traced:
+            return
+        from crewai import Task
+
+        original = Task.execute_sync
+
+        @functools.wraps(original)
+        def execute_sync(self, *args, **kwargs):
+            label = (getattr(self, "name", None) or getattr(self, "description", "") or "task")[:60]
+            agent = kwargs.get("agent") or getattr(self, "agent", None)
+            with span("task", task=label, agent=getattr(agent, "role", None)):
+                return original(self, *args, **kwargs)
+
+        Task.execute_sync = execute_sync
+        _tasks_traced = True
+
+
+def kickoff(crew, name: str, **kwargs):
+    """``crew.kickoff(**kwargs)`` inside a ``crew.kickoff`` span with per-task spans."""
+    if enabled():
+        trace_tasks()
+    with span("crew.kickoff", crew=name):
+        return crew.kickoff(**kwargs)
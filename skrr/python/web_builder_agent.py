@@ -5,27 +5,38 @@ web_builder_agent.py
 
 This script defines a multi‑agent CrewAI workflow to design and implement a
 basic Next.js web project based on a user provided specification. The
-workflow follows a planner–coder–reviewer–executor pattern. Each agent
-specialises in a different stage of the software creation process:
+workflow follows a planner–coder–check–reviewer pattern. Each stage
+specialises in a different part of the software creation process:
 
 * **Planner Agent** – Analyses the high‑level request and breaks it down into a
   project plan. The plan specifies which files should be created and what
   each file should contain (pages, components, API routes, state
   management, etc.).
 * **Coder Agent** – Uses the planner's plan to generate actual code for
-  each file. The coder outputs a mapping of file paths to code strings.
-* **Reviewer Agent** – Reviews the generated code for correctness,
-  readability and best practices. It can suggest improvements and returns
-  an updated code mapping.
-* **Executor Agent** – Packages the reviewed code into a JSON object
-  containing the project name and file contents. The Python script then
-  writes these files to disk in a new directory and reports the path.
+  each feature file. The coder outputs a mapping of file paths to code
+  strings, which is merged over a scaffold (`package.json`, `tsconfig.json`,
+  `next.config.mjs`, `app/layout.tsx`, global CSS) rendered locally from the
+  versioned templates in `scaffold_templates/` (see `scaffold.py`).
+* **Static checks** – `code_checks.py` parses every generated file locally,
+  verifies that imports resolve within the project and validates
+  `package.json`, without any LLM call.
+* **Reviewer Agent** – Reviews and fixes only the files flagged by the
+  checks and returns updated code for them; clean files pass through
+  untouched.
+
+The Python script then names the project after the request, writes the
+files to disk and reports the path.
+
+With `AGENT_PIPELINE_STREAM=1` the planner's output is streamed and the coder
+starts on each file as soon as its plan entry is complete instead of waiting
+for the whole plan (see `pipeline.py`).
 
 The script relies on environment variables for configuration. To use an OpenAI
 model, set `OPENAI_API_KEY` and optionally `OPENAI_MODEL`. To use Google
 Gemini via LiteLLM, set `GEMINI_API_KEY` and `GEMINI_MODEL`. To enable web
-search during planning and coding, you can set `SERPER_API_KEY`; if the
-`crewAI_tools.SerperDevTool` is available, it will be used automatically.
+search during planning and coding, you can set `SERPER_API_KEY`; the Serper
+search tool (see `search_tools.py`) is then used automatically. All outbound
+HTTP goes through the shared connection pool in `http_transport.py`.
 
 Usage:
     python web_builder_agent.py "Create a simple login page with a form and validation"
@@ -36,13 +47,22 @@ error occurs during agent execution, the script prints a JSON error and
 exits with a non‑zero status code.
 
 """
+import hashlib
 import json
 import os
 import re
 import sys
-import shutil
+import tempfile
 from typing import Dict, Any
 
+from artifact_store import ArtifactStore, zip_directory
+from client_cache import get_clients, settings_from_env
+from code_checks import check_files, normalize_path
+from scaffold import merge_over_scaffold, render_scaffold, scaffold_paths
+from memory_index import recall, remember
+from pipeline import stream_enabled, stream_web_files
+from tracing import kickoff, span, traced
+
 # Attempt to lazily load environment variables from a .env file if python‑dotenv
 # is available. This is optional and will silently fail if the package is
 # missing.
@@ -59,26 +79,49 @@ def _sanitize_project_name(name: str) -> str:
     return slug.strip("_") or "nextjs_project"
 
 
+def _project_slug(spec: str) -> str:
+    """Stable ASCII project name for ``spec``: a readable prefix plus a short hash.
+
+    The hash keeps requests apart whose ASCII prefix is the same, e.g. every
+    Korean request, whose characters the sanitizer drops entirely.
+    """
+    prefix = re.sub(r"[^a-z0-9]+", "_", spec.strip().lower())[:40].strip("_") or "nextjs_project"
+    digest = hashlib.sha256(spec.strip().encode("utf-8")).hexdigest()[:8]
+    return f"{prefix}_{digest}"
+
+
+@traced("files.write")
 def _write_files(files: Dict[str, str], project_dir: str) -> None:
     """Write each file in the mapping to the specified project directory."""
     for rel_path, content in files.items():
         # Normalise the relative path to avoid directory traversal
-        clean_rel_path = os.path.normpath(rel_path.lstrip("./"))
-        dest_path = os.path.join(project_dir, clean_rel_path)
+        clean_rel_path = normalize_path(rel_path)
+        dest_path = os.path.join(project_dir, *clean_rel_path.split("/"))
         os.makedirs(os.path.dirname(dest_path), exist_ok=True)
         with open(dest_path, "w", encoding="utf-8") as f:
             f.write(content)
 
 
+def _parse_json_output(output: str) -> Any:
+    """Parse an agent's JSON answer, tolerating prose or fences around it."""
+    try:
+        return json.loads(output)
+    except json.JSONDecodeError:
+        # Attempt to extract a JSON object from the output using a simple heuristic.
+        match = re.search(r"\{.*\}", output, re.DOTALL)
+        if match:
+            try:
+                return json.loads(match.group(0))
+            except Exception:
+                return None
+    return None
+
+
 def main(spec: str) -> None:
     """Entrypoint for generating a Next.js project based on a user specification."""
     try:
         # Defer imports of crewai and related tools until runtime to improve startup time.
-        from crewai import Agent, Task, Crew, Process, LLM  # type: ignore
-        try:
-            from crewai_tools import SerperDevTool  # type: ignore
-        except Exception:
-            SerperDevTool = None  # type: ignore
+        from crewai import Agent, Task, Crew, Process  # type: ignore
     except ImportError as e:
         sys.stderr.write(
             "Required libraries are missing. Please install crewai and crewai-tools via pip.\n"
@@ -86,37 +129,13 @@ def main(spec: str) -> None:
         sys.stderr.flush()
         raise e
 
-    # Load environment variables for LLM configuration
-    openai_key = os.environ.get("OPENAI_API_KEY")
-    openai_model = os.environ.get("OPENAI_MODEL", "gpt-4o")
-    gemini_key = os.environ.get("GEMINI_API_KEY")
-    gemini_model = os.environ.get("GEMINI_MODEL", "gemini/gemini-pro")
-    serper_key = os.environ.get("SERPER_API_KEY")
-
-    # Configure the LLM. Prefer Gemini if a key is provided; otherwise use OpenAI.
-    if gemini_key:
-        llm = LLM(
-            model=gemini_model,
-            api_key=gemini_key,
-            temperature=0.3,
-            base_url=os.environ.get("GEMINI_BASE_URL"),
-        )
-    else:
-        if not openai_key:
-            raise RuntimeError(
-                "No language model API key provided. Set OPENAI_API_KEY or GEMINI_API_KEY."
-            )
-        llm = LLM(
-            model=openai_model,
-            api_key=openai_key,
-            temperature=0.3,
-            base_url=os.environ.get("OPENAI_BASE_URL"),
-        )
-
-    # Configure the search tool if a Serper API key is available
-    search_tool = None
-    if serper_key and SerperDevTool:
-        search_tool = SerperDevTool()
+    # Configure the LLM and optional search tool from the environment (see
+    # client_cache).
+    clients = get_clients(os.environ.get("AGENT_USER_ID"), settings_from_env())
+    # Prefer Gemini if a key is provided; otherwise use OpenAI.
+    llm = clients.llm(temperature=0.3)
+    # The search tool is only available when a Serper API key is set.
+    search_tool = clients.search_tool()
 
     # --- Define Agents ---
     planner = Agent(
@@ -167,21 +186,6 @@ def main(spec: str) -> None:
         llm=llm,
     )
 
-    executor = Agent(
-        role="Project Packager",
-        goal=(
-            "Package the final reviewed code into a structured JSON object for external "
-            "writing. Do not modify the code; simply prepare the data with a project "
-            "name and file mapping."
-        ),
-        backstory=(
-            "You act as an interface between the AI agents and the file system. You "
-            "assemble the final outputs into a consistent format without making any "
-            "additional modifications."
-        ),
-        llm=llm,
-    )
-
     # --- Define Usage Guide Agent ---
     runner = Agent(
         role="Usage Guide Agent",
@@ -200,17 +204,37 @@ def main(spec: str) -> None:
         llm=llm,
     )
 
+    # Past runs of this user that relate to the request, within a token budget.
+    memory_context = recall("web", spec)
+    memory_section = f"\n\n{memory_context}" if memory_context else ""
+
     # --- Define Tasks ---
+    # Boilerplate comes from a versioned local template; the LLM only writes
+    # the files that are specific to this request.
+    scaffold_files = ", ".join(scaffold_paths())
+    scaffold_note = (
+        f"The project scaffold is generated automatically and already contains: {scaffold_files} "
+        "(Next.js 14 App Router, TypeScript, React 18, path alias @/* for the project root; "
+        "app/layout.tsx imports ./globals.css and renders the page). "
+    )
+
     plan_task = Task(
         description=(
             f"The user has requested the following Next.js feature: '{spec}'. "
-            "Analyse this request and break it down into a plan. List each file that needs to be "
+            "Analyse this request and break it down into a plan. "
+            f"{scaffold_note}"
+            "Do NOT list scaffold files; list only the feature-specific files that need to be "
             "created in a JSON object under the key 'files'. For each file, provide a short "
-            "description of its purpose. Use Next.js conventions (e.g., pages/ for page routes, "
-            "components/ for reusable components, api/ for API routes). Your output must be valid JSON."
+            "description of its purpose. Use App Router conventions (e.g., app/page.tsx and "
+            "app/<route>/page.tsx for pages, components/ for reusable components, "
+            "app/api/<route>/route.ts for API routes). If the feature needs npm packages beyond "
+            "next, react and react-dom, list them under the key 'dependencies' as an object mapping "
+            "package names to version ranges. Your output must be valid JSON."
+            f"{memory_section}"
         ),
         expected_output=(
-            "A JSON plan with a 'files' object where keys are file paths and values are descriptions."
+            "A JSON plan with a 'files' object where keys are file paths and values are descriptions, "
+            "and an optional 'dependencies' object."
         ),
         agent=planner,
     )
@@ -218,46 +242,21 @@ def main(spec: str) -> None:
     code_task = Task(
         description=(
             "Using the planner's JSON plan as input, generate the actual code for each listed file. "
+            f"{scaffold_note}"
+            "Do not generate the scaffold files; only write the feature files from the plan. "
             "Return a JSON object mapping each file path to the contents of the file as a string. "
-            "Include imports, exports and any necessary configuration. Do not include any prose or explanation; "
+            "Include imports and exports. Do not include any prose or explanation; "
             "only return a valid JSON object with file paths as keys and code strings as values."
         ),
         expected_output=(
-            "A JSON dictionary mapping file paths to code strings."
+            "A JSON dictionary mapping feature file paths to code strings."
         ),
         agent=coder,
     )
 
-    review_task = Task(
-        description=(
-            "Review the code dictionary produced by the coder. Improve the code if necessary for "
-            "readability, correctness or best practices. If you make changes, include brief inline comments "
-            "(e.g., // explanation) explaining your reasoning. Return a JSON dictionary with the same structure "
-            "as input: file paths mapped to updated code strings. Do not wrap your response in any additional "
-            "text; output only JSON."
-        ),
-        expected_output=(
-            "An improved JSON dictionary mapping file paths to updated code strings."
-        ),
-        agent=reviewer,
-    )
-
-    exec_task = Task(
-        description=(
-            "Prepare the final code dictionary for external writing. You will receive the reviewer's JSON output. "
-            "Construct a new JSON object with two keys: 'project_name' and 'files'. Set 'project_name' to a slugified "
-            "version of the user's request (lowercase with underscores). Set 'files' to the code dictionary without any changes. "
-            "Return only this JSON object without any additional text."
-        ),
-        expected_output=(
-            "A JSON object with 'project_name' (string) and 'files' (object mapping file paths to code strings)."
-        ),
-        agent=executor,
-    )
-
     run_task = Task(
         description=(
-            "After packaging the project, explain step-by-step how to run the generated "
+            "Explain step-by-step how to run the generated "
             "Next.js project and which environment variables (e.g., OPENAI_API_KEY, GEMINI_API_KEY, "
             "OPENAI_MODEL, GEMINI_MODEL, SERPER_API_KEY) must be set. Include example shell commands."
         ),
@@ -265,110 +264,167 @@ def main(spec: str) -> None:
         agent=runner,
     )
 
-    # Assemble and run the crew sequentially
-    crew = Crew(
-        agents=[planner, coder, reviewer, executor],
-        tasks=[plan_task, code_task, review_task, exec_task],
-        process=Process.sequential,
-        verbose=False,
-    )
-
-    try:
-        result = crew.kickoff(inputs={"spec": spec})
-    except Exception as e:
-        # Emit a JSON error for easier handling by wrappers
-        error_response = {"error": f"Agent execution failed: {str(e)}"}
-        print(json.dumps(error_response))
-        sys.exit(1)
-
-    # The crew output may be a CrewOutput or string; convert to string
-    if isinstance(result, str):
-        final_output = result
+    # Stage 1: plan and write the code.  In streaming mode the coder starts
+    # on each file as soon as its plan entry is complete (see pipeline.py).
+    plan_dependencies = None
+    if stream_enabled():
+        try:
+            files, plan_dependencies = stream_web_files(spec, llm, scaffold_note, memory_section)
+        except Exception as e:
+            print(json.dumps({"error": f"Agent execution failed: {str(e)}"}))
+            sys.exit(1)
+        final_output = json.dumps(files)
     else:
-        final_output = str(result)
-
-    # Attempt to parse the final JSON from the executor
-    try:
-        data = json.loads(final_output)
-    except json.JSONDecodeError:
-        # Attempt to extract a JSON object from the output using a simple heuristic.
-        import re
+        crew = Crew(
+            agents=[planner, coder],
+            tasks=[plan_task, code_task],
+            process=Process.sequential,
+            verbose=False,
+        )
 
-        match = re.search(r"\{.*\}", final_output, re.DOTALL)
-        if match:
-            json_str = match.group(0)
-            try:
-                data = json.loads(json_str)
-            except Exception:
-                response = {
-                    "error": "Failed to parse executor output as JSON",
-                    "output": final_output,
-                }
-                print(json.dumps(response))
-                sys.exit(1)
-        else:
-            response = {
-                "error": "Failed to parse executor output as JSON",
-                "output": final_output,
-            }
-            print(json.dumps(response))
+        try:
+            result = kickoff(crew, "web.build", inputs={"spec": spec})
+        except Exception as e:
+            # Emit a JSON error for easier handling by wrappers
+            error_response = {"error": f"Agent execution failed: {str(e)}"}
+            print(json.dumps(error_response))
             sys.exit(1)
 
-    # Ensure required keys exist
-    project_name = data.get("project_name")
-    files = data.get("files")
-    if not project_name or not isinstance(files, dict):
-        response = {"error": "Executor output missing required fields", "data": data}
+        # The crew output may be a CrewOutput or string; convert to string
+        final_output = result if isinstance(result, str) else str(result)
+        files = _parse_json_output(final_output)
+        # Some models wrap the mapping as {"files": {...}} like the plan.
+        if isinstance(files, dict) and isinstance(files.get("files"), dict):
+            files = files["files"]
+        plan = _parse_json_output(plan_task.output.raw) if plan_task.output else None
+        plan_dependencies = plan.get("dependencies") if isinstance(plan, dict) else None
+    if not isinstance(files, dict) or not files:
+        response = {
+            "error": "Failed to parse coder output as JSON",
+            "output": final_output,
+        }
         print(json.dumps(response))
         sys.exit(1)
 
-    # Create project directory
-    project_dir = os.path.abspath(_sanitize_project_name(project_name))
-    os.makedirs(project_dir, exist_ok=True)
-    # Write files to disk
-    _write_files(files, project_dir)
-
-    # Generate usage guide via a separate Crew for run_task
-    guide_crew = Crew(
-        agents=[runner],
-        tasks=[run_task],
-        process=Process.sequential,
-        verbose=False,
+    # Packaging is deterministic, so it happens here rather than in an LLM
+    # stage: the project is named after the request (see _project_slug).  The feature files are
+    # merged over the locally rendered scaffold, adding any npm packages the
+    # plan asked for to its package.json.
+    project_name = _project_slug(spec)
+    scaffold = render_scaffold(
+        project_name,
+        spec,
+        plan_dependencies if isinstance(plan_dependencies, dict) else None,
     )
-    try:
-        guide_result = guide_crew.kickoff(inputs={
-            "project_name": project_name,
-            "project_dir": project_dir,
-            "spec": spec
-        })
-        usage_text = guide_result if isinstance(guide_result, str) else str(guide_result)
-    except Exception:
-        usage_text = ""
-
-    # Write the generated README.md
-    readme_path = os.path.join(project_dir, "README.md")
-    with open(readme_path, "w", encoding="utf-8") as f:
-        f.write(usage_text.strip())
-
-    # Create a zip archive of the project directory in Next.js public/zip_folder
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    nextjs_root = os.path.abspath(os.path.join(script_dir, os.pardir))
-    public_zip_dir = os.path.join(nextjs_root, 'public', 'zip_folder')
-    os.makedirs(public_zip_dir, exist_ok=True)
-    zip_base = os.path.join(public_zip_dir, _sanitize_project_name(project_name))
-    shutil.make_archive(zip_base, "zip", project_dir)
-
-    # Build the client-accessible URL path
-    zip_path = f"/zip_folder/{_sanitize_project_name(project_name)}.zip"
+    files = merge_over_scaffold(scaffold, files)
+
+    # Stage 2: local static checks.  Only files that fail them are sent to
+    # the reviewer, so clean files are neither re-read nor re-emitted.
+    with span("code_checks", files=len(files)) as s:
+        problems = check_files(files)
+        s.set("flagged", len(problems))
+
+    # Stage 3: targeted review of the flagged files.
+    if problems:
+        flagged = {path: files[path] for path in problems}
+        review_task = Task(
+            description=(
+                "The following files of a generated Next.js project failed automatic checks. "
+                "Fix the reported problems (you may also improve correctness or readability "
+                "while you are at it), adding brief inline comments (e.g., // explanation) for "
+                "non-obvious changes. If an import points to a file that does not exist, either fix "
+                "the import or include the missing file. Return a JSON dictionary mapping each file "
+                "path you changed or added to its complete updated code string. Do not wrap your "
+                "response in any additional text; output only JSON.\n\n"
+                f"All project files: {json.dumps(sorted(files))}\n\n"
+                f"Problems: {json.dumps(problems, indent=1)}\n\n"
+                f"Flagged files: {json.dumps(flagged)}"
+            ),
+            expected_output=(
+                "A JSON dictionary mapping file paths to corrected code strings."
+            ),
+            agent=reviewer,
+        )
+        review_crew = Crew(
+            agents=[reviewer],
+            tasks=[review_task],
+            process=Process.sequential,
+            verbose=False,
+        )
+        try:
+            # No inputs: interpolation would trip over braces in the code.
+            review_result = kickoff(review_crew, "web.review")
+            reviewed = _parse_json_output(str(review_result))
+            if isinstance(reviewed, dict):
+                for path, code in reviewed.items():
+                    if isinstance(code, str):
+                        files[path] = code
+            else:
+                sys.stderr.write("Reviewer output was not JSON; keeping the coder's files\n")
+        except Exception as e:
+            # A failed review should not throw away working code.
+            sys.stderr.write(f"Review failed, keeping the coder's files: {e}\n")
+
+    # Write the project into a scratch directory; only the zip is kept, in
+    # the content-addressed artifact store.
+    slug = _sanitize_project_name(project_name)
+    with tempfile.TemporaryDirectory(prefix="web_builder_") as scratch_dir:
+        project_dir = os.path.join(scratch_dir, slug)
+        os.makedirs(project_dir, exist_ok=True)
+        # Write files to disk
+        _write_files(files, project_dir)
+
+        # Remember what was built (file list rather than full sources) so later
+        # requests from the same user can refer back to it.
+        remember("web", spec, f"project {project_name}\n" + "\n".join(sorted(files)))
+
+        # Generate usage guide via a separate Crew for run_task
+        guide_crew = Crew(
+            agents=[runner],
+            tasks=[run_task],
+            process=Process.sequential,
+            verbose=False,
+        )
+        try:
+            guide_result = kickoff(guide_crew, "web.guide", inputs={
+                "project_name": project_name,
+                "project_dir": project_dir,
+                "spec": spec
+            })
+            usage_text = guide_result if isinstance(guide_result, str) else str(guide_result)
+        except Exception:
+            usage_text = ""
+
+        # Write the generated README.md
+        readme_path = os.path.join(project_dir, "README.md")
+        with open(readme_path, "w", encoding="utf-8") as f:
+            f.write(usage_text.strip())
+
+        # Store the zip by content hash; an identical project reuses the
+        # existing blob.  The store lives under public/, so its URL is
+        # directly downloadable.
+        with span("files.zip") as s:
+            archive = zip_directory(project_dir)
+            s.set("bytes", len(archive))
+
+    zip_name = f"{slug}.zip"
+    with span("artifact.put", kind="web_zip") as s, ArtifactStore() as store:
+        artifact = store.put_bytes(archive, os.environ.get("AGENT_USER_ID"), "web_zip", zip_name)
+        s.set("deduplicated", artifact["deduplicated"])
 
     # Report the zip file path as JSON
-    response = {"zip_path": zip_path}
+    response = {
+        "project_name": project_name,
+        "zip_path": artifact["url"],
+        "zip_name": zip_name,
+        "sha256": artifact["sha256"],
+    }
     print(json.dumps(response))
 
-
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         sys.stderr.write("Usage: python web_builder_agent.py <description of the web feature>\n")
         sys.exit(1)
     specification = sys.argv[1]
-    main(specification)
\ No newline at end of file
+    with span("web_builder_agent", spec=specification):
+        main(specification)
\ No newline at end of file